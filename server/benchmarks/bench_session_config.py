@@ -0,0 +1,79 @@
+"""get_session_config: cached config (per-call path) and rebuild after a tactics change."""
+
+import asyncio
+
+import pytest
+from conftest import BENCH_PREFIX, populate, sizes
+
+import redis_store
+import session_config
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def identity(monkeypatch):
+    for var, value in (
+        ("CUSTOMER_NAME", "Bench"),
+        ("CUSTOMER_EMAIL", "bench@example.com"),
+        ("CUSTOMER_PHONE", "555-0100"),
+        ("CUSTOMER_ORDER_NUMBER", "B-1"),
+    ):
+        monkeypatch.setenv(var, value)
+
+
+def _get_session_config():
+    """bot.get_session_config when its dependencies import (pipecat, weave), else the same call."""
+    try:
+        from bot import get_session_config
+
+        return get_session_config
+    except ImportError:
+
+        async def get_session_config(session_id=None):
+            compiled = await session_config.config_cache.get(session_config.current_mode())
+            return {**compiled, "session_id": session_id}
+
+        return get_session_config
+
+
+@pytest.fixture
+def tactic_store(r, redis_clients, identity):
+    # The store's key names, bench:-prefixed by conftest (config_cache reads them by name)
+    def fill(n: int):
+        populate(r, redis_store.REDIS_WINNING_KEY, n)
+        populate(r, redis_store.REDIS_TACTICS_KEY, 10, seed=1)
+        session_config.config_cache = session_config.SessionConfigCache()
+
+    yield fill
+    for key in r.scan_iter(f"{BENCH_PREFIX}*"):
+        r.delete(key)
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_get_session_config_cached(benchmark, loop, tactic_store, n):
+    tactic_store(n)
+    get_session_config = _get_session_config()
+    loop.run_until_complete(get_session_config("warm"))
+    config = benchmark(lambda: loop.run_until_complete(get_session_config("bench")))
+    assert config["tactics_available"] == n + 10
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_get_session_config_rebuild(benchmark, loop, tactic_store, r, n):
+    """A tactics change (version bump) before every call forces a full rebuild."""
+    tactic_store(n)
+    get_session_config = _get_session_config()
+
+    def call():
+        redis_store.bump_tactics_version(r)
+        return loop.run_until_complete(get_session_config("bench"))
+
+    rounds = 5 if n >= 10_000 else 20
+    config = benchmark.pedantic(call, rounds=rounds, iterations=1, warmup_rounds=1)
+    assert config["tactics_count"] > 0
@@ -0,0 +1,120 @@
+"""embed, is_near_duplicate, add_tactic_with_dedupe and dedupe_list_by_similarity (full and incremental)."""
+
+import itertools
+
+import pytest
+from conftest import BENCH_PREFIX, populate, sizes
+
+import tactic_vectors
+from tactic_index import drop_index
+
+LIST_KEY = BENCH_PREFIX + "winning_tactics"
+SENTENCE = "Mention you have been a loyal customer for ten years and ask for a supervisor."
+
+
+def test_embed(benchmark, encoder):
+    benchmark.extra_info["encoder"] = type(encoder).__name__
+    vec = benchmark(tactic_vectors.embed, SENTENCE)
+    assert len(vec) == 384
+
+
+def test_embed_many_64(benchmark, encoder):
+    benchmark.extra_info["encoder"] = type(encoder).__name__
+    texts = [f"{SENTENCE} ({i})" for i in range(64)]
+    vecs = benchmark(tactic_vectors.embed_many, texts)
+    assert len(vecs) == 64
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_is_near_duplicate(benchmark, encoder, r, n):
+    tactics = populate(r, LIST_KEY, n)
+    vectors = tactic_vectors._get_cached_vectors(r, LIST_KEY, tactics)
+    new_vec = tactic_vectors.embed(SENTENCE)
+    dup, _ = benchmark(
+        tactic_vectors.is_near_duplicate, SENTENCE, tactics, vectors, encoder, new_vec=new_vec
+    )
+    assert not dup
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_index_max_similarity(benchmark, encoder, r, n):
+    """The query add_tactics_with_dedupe actually runs (in-memory index, already loaded)."""
+    populate(r, LIST_KEY, n)
+    index = tactic_vectors.load_index(r, LIST_KEY)
+    new_vec = tactic_vectors.embed(SENTENCE)
+    best, _ = benchmark(index.max_similarity, new_vec)
+    assert best < tactic_vectors.DEFAULT_SIMILARITY_THRESHOLD
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_add_tactic_with_dedupe(benchmark, encoder, r, n):
+    """One new (unique) tactic per round into a list of n, index warm as in a long-lived process."""
+    populate(r, LIST_KEY, n)
+    tactic_vectors.load_index(r, LIST_KEY)
+    counter = itertools.count()
+
+    def add():
+        return tactic_vectors.add_tactic_with_dedupe(r, LIST_KEY, f"{SENTENCE} #{next(counter)}")
+
+    result = benchmark.pedantic(add, rounds=50, iterations=1, warmup_rounds=1)
+    assert result in ("added", "duplicate")
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_add_tactic_with_dedupe_cold(benchmark, encoder, r, n):
+    """First merge in a fresh process: the index is loaded from Redis."""
+    populate(r, LIST_KEY, n)
+    counter = itertools.count()
+
+    def add():
+        drop_index(LIST_KEY)
+        return tactic_vectors.add_tactic_with_dedupe(r, LIST_KEY, f"{SENTENCE} #{next(counter)}")
+
+    benchmark.pedantic(add, rounds=5 if n >= 10_000 else 20, iterations=1)
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_dedupe_list_by_similarity(benchmark, encoder, r, n):
+    """Full-list dedupe with 1 in 5 tactics a near-duplicate (list rebuilt before each round)."""
+
+    def setup():
+        populate(r, LIST_KEY, n, dup_every=5)
+
+    removed = benchmark.pedantic(
+        tactic_vectors.dedupe_list_by_similarity,
+        args=(r, LIST_KEY),
+        setup=setup,
+        rounds=3 if n >= 10_000 else 10,
+        iterations=1,
+    )
+    assert removed > 0
+
+
+@pytest.mark.parametrize("n", sizes())
+def test_dedupe_list_incremental(benchmark, encoder, r, n):
+    """Incremental dedupe after 20 appends (1 in 5 a copy of an existing tactic's vector) to an
+    already-deduped list, with the in-process index already synced (as in a running worker)."""
+
+    def setup():
+        tactics = populate(r, LIST_KEY, n)
+        tactic_vectors.dedupe_list_by_similarity(r, LIST_KEY)
+        vecs_key = LIST_KEY + tactic_vectors.VECS_SUFFIX
+        for i in range(20):
+            t = f"{SENTENCE} #{i}"
+            if i % 5 == 0:
+                vec = tactic_vectors.decode_vector(r.hget(vecs_key, tactics[i % n]))
+            else:
+                vec = tactic_vectors.embed(t)
+            r.rpush(LIST_KEY, t)
+            r.hset(vecs_key, t, tactic_vectors.encode_vector(vec))
+        tactic_vectors.load_index(r, LIST_KEY)
+
+    removed = benchmark.pedantic(
+        tactic_vectors.dedupe_list_by_similarity,
+        args=(r, LIST_KEY),
+        kwargs={"incremental": True},
+        setup=setup,
+        rounds=3 if n >= 10_000 else 10,
+        iterations=1,
+    )
+    assert removed >= 4
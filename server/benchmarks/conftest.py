@@ -0,0 +1,188 @@
+"""Fixtures for the tactic store micro-benchmarks.
+
+Redis: HAGGLER_BENCH_REDIS_URL (a local, throwaway instance; refused if it equals
+REDIS_URL), otherwise in-process fakeredis. REDIS_URL is never used. Every key a benchmark
+writes starts with bench: -- the store's key constants (agent:tactics, the stats hashes,
+the version key, ...) are rebound to bench:-prefixed names for the session -- and every
+bench:* key is deleted afterwards.
+
+Encoder: the real all-MiniLM-L6-v2 when sentence-transformers is installed, unless
+HAGGLER_BENCH_FAKE_ENCODER=1; the fake one hashes each text to a random unit vector, so
+store/index costs can be measured without model time.
+
+Tactic counts run up to HAGGLER_BENCH_MAX_TACTICS (default 10000; set 100000 for the full
+range, which takes minutes to populate).
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import os
+import sys
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+import redis_store  # noqa: E402
+import tactic_vectors  # noqa: E402
+from tactic_index import EMBED_DIM, drop_index  # noqa: E402
+
+ALL_SIZES = [10, 1_000, 10_000, 100_000]
+BENCH_PREFIX = "bench:"
+# Module-level Redis key names rebound to BENCH_PREFIX + name while benchmarks run
+KEY_CONSTANTS = (
+    "REDIS_TACTICS_KEY",
+    "REDIS_WINNING_KEY",
+    "REDIS_FAILED_KEY",
+    "TACTICS_VERSION_KEY",
+    "TACTICS_CHANNEL",
+    "STATS_USES_KEY",
+    "STATS_WINS_KEY",
+    "STATS_LOSSES_KEY",
+    "STATS_LAST_WIN_KEY",
+    "STATS_LAST_USED_KEY",
+    "STATS_FIRST_SEEN_KEY",
+    "STATS_RANK_KEY",
+    "STATS_KEYS",
+    "RETRIEVAL_KEYS",
+)
+
+
+def sizes() -> list[int]:
+    cap = int(os.getenv("HAGGLER_BENCH_MAX_TACTICS", "10000"))
+    return [n for n in ALL_SIZES if n <= cap]
+
+
+class FakeEncoder:
+    """SentenceTransformer.encode stand-in: deterministic random unit vector per text."""
+
+    def encode(self, sentences, normalize_embeddings=True, batch_size=32):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else sentences
+        out = np.stack([random_unit_vector(int(hashlib.sha256(t.encode()).hexdigest()[:8], 16)) for t in texts])
+        return out[0] if single else out
+
+
+def random_unit_vector(seed: int) -> np.ndarray:
+    v = np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+def _use_real_encoder() -> bool:
+    return os.getenv("HAGGLER_BENCH_FAKE_ENCODER", "0") != "1" and importlib.util.find_spec(
+        "sentence_transformers"
+    ) is not None
+
+
+@pytest.fixture(scope="session")
+def encoder():
+    if not _use_real_encoder():
+        tactic_vectors._encoder = FakeEncoder()
+    return tactic_vectors.get_encoder()
+
+
+def _bench_url() -> str | None:
+    url = redis_store.normalize_redis_url(os.getenv("HAGGLER_BENCH_REDIS_URL"))
+    if url and url == redis_store.redis_url():
+        pytest.exit("HAGGLER_BENCH_REDIS_URL must not be the REDIS_URL store", returncode=2)
+    return url
+
+
+def _prefixed(value):
+    if isinstance(value, tuple):
+        return tuple(_prefixed(v) for v in value)
+    return BENCH_PREFIX + value
+
+
+def _server_modules() -> list:
+    return [
+        m for m in list(sys.modules.values())
+        if str(getattr(m, "__file__", "") or "").startswith(str(SERVER_DIR))
+    ]
+
+
+@pytest.fixture(scope="session")
+def redis_clients():
+    """(sync, async factory) for the benchmark Redis; module bindings point at it for the session."""
+    url = _bench_url()
+    if url:
+        import redis
+        import redis.asyncio as aioredis
+
+        sync = redis.Redis.from_url(url)
+        make_async = lambda: aioredis.Redis.from_url(url)  # noqa: E731
+    else:
+        fakeredis = pytest.importorskip("fakeredis", reason="set HAGGLER_BENCH_REDIS_URL or install fakeredis[lua]")
+        import fakeredis.aioredis
+
+        server = fakeredis.FakeServer()
+        sync = fakeredis.FakeRedis(server=server)
+        make_async = lambda: fakeredis.aioredis.FakeRedis(server=server)  # noqa: E731
+    # Keyed on the loop itself: a closed loop's id can be reused by the next one
+    async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def get_async_redis():
+        loop = asyncio.get_running_loop()
+        if loop not in async_clients:
+            async_clients[loop] = make_async()
+        return async_clients[loop]
+
+    # session_config / tactic_stats / redis_store resolved these names at import
+    originals = {"get_async_redis": redis_store.get_async_redis, "get_redis": redis_store.get_redis}
+    replacements = {"get_async_redis": get_async_redis, "get_redis": lambda: sync}
+    patched = []
+    for module in list(sys.modules.values()):
+        for name, original in originals.items():
+            if getattr(module, name, None) is original:
+                patched.append((module, name, original))
+                setattr(module, name, replacements[name])
+    # Key names, so nothing outside bench:* is written (modules imported later, e.g. bot,
+    # bind the already-prefixed names from these modules)
+    for module in _server_modules():
+        for name in KEY_CONSTANTS:
+            if name in vars(module):
+                patched.append((module, name, getattr(module, name)))
+                setattr(module, name, _prefixed(getattr(module, name)))
+    yield sync, get_async_redis
+    for module, name, original in patched:
+        setattr(module, name, original)
+    for key in sync.scan_iter(f"{BENCH_PREFIX}*"):
+        sync.delete(key)
+
+
+@pytest.fixture
+def r(redis_clients):
+    return redis_clients[0]
+
+
+def populate(r, list_key: str, n: int, seed: int = 0, dup_every: int = 0) -> list[str]:
+    """Fresh list_key with n tactics and cached random unit vectors (no encoding).
+
+    With dup_every=k, every k-th tactic is a near-copy (cosine ~0.99) of the one before it.
+    """
+    r.delete(list_key, list_key + tactic_vectors.VECS_SUFFIX, tactic_vectors.dedupe_watermark_key(list_key))
+    drop_index(list_key)
+    tactics = [f"bench tactic {seed}-{i}" for i in range(n)]
+    rng = np.random.default_rng(seed)
+    chunk = 5_000
+    for start in range(0, n, chunk):
+        part = tactics[start : start + chunk]
+        vecs = rng.standard_normal((len(part), EMBED_DIM)).astype(np.float32)
+        if dup_every:
+            for j in range(1, len(part)):
+                if (start + j) % dup_every == 0:
+                    vecs[j] = vecs[j - 1] + 0.01 * vecs[j]
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+        pipe = r.pipeline(transaction=False)
+        pipe.rpush(list_key, *part)
+        pipe.hset(
+            list_key + tactic_vectors.VECS_SUFFIX,
+            mapping={t: tactic_vectors.encode_vector(v) for t, v in zip(part, vecs)},
+        )
+        pipe.execute()
+    return tactics
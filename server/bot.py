@@ -19,7 +19,6 @@ Run the bot using::
 
 
 from pipecat.pipeline.runner import PipelineRunner
-from pipecat.audio.vad.vad_analyzer import VADParams
 from pipecat.processors.aggregators.llm_response_universal import LLMContextAggregatorPair, LLMUserAggregatorParams
 from pipecat.processors.aggregators.llm_context import LLMContext
 from pipecat.transports.smallwebrtc.connection import SmallWebRTCConnection
@@ -30,187 +29,70 @@ from pipecat.transports.smallwebrtc.transport import SmallWebRTCTransport
 from dotenv import load_dotenv
 from pipecat.runner.types import SmallWebRTCRunnerArguments
 from pipecat.transports.base_transport import TransportParams
-from pipecat.audio.vad.silero import SileroVADAnalyzer
 from pipecat.pipeline.task import PipelineParams, PipelineTask
 from loguru import logger
 from pipecat.services.google.gemini_live.llm import GeminiLiveLLMService
 from pipecat.runner.types import RunnerArguments
-import asyncio
+from pipecat.processors.frame_processor import FrameProcessor
 import weave
-import redis
 import uuid
+import asyncio
 import time
-
-from outcome import (
-    OUTCOME_DATASET_NAME,
-    evaluate_outcome_wandb,
-    run_single_row_eval_sync,
-    suggest_tactic_wandb,
-)
-from tactic_vectors import add_tactic_with_dedupe
+from typing import Callable
+
+import metrics
+from outcome import init_weave
+from post_call import PostCallJob, post_call_queue
+from redis_store import close_async_redis, track_worker_session
+from session_config import config_cache, current_mode
+from session_metrics import SessionMetricsObserver
+from session_resources import prewarm_size, session_pool, warm_vad
+from transcript import TranscriptRecorder, format_messages, prune_segments
+from tactic_vectors import warm_encoder
 
 load_dotenv(override=True)
 
-if os.getenv("WANDB_API_KEY"):
-    # Use entity/project (e.g. factorio/haggler) so traces appear in the right W&B project
-    project = os.getenv("WEAVE_PROJECT", "haggler")
-    entity = os.getenv("WANDB_ENTITY")
-    if entity and "/" not in project:
-        project = f"{entity}/{project}"
-    try:
-        weave.init(project)
-    except Exception as e:
-        logger.warning(f"Weave init failed ({e}); running without tracing")
-
-REDIS_TACTICS_KEY = "agent:tactics"
-REDIS_WINNING_KEY = "agent:winning_tactics"
-REDIS_FAILED_KEY = "agent:failed_tactics"
-REDIS_SESSION_TACTICS_PREFIX = "session:"
-REDIS_SESSION_TACTICS_SUFFIX = ":tactics"
-
-# Weave Dataset for outcome evals (see outcome.OUTCOME_DATASET_NAME); bot adds examples live (success only)
-HAGGLER_OUTCOME_DATASET = OUTCOME_DATASET_NAME
-
-BASE_REFUND = (
-    "You are a customer on a voice call with customer support. You are seeking a refund for a flight cancellation. "
-    "Use the tactics provided. Stay in character as the customer. You are calling them; they answer. "
-    "When the support agent grants the refund, no need to ask for more details; if they refuse the refund, end the call, do not persist."
-)
-BASE_NEGOTIATION = (
-    "You are a customer on a voice call negotiating (e.g. a discount, booking, or deal). "
-    "Use the tactics provided. Stay in character as the customer. You are calling them; they answer."
-)
-
-
-def _caller_identity_block() -> str:
-    """Caller (customer) name, email, phone, order number for the bot to use when asked."""
-    name = os.getenv("CUSTOMER_NAME")
-    email = os.getenv("CUSTOMER_EMAIL")
-    phone = os.getenv("CUSTOMER_PHONE")
-    order = os.getenv("CUSTOMER_ORDER_NUMBER")
-    if not name or not email or not phone or not order:
-        raise ValueError(
-            "CUSTOMER_NAME, CUSTOMER_EMAIL, CUSTOMER_PHONE, CUSTOMER_ORDER_NUMBER must be set in .env."
-        )
-    return (
-        f"You are {name}. Your email is {email}, phone {phone}, order number {order}. "
-        "Provide these when the agent asks (e.g. for refund processing)."
-    )
+init_weave()
 
 
 @weave.op()
-def get_session_config(session_id: str | None = None) -> dict:
-    """Fetch base system instruction and Redis tactics for Weave trace + agent use."""
-    mode = os.getenv("HAGGLER_MODE", "refund").lower()
-    base = BASE_REFUND if mode == "refund" else BASE_NEGOTIATION
-    base = f"{base}\n\n{_caller_identity_block()}"
-    tactics: list[str] = []
-    url = os.getenv("REDIS_URL")
-    if url:
-        url = url.strip()
-        if not url.startswith(("redis://", "rediss://", "unix://")):
-            url = "redis://" + url
-        r = redis.from_url(url)
-        winning_raw = r.lrange(REDIS_WINNING_KEY, 0, -1)
-        winning = [b.decode() if isinstance(b, bytes) else b for b in (winning_raw or [])]
-        raw = r.lrange(REDIS_TACTICS_KEY, 0, -1)
-        base_tactics = [b.decode() if isinstance(b, bytes) else b for b in (raw or [])]
-        seen = set(winning)
-        tactics = list(winning)
-        for t in base_tactics:
-            if t not in seen:
-                tactics.append(t)
-                seen.add(t)
-        r.close()
-    if tactics:
-        base = f"{base}\n\nWinning tactics to use when appropriate:\n" + "\n".join(f"- {t}" for t in tactics)
-    return {
-        "system_instruction": base,
-        "tactics_count": len(tactics),
-        "tactics": tactics,
-        "session_id": session_id,
-        "mode": mode,
-    }
+async def get_session_config(
+    session_id: str | None = None, session_context: dict | None = None
+) -> dict:
+    """Fetch base system instruction and Redis tactics for Weave trace + agent use.
 
+    The tactic candidates come from session_config.config_cache and are only rebuilt when
+    the tactic lists change; the tactics in the prompt are drawn per session.
+    session_context is the session request body; its "scenario" / "first_utterance" steer
+    top-k tactic retrieval (HAGGLER_TACTIC_RETRIEVAL=topk).
+    """
+    compiled = await config_cache.get(current_mode(), session_context)
+    return {**compiled, "session_id": session_id}
+
+
+def prewarm_sessions() -> None:
+    """Build the first sessions' components at process start, so the first call skips it too."""
+    if prewarm_size() <= 0:
+        return
+
+    async def upcoming() -> list[dict]:
+        try:
+            return await config_cache.upcoming(current_mode(), prewarm_size())
+        finally:
+            await close_async_redis()
+
+    try:
+        session_pool.prefill(asyncio.run(upcoming()), create_llm)
+    except Exception as e:
+        logger.warning(f"Pre-warming session resources at startup failed ({e})")
 
-@weave.op()
-def log_session_end(
-    session_id: str,
-    config: dict,
-    duration_seconds: float,
-    outcome: str,
-    transcript_length: int = 0,
-    transcript_preview: str = "",
-) -> dict:
-    """Log session end and outcome score to Weave so evals/traces show success/failure."""
-    score = 1.0 if outcome == "success" else 0.0
-    # Return only fields not already in inputs (avoids duplicate columns in trace tables)
-    return {
-        "score": score,
-        "tactics_count": config.get("tactics_count", 0),
-        "mode": config.get("mode", "refund"),
-    }
-
-
-def add_example_to_outcome_dataset(transcript: str, mode: str, expected_outcome: str) -> None:
-    """Append one example to the Weave outcome dataset (native evals). Run run_outcome_eval once to bootstrap the dataset."""
-    ref = weave.ref(HAGGLER_OUTCOME_DATASET)
-    ds = ref.get()
-    ds.add_rows([{"transcript": transcript, "mode": mode, "expected_outcome": expected_outcome}])
-
-
-def _format_transcript(messages: list) -> str:
-    lines = []
-    for m in messages:
-        role = m.get("role", "unknown")
-        if role == "system":
-            continue
-        content = m.get("content")
-        if content is None:
-            continue
-        if isinstance(content, list):
-            parts = []
-            for p in content:
-                if isinstance(p, dict) and "text" in p:
-                    parts.append(str(p["text"]).strip())
-                elif isinstance(p, dict) and "type" in p and p.get("type") == "text":
-                    parts.append(str(p.get("text", "")).strip())
-                elif isinstance(p, str):
-                    parts.append(p.strip())
-            content = " ".join(p for p in parts if p) or None
-        elif isinstance(content, str):
-            content = content.strip() or None
-        else:
-            content = str(content).strip() or None
-        if content:
-            lines.append(f"{role}: {content}")
-    return "\n".join(lines)
-
-
-def _merge_winning_tactics(url: str, session_id: str, tactics: list[str]) -> None:
-    """Merge session tactics into agent:winning_tactics (cosine-similarity dedupe)."""
-    r = redis.from_url(url)
-    key = f"{REDIS_SESSION_TACTICS_PREFIX}{session_id}{REDIS_SESSION_TACTICS_SUFFIX}"
-    raw = r.lrange(key, 0, -1)
-    session_tactics = [b.decode() if isinstance(b, bytes) else b for b in (raw or [])]
-    r.delete(key)
-    for t in session_tactics or tactics:
-        add_tactic_with_dedupe(r, REDIS_WINNING_KEY, t)
-    r.close()
-
-
-
-
-async def run_bot(transport: BaseTransport):
-    """Main bot logic."""
-    session_id = str(uuid.uuid4())
-    start_time = time.monotonic()
-    config = get_session_config(session_id=session_id)
-    logger.info(f"Starting bot session_id={session_id} mode={config.get('mode', 'refund')}")
 
-    # Realtime LLM service (handles STT, LLM, and TTS internally).
-    # inference_on_context_initialization=False so the counterparty (you) speak first.
-    llm = GeminiLiveLLMService(
+def create_llm(config: dict) -> GeminiLiveLLMService:
+    """Realtime LLM service (handles STT, LLM, and TTS internally).
+
+    inference_on_context_initialization=False so the counterparty (you) speak first.
+    """
+    return GeminiLiveLLMService(
         api_key=os.getenv("GOOGLE_API_KEY"),
         model=os.getenv("GOOGLE_MODEL"),
         voice_id=os.getenv("GOOGLE_VOICE_ID"),
@@ -218,15 +100,49 @@ async def run_bot(transport: BaseTransport):
         inference_on_context_initialization=False,
     )
 
+
+async def run_bot(
+    transport: BaseTransport,
+    llm_factory: Callable[[dict], FrameProcessor] = create_llm,
+    session_context: dict | None = None,
+):
+    """Main bot logic. llm_factory builds the realtime service from the session config
+    (scripts/run_load_harness.py swaps in a local stand-in); session_context is the
+    session request body."""
+    session_id = str(uuid.uuid4())
+    start_time = time.monotonic()
+    session_metrics = SessionMetricsObserver(session_id)
+    metrics.registry.inc("haggler_sessions_total")
+    with metrics.timed("haggler_config_fetch_seconds") as fetch:
+        config = await get_session_config(session_id=session_id, session_context=session_context)
+    session_metrics.mark("config_fetch_s", fetch.seconds)
+    mode = config.get("mode", "refund")
+    metrics.observe("haggler_prompt_chars", config["prompt_chars"], mode=mode)
+    metrics.observe("haggler_prompt_tokens", config["prompt_tokens_est"], mode=mode)
+    logger.info(
+        f"Starting bot session_id={session_id} mode={mode} "
+        f"tactics={config['tactics_count']}/{config['tactics_available']} "
+        f"prompt_chars={config['prompt_chars']} prompt_tokens_est={config['prompt_tokens_est']}"
+    )
+
+    # Pre-built for this instruction when possible; the VAD model is shared per process
+    resources = session_pool.take(
+        config, llm_factory, upcoming=lambda n: config_cache.upcoming(current_mode(), n)
+    )
+    llm = resources.llm
+
     # Empty initial context so Pipecat sends nothing to Gemini on connect (no first "user" turn).
     # System instruction is already on the LLM service above; no initial response = you speak first, less latency.
     context = LLMContext(messages=[])
     user_aggregator, assistant_aggregator = LLMContextAggregatorPair(
         context,
         user_params=LLMUserAggregatorParams(
-            vad_analyzer=SileroVADAnalyzer(params=VADParams(stop_secs=0.2)),
+            vad_analyzer=resources.vad_analyzer,
         ),
     )
+    # Turns stream to session:<id>:transcript as they finish (see transcript.py)
+    recorder = TranscriptRecorder(session_id)
+    recorder.attach(user_aggregator, assistant_aggregator, context)
 
     pipeline = Pipeline([
         transport.input(),
@@ -242,7 +158,7 @@ async def run_bot(transport: BaseTransport):
             enable_metrics=True,
             enable_usage_metrics=True,
         ),
-        observers=[],
+        observers=[session_metrics],
     )
 
     @task.rtvi.event_handler("on_client_ready")
@@ -253,87 +169,57 @@ async def run_bot(transport: BaseTransport):
     @transport.event_handler("on_client_connected")
     async def on_client_connected(transport, client):
         logger.info(f"Client connected session_id={session_id}")
+        session_metrics.connected()
+
+    disconnected_at: float | None = None
+    # Enqueued once the pipeline has torn down, so the trace gets the teardown time
+    post_call_job: PostCallJob | None = None
 
     @transport.event_handler("on_client_disconnected")
     async def on_client_disconnected(transport, client):
-        duration_seconds = time.monotonic() - start_time
+        nonlocal disconnected_at, post_call_job
+        disconnected_at = time.monotonic()
+        duration_seconds = disconnected_at - start_time
         logger.info(f"Client disconnected session_id={session_id} duration_secs={round(duration_seconds, 1)}")
-        # Poll context multiple times; aggregators may flush final turns late — use longest transcript
-        transcript = ""
-        for delay in (0.5, 0.5, 0.5, 1.0, 1.0):
-            await asyncio.sleep(delay)
-            messages = context.get_messages()
-            candidate = _format_transcript(messages)
-            if len(candidate) > len(transcript):
-                transcript = candidate
-        transcript_length = len(transcript)
-        preview = (transcript[:600] + "…") if len(transcript) > 600 else transcript
+        # Turns are recorded as the aggregators flush them; only wait if one is still in flight
+        await recorder.finalize()
+        transcript, transcript_stored = await recorder.handoff()
+        if not transcript and not transcript_stored:
+            transcript = format_messages(context.get_messages())
+        length = recorder.chars if transcript_stored else len(transcript)
+        preview = recorder.head if transcript_stored else transcript[:120]
         logger.info(
-            f"Transcript length={transcript_length} chars session_id={session_id} preview={preview[:120]!r}"
+            f"Transcript length={length} chars session_id={session_id} preview={preview!r}"
+        )
+        post_call_job = PostCallJob(
+            session_id=session_id,
+            config=config,
+            transcript=transcript,
+            transcript_stored=transcript_stored,
+            duration_seconds=duration_seconds,
+            timings=session_metrics.summary(),
         )
-        mode = config.get("mode", "refund")
-        if not os.getenv("WANDB_API_KEY"):
-            logger.warning("WANDB_API_KEY not set; skipping outcome/eval/Redis (no Gemini fallback)")
-            outcome = "failure"
-        else:
-            outcome = await asyncio.to_thread(evaluate_outcome_wandb, transcript, mode)
-            await asyncio.to_thread(
-                add_example_to_outcome_dataset, transcript, mode, outcome
-            )
-            await asyncio.to_thread(
-                run_single_row_eval_sync, transcript, mode, outcome
-            )
-            log_session_end(
-                session_id,
-                config,
-                duration_seconds,
-                outcome,
-                transcript_length=transcript_length,
-                transcript_preview=preview,
-            )
-        logger.info(f"Outcome (eval) session_id={session_id} outcome={outcome}")
-        url = os.getenv("REDIS_URL")
-        if url and config.get("tactics"):
-            r = redis.from_url(url)
-            key = f"{REDIS_SESSION_TACTICS_PREFIX}{session_id}{REDIS_SESSION_TACTICS_SUFFIX}"
-            r.delete(key)
-            r.rpush(key, *config["tactics"])
-            r.expire(key, 86400)
-            if outcome == "success":
-                _merge_winning_tactics(url, session_id, config["tactics"])
-                suggested = (
-                    await asyncio.to_thread(suggest_tactic_wandb, transcript, mode)
-                    if os.getenv("WANDB_API_KEY")
-                    else ""
-                )
-                if suggested:
-                    base_raw = r.lrange(REDIS_TACTICS_KEY, 0, -1) or []
-                    base_set = {b.decode() if isinstance(b, bytes) else b for b in base_raw}
-                    winning_raw = r.lrange(REDIS_WINNING_KEY, 0, -1) or []
-                    winning_set = {b.decode() if isinstance(b, bytes) else b for b in winning_raw}
-                    if suggested not in base_set and suggested not in winning_set:
-                        r.rpush(REDIS_WINNING_KEY, suggested)
-                        logger.info(
-                            "Suggested new tactic (session_id={}): {}",
-                            session_id,
-                            suggested,
-                        )
-            else:
-                base_raw = r.lrange(REDIS_TACTICS_KEY, 0, -1) or []
-                base_tactics = {b.decode() if isinstance(b, bytes) else b for b in base_raw}
-                for t in config["tactics"]:
-                    if t not in base_tactics:
-                        add_tactic_with_dedupe(r, REDIS_FAILED_KEY, t)
-                r.expire(REDIS_FAILED_KEY, 86400 * 7)
-            r.close()
         await task.cancel()
 
-
-
-
     runner = PipelineRunner(handle_sigint=False)
 
-    await runner.run(task)
+    metrics.registry.gauge_add("haggler_sessions_active", 1)
+    # Load reported to supervisor.py for least-loaded assignment (when run as a worker)
+    await track_worker_session(1)
+    try:
+        await runner.run(task)
+    finally:
+        metrics.registry.gauge_add("haggler_sessions_active", -1)
+        await track_worker_session(-1)
+        if disconnected_at is not None:
+            teardown = time.monotonic() - disconnected_at
+            metrics.observe("haggler_teardown_seconds", teardown)
+            if post_call_job is not None:
+                post_call_job.timings["teardown_s"] = round(teardown, 4)
+        if post_call_job is not None:
+            # Outcome, evals and tactic updates run on the post-call worker pool
+            post_call_queue.start()
+            await post_call_queue.enqueue(post_call_job)
 
 
 async def bot(runner_args: RunnerArguments):
@@ -355,7 +241,8 @@ async def bot(runner_args: RunnerArguments):
             logger.error(f"Unsupported runner arguments type: {type(runner_args)}")
             return
 
-    await run_bot(transport)
+    body = runner_args.body if isinstance(runner_args.body, dict) else None
+    await run_bot(transport, session_context=body)
 
 
 if __name__ == "__main__":
@@ -370,6 +257,17 @@ if __name__ == "__main__":
         return _orig_add(*args, **kwargs)
 
     _log.add = _add_silence_debug_and_warning
+    if os.getenv("HAGGLER_PRELOAD_ENCODER", "1") != "0":
+        # Load the shared tactic encoder now so the first session end doesn't pay for it
+        warm_encoder()
+    # Segment files left by calls that crashed mid-call (never sent to post-call)
+    prune_segments()
+    # Shared Silero VAD model, loaded once per process instead of per call
+    warm_vad()
+    # Components for the first call(s), built before the server starts taking them
+    prewarm_sessions()
+    # Prometheus /metrics when HAGGLER_METRICS_PORT is set
+    metrics.start_metrics_server()
     from pipecat.runner.run import main
 
     main()
\ No newline at end of file
@@ -0,0 +1,336 @@
+"""Tactic store compaction: near-duplicate clustering, capped eviction and vector GC.
+
+Without it agent:winning_tactics and its :vecs hash grow without bound and
+agent:failed_tactics could only be bounded by expiring the whole key. One compaction
+pass, per list:
+
+1. Cluster near-duplicates (cosine >= DEFAULT_SIMILARITY_THRESHOLD) and keep the
+   best-scoring member of each cluster (tactic_stats.rank_score; list order breaks ties).
+2. Evict tactics idle longer than the list's max age (last used in a session; a tactic
+   never used ages from when compaction first saw it, agent:tactic_stats:first_seen).
+3. Evict down to the list's cap, lowest first by HAGGLER_EVICTION_POLICY: score (success
+   rate + recency, default) or lru (least recently used, same first-seen fallback).
+4. Drop blank entries and exact repeats (the first occurrence stays), and :vecs entries
+   whose tactic is no longer in the list.
+Then per-tactic stats (and the rank sorted set) of tactics in no list are deleted.
+
+Caps / ages: HAGGLER_WINNING_CAP (500), HAGGLER_WINNING_MAX_IDLE_DAYS (30),
+HAGGLER_FAILED_CAP (1000) and 7 days for failed tactics. agent:tactics (curated base
+tactics) is never evicted, only its vectors are collected.
+
+A few removals are applied with LREM/HDEL, larger ones rewrite the list; both run under
+WATCH after checking the list still holds exactly what was planned, so a concurrent write
+makes the pass leave that list for the next run instead of losing the tactic. A compacted list's dedupe watermark is reset to its new length, so
+incremental dedupe (tactic_vectors.dedupe_list_by_similarity) only checks later appends.
+Passes are serialized across processes by a SET NX lock. PostCallQueue runs one every
+HAGGLER_COMPACTION_INTERVAL seconds (default 3600; 0 = off); scripts/compact_tactics.py
+runs one on demand.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from dataclasses import dataclass
+
+import numpy as np
+import redis
+from loguru import logger
+
+from redis_store import (
+    FAILED_TACTICS_TTL,
+    REDIS_FAILED_KEY,
+    REDIS_TACTICS_KEY,
+    REDIS_WINNING_KEY,
+    bump_tactics_version,
+    decode,
+    decode_list,
+    get_redis,
+)
+from tactic_index import dedupe_mask, drop_index
+from tactic_stats import (
+    STATS_FIRST_SEEN_KEY,
+    STATS_LAST_USED_KEY,
+    STATS_LAST_WIN_KEY,
+    STATS_LOSSES_KEY,
+    STATS_RANK_KEY,
+    STATS_USES_KEY,
+    STATS_WINS_KEY,
+    rank_score,
+)
+from tactic_vectors import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    VECS_SUFFIX,
+    dedupe_watermark_key,
+    load_index,
+    rewrites_key,
+)
+
+LOCK_KEY = "haggler:compaction:lock"
+LAST_RUN_KEY = "haggler:compaction:last_run"
+LOCK_TTL = 600
+# Up to this many removals are applied one LREM each; more rewrite the list
+LREM_MAX = 64
+SCAN_BATCH = 500
+STATS_KEYS = (
+    STATS_USES_KEY,
+    STATS_WINS_KEY,
+    STATS_LOSSES_KEY,
+    STATS_LAST_WIN_KEY,
+    STATS_LAST_USED_KEY,
+    STATS_FIRST_SEEN_KEY,
+)
+
+_RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass
+class ListPolicy:
+    key: str
+    cap: int = 0  # 0 = unbounded
+    max_idle_days: float = 0.0  # 0 = no age limit
+    dedupe: bool = True
+    evict: bool = True
+
+
+def compaction_interval() -> float:
+    return float(os.getenv("HAGGLER_COMPACTION_INTERVAL", "3600"))
+
+
+def eviction_policy() -> str:
+    policy = os.getenv("HAGGLER_EVICTION_POLICY", "score").lower()
+    return policy if policy in ("score", "lru") else "score"
+
+
+def policies() -> list[ListPolicy]:
+    return [
+        ListPolicy(
+            REDIS_WINNING_KEY,
+            cap=int(os.getenv("HAGGLER_WINNING_CAP", "500")),
+            max_idle_days=float(os.getenv("HAGGLER_WINNING_MAX_IDLE_DAYS", "30")),
+        ),
+        ListPolicy(
+            REDIS_FAILED_KEY,
+            cap=int(os.getenv("HAGGLER_FAILED_CAP", "1000")),
+            max_idle_days=FAILED_TACTICS_TTL / 86400,
+        ),
+        ListPolicy(REDIS_TACTICS_KEY, dedupe=False, evict=False),
+    ]
+
+
+def _fetch_stats(r: redis.Redis, tactics: list[str]) -> dict[str, dict]:
+    out: dict[str, dict] = {}
+    for start in range(0, len(tactics), SCAN_BATCH):
+        chunk = tactics[start : start + SCAN_BATCH]
+        pipe = r.pipeline(transaction=False)
+        for key in (
+            STATS_USES_KEY, STATS_WINS_KEY, STATS_LAST_WIN_KEY, STATS_LAST_USED_KEY, STATS_FIRST_SEEN_KEY
+        ):
+            pipe.hmget(key, chunk)
+        uses, wins, last_win, last_used, first_seen = pipe.execute()
+        for t, u, w, lw, lu, fs in zip(chunk, uses, wins, last_win, last_used, first_seen):
+            out[t] = {
+                "uses": int(u or 0),
+                "wins": int(w or 0),
+                "last_win": int(float(lw or 0)),
+                "last_used": int(float(lu or 0)),
+                "first_seen": int(float(fs or 0)),
+            }
+    return out
+
+
+def _stamp_first_seen(r: redis.Redis, tactics: list[str], now: float) -> None:
+    for start in range(0, len(tactics), SCAN_BATCH):
+        pipe = r.pipeline(transaction=False)
+        for t in tactics[start : start + SCAN_BATCH]:
+            pipe.hsetnx(STATS_FIRST_SEEN_KEY, t, int(now))
+        pipe.execute()
+
+
+def repeats(tactics: list[str]) -> dict[str, int]:
+    """Extra occurrences (after the first) of each non-blank tactic in tactics."""
+    counts: dict[str, int] = {}
+    for t in tactics:
+        if t.strip():
+            counts[t] = counts.get(t, 0) + 1
+    return {t: n - 1 for t, n in counts.items() if n > 1}
+
+
+def plan_list(
+    r: redis.Redis, policy: ListPolicy, now: float | None = None, dry_run: bool = False
+) -> tuple[list[str], dict[str, str]]:
+    """(tactics in list order, {tactic to remove: reason}) for one list. Only first-seen
+    stamps are written (not with dry_run); exact repeats are left to apply_removals."""
+    now = time.time() if now is None else now
+    tactics = decode_list(r.lrange(policy.key, 0, -1))
+    removals: dict[str, str] = {}
+    if not policy.evict or not tactics:
+        return tactics, removals
+    removals.update((t, "blank") for t in dict.fromkeys(tactics) if not t.strip())
+    unique = list(dict.fromkeys(t for t in tactics if t.strip()))
+    stats = _fetch_stats(r, unique)
+    unseen = [t for t in unique if not stats[t]["last_used"] and not stats[t]["first_seen"]]
+    if unseen and not dry_run:
+        _stamp_first_seen(r, unseen, now)
+    for t in unseen:
+        stats[t]["first_seen"] = int(now)
+    # Age of a tactic: last use in a session, else when compaction first saw it
+    seen = {t: stats[t]["last_used"] or stats[t]["first_seen"] for t in unique}
+    scores = {t: rank_score(stats[t], now) for t in unique}
+    if policy.dedupe and len(unique) > 1:
+        index = load_index(r, policy.key)
+        with index.lock:
+            vectors = {t: index.vector(t) for t in unique}
+            clustered = sorted((t for t in unique if vectors[t] is not None), key=lambda t: -scores[t])
+            if clustered:
+                keep = dedupe_mask(np.stack([vectors[t] for t in clustered]), DEFAULT_SIMILARITY_THRESHOLD)
+                removals.update((t, "duplicate") for t, k in zip(clustered, keep) if not k)
+    if policy.max_idle_days:
+        cutoff = now - policy.max_idle_days * 86400
+        for t in unique:
+            if t not in removals and seen[t] < cutoff:
+                removals[t] = "idle"
+    remaining = [t for t in unique if t not in removals]
+    if policy.cap and len(remaining) > policy.cap:
+        if eviction_policy() == "lru":
+            order = sorted(remaining, key=lambda t: seen[t])
+        else:
+            order = sorted(remaining, key=lambda t: (scores[t], seen[t]))
+        removals.update((t, "evicted") for t in order[: len(remaining) - policy.cap])
+    return tactics, removals
+
+
+def apply_removals(
+    r: redis.Redis, list_key: str, tactics: list[str], removed: list[str], watermark: bool = False
+) -> bool:
+    """Remove tactics (and their vectors) and exact repeats from list_key; with watermark, also
+    mark the result as deduplicated (tactic_vectors.dedupe_watermark_key). False if the list
+    changed since tactics was read."""
+    vecs_key = list_key + VECS_SUFFIX
+    gone = set(removed)
+    kept = list(dict.fromkeys(t for t in tactics if t not in gone))
+    extra = {t: n for t, n in repeats(tactics).items() if t not in gone}
+    with r.pipeline(transaction=True) as pipe:
+        try:
+            pipe.watch(list_key)
+            # Content, not just length: a same-length rewrite must abort too
+            if decode_list(pipe.lrange(list_key, 0, -1)) != tactics:
+                return False
+            pipe.multi()
+            if removed or extra:
+                pipe.incr(rewrites_key(list_key))
+            if len(removed) + len(extra) <= LREM_MAX:
+                for t in removed:
+                    pipe.lrem(list_key, 0, t)
+                for t, n in extra.items():
+                    # Negative count removes from the tail, keeping the first occurrence
+                    pipe.lrem(list_key, -n, t)
+            else:
+                pipe.delete(list_key)
+                for start in range(0, len(kept), SCAN_BATCH):
+                    pipe.rpush(list_key, *kept[start : start + SCAN_BATCH])
+            for start in range(0, len(removed), SCAN_BATCH):
+                pipe.hdel(vecs_key, *removed[start : start + SCAN_BATCH])
+            if watermark:
+                pipe.set(dedupe_watermark_key(list_key), len(kept))
+            pipe.execute()
+        except redis.WatchError:
+            return False
+    if removed or extra:
+        bump_tactics_version(r)
+        # Other processes reload on the rewrite counter; ours rebuilds on next use
+        drop_index(list_key)
+    return True
+
+
+def gc_vectors(r: redis.Redis, list_key: str, dry_run: bool = False) -> int:
+    """Delete :vecs entries whose tactic is not in list_key. Return count (would be) deleted."""
+    vecs_key = list_key + VECS_SUFFIX
+    members = set(decode_list(r.lrange(list_key, 0, -1)))
+    fields = (decode(f) for f, _ in r.hscan_iter(vecs_key, count=SCAN_BATCH))
+    orphans = [f for f in fields if f not in members]
+    if orphans and not dry_run:
+        for start in range(0, len(orphans), SCAN_BATCH):
+            r.hdel(vecs_key, *orphans[start : start + SCAN_BATCH])
+    return len(orphans)
+
+
+def gc_stats(r: redis.Redis, list_keys: list[str], dry_run: bool = False) -> int:
+    """Delete per-tactic stats (and rank entries) of tactics in none of list_keys."""
+    members: set[str] = set()
+    for key in list_keys:
+        members.update(decode_list(r.lrange(key, 0, -1)))
+    # Used tactics are in the uses hash; never-used ones only have a first-seen stamp
+    orphans = []
+    for key in (STATS_USES_KEY, STATS_FIRST_SEEN_KEY):
+        fields = (decode(f) for f, _ in r.hscan_iter(key, count=SCAN_BATCH))
+        orphans.extend(f for f in fields if f not in members)
+    orphans = list(dict.fromkeys(orphans))
+    if orphans and not dry_run:
+        for start in range(0, len(orphans), SCAN_BATCH):
+            chunk = orphans[start : start + SCAN_BATCH]
+            pipe = r.pipeline(transaction=False)
+            for key in STATS_KEYS:
+                pipe.hdel(key, *chunk)
+            pipe.zrem(STATS_RANK_KEY, *chunk)
+            pipe.execute()
+    return len(orphans)
+
+
+def compact(r: redis.Redis, dry_run: bool = False, force: bool = True) -> dict | None:
+    """One compaction pass over every list. Returns a report, or None when another process
+    holds the lock (or, with force=False, when a pass ran less than an interval ago)."""
+    if not force:
+        last = r.get(LAST_RUN_KEY)
+        if last is not None and time.time() - float(decode(last)) < compaction_interval():
+            return None
+    token = uuid.uuid4().hex
+    if not r.set(LOCK_KEY, token, nx=True, ex=LOCK_TTL):
+        return None
+    report: dict = {"lists": {}}
+    try:
+        for policy in policies():
+            tactics, removals = plan_list(r, policy, dry_run=dry_run)
+            entry = {"before": len(tactics), "removed": {}}
+            for reason in removals.values():
+                entry["removed"][reason] = entry["removed"].get(reason, 0) + 1
+            extra = sum(n for t, n in repeats(tactics).items() if t not in removals)
+            if extra and policy.evict:
+                entry["removed"]["repeat"] = extra
+            if (removals or policy.dedupe) and tactics and not dry_run:
+                if not apply_removals(r, policy.key, tactics, list(removals), watermark=policy.dedupe):
+                    logger.info(f"Compaction skipped {policy.key}: list changed during the pass")
+                    entry["skipped"] = True
+            entry["orphan_vectors"] = gc_vectors(r, policy.key, dry_run)
+            report["lists"][policy.key] = entry
+        if not dry_run:
+            # The failed list used to carry a whole-key TTL; entries now age out individually
+            r.persist(REDIS_FAILED_KEY)
+        report["orphan_stats"] = gc_stats(r, [p.key for p in policies()], dry_run)
+        if not dry_run:
+            r.set(LAST_RUN_KEY, time.time())
+        return report
+    finally:
+        r.eval(_RELEASE_LOCK_LUA, 1, LOCK_KEY, token)
+
+
+async def run_compactor(interval: float | None = None) -> None:
+    """Background loop: a compaction pass every interval seconds (shared across processes)."""
+    interval = compaction_interval() if interval is None else interval
+    while True:
+        try:
+            r = get_redis()
+            report = await asyncio.to_thread(compact, r, False, False) if r is not None else None
+            if report:
+                removed = {k: sum(v["removed"].values()) for k, v in report["lists"].items()}
+                logger.info(f"Tactic compaction removed={removed} orphan_stats={report['orphan_stats']}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Tactic compaction failed ({e})")
+        await asyncio.sleep(interval)
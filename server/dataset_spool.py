@@ -0,0 +1,136 @@
+"""Write-ahead spool for outcome dataset rows (SQLite on local disk).
+
+Post-call jobs append each row to the spool (a local insert, crash-safe in WAL mode)
+instead of fetching the Weave dataset and calling add_rows per session. flush() uploads
+spooled rows to the dataset in batches (HAGGLER_DATASET_FLUSH_BATCH, default 50) and
+deletes them only after the upload succeeds, so rows survive a process crash and are
+delivered at least once. Several processes may share one spool file: rows are claimed
+before upload, and claims older than CLAIM_TIMEOUT are retried.
+
+Spool path: HAGGLER_DATASET_SPOOL (default server/.spool/outcome_dataset.sqlite3).
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import weave
+from loguru import logger
+
+from outcome import OUTCOME_DATASET_NAME
+
+DEFAULT_SPOOL_PATH = Path(__file__).resolve().parent / ".spool" / "outcome_dataset.sqlite3"
+# Seconds after which rows claimed by a flush that never finished are claimable again
+CLAIM_TIMEOUT = 600
+
+
+def _flush_batch() -> int:
+    return int(os.getenv("HAGGLER_DATASET_FLUSH_BATCH", "50"))
+
+
+def _flush_seconds() -> float:
+    return float(os.getenv("HAGGLER_DATASET_FLUSH_SECONDS", "60"))
+
+
+class DatasetSpool:
+    """Durable local queue of dataset rows, flushed to the Weave dataset in batches."""
+
+    def __init__(self, path: str | Path | None = None, dataset_name: str = OUTCOME_DATASET_NAME):
+        self.path = Path(path or os.getenv("HAGGLER_DATASET_SPOOL") or DEFAULT_SPOOL_PATH)
+        self.dataset_name = dataset_name
+        self._local = threading.local()
+        self._owner = uuid.uuid4().hex
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL, created_at REAL NOT NULL, "
+                "claimed_by TEXT, claimed_at REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def append(self, row: dict) -> None:
+        self._conn().execute(
+            "INSERT INTO rows (row, created_at) VALUES (?, ?)", (json.dumps(row), time.time())
+        )
+
+    def pending(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def _claim(self, limit: int) -> list[tuple[int, dict]]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE rows SET claimed_by = ?, claimed_at = ? WHERE id IN ("
+                "SELECT id FROM rows WHERE claimed_by IS NULL OR claimed_at < ? ORDER BY id LIMIT ?)",
+                (self._owner, now, now - CLAIM_TIMEOUT, limit),
+            )
+            claimed = conn.execute(
+                "SELECT id, row FROM rows WHERE claimed_by = ? AND claimed_at = ? ORDER BY id",
+                (self._owner, now),
+            ).fetchall()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [(row_id, json.loads(row)) for row_id, row in claimed]
+
+    def _upload(self, rows: list[dict]) -> None:
+        ds = weave.ref(self.dataset_name).get()
+        ds.add_rows(rows)
+
+    def flush(self, limit: int | None = None) -> int:
+        """Upload up to limit spooled rows (default: one batch) in one add_rows. Return count uploaded."""
+        claimed = self._claim(limit or _flush_batch())
+        if not claimed:
+            return 0
+        ids = [row_id for row_id, _ in claimed]
+        marks = ",".join("?" * len(ids))
+        try:
+            self._upload([row for _, row in claimed])
+        except Exception:
+            self._conn().execute(f"UPDATE rows SET claimed_by = NULL WHERE id IN ({marks})", ids)
+            raise
+        self._conn().execute(f"DELETE FROM rows WHERE id IN ({marks})", ids)
+        return len(ids)
+
+    def flush_all(self) -> int:
+        total = 0
+        while n := self.flush():
+            total += n
+        return total
+
+    async def run_flusher(self) -> None:
+        """Flush whenever a full batch is spooled, or every HAGGLER_DATASET_FLUSH_SECONDS."""
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(1.0)
+            try:
+                due = time.monotonic() - last >= _flush_seconds()
+                if due or await asyncio.to_thread(self.pending) >= _flush_batch():
+                    n = await asyncio.to_thread(self.flush_all)
+                    last = time.monotonic()
+                    if n:
+                        logger.info(f"Flushed {n} rows to Weave dataset {self.dataset_name}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Dataset spool flush failed ({e}); rows stay spooled")
+                last = time.monotonic()
+
+
+dataset_spool = DatasetSpool()
@@ -0,0 +1,123 @@
+"""Content-addressed cache for outcome judge predictions.
+
+The same (transcript, mode) is judged at session end, again by batched Evaluations and
+again on every run_outcome_eval.py rerun. Results are cached under a sha256 of the judge
+kind, model name, system prompt, mode and transcript, so editing OUTCOME_SYSTEM (or the
+combined judge prompt) or switching models invalidates entries automatically.
+
+With REDIS_URL the cache lives in Redis (SET with TTL; let maxmemory-policy evict under
+pressure). Otherwise it is a local SQLite file with LRU eviction past
+HAGGLER_JUDGE_CACHE_MAX_ENTRIES. HAGGLER_JUDGE_CACHE=0 disables it.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from redis_store import get_redis
+
+JUDGE_CACHE_PREFIX = "haggler:judge:"
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / ".spool" / "judge_cache.sqlite3"
+
+
+def cache_enabled() -> bool:
+    return os.getenv("HAGGLER_JUDGE_CACHE", "1") == "1"
+
+
+def _ttl_seconds() -> int:
+    return int(os.getenv("HAGGLER_JUDGE_CACHE_TTL", str(86400 * 30)))
+
+
+def _max_entries() -> int:
+    return int(os.getenv("HAGGLER_JUDGE_CACHE_MAX_ENTRIES", "50000"))
+
+
+def cache_key(kind: str, model: str, system_prompt: str, mode: str, transcript: str) -> str:
+    h = hashlib.sha256()
+    for part in (kind, model, system_prompt, mode, transcript):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class JudgeCache:
+    """get/put of JSON-able judge results; Redis when available, else local SQLite LRU."""
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path or os.getenv("HAGGLER_JUDGE_CACHE_PATH") or DEFAULT_CACHE_PATH)
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS judge ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS judge_used_at ON judge (used_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        if not cache_enabled():
+            return None
+        try:
+            r = get_redis()
+            if r is not None:
+                raw = r.get(JUDGE_CACHE_PREFIX + key)
+                return json.loads(raw) if raw is not None else None
+            conn = self._conn()
+            now = time.time()
+            row = conn.execute(
+                "SELECT value FROM judge WHERE key = ? AND created_at >= ?", (key, now - _ttl_seconds())
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE judge SET used_at = ? WHERE key = ?", (now, key))
+            return json.loads(row[0])
+        except Exception as e:
+            logger.warning(f"Judge cache read failed ({e}); calling the judge")
+            return None
+
+    def put(self, key: str, value: dict) -> None:
+        if not cache_enabled():
+            return
+        try:
+            raw = json.dumps(value)
+            r = get_redis()
+            if r is not None:
+                r.set(JUDGE_CACHE_PREFIX + key, raw, ex=_ttl_seconds())
+                return
+            conn = self._conn()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO judge (key, value, created_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, raw, now, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict(conn)
+        except Exception as e:
+            logger.warning(f"Judge cache write failed ({e})")
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop expired rows, then least recently used rows past the size cap."""
+        conn.execute("DELETE FROM judge WHERE created_at < ?", (time.time() - _ttl_seconds(),))
+        excess = conn.execute("SELECT COUNT(*) FROM judge").fetchone()[0] - _max_entries()
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM judge WHERE key IN (SELECT key FROM judge ORDER BY used_at LIMIT ?)", (excess,)
+            )
+
+
+judge_cache = JudgeCache()
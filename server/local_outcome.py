@@ -0,0 +1,159 @@
+"""Local outcome classifier: MiniLM transcript embeddings + a logistic-regression head.
+
+Features per transcript are the embedding of its last TAIL_LINES lines (where the refund or
+deal is usually granted or refused), the mean embedding of CHUNK_LINES-line chunks of the
+whole call, and a mode flag. The head is trained on the labelled outcome dataset by
+scripts/train_local_outcome.py and saved as a small .npz (HAGGLER_LOCAL_OUTCOME_MODEL,
+default server/.models/outcome_head.npz); the encoder is the one tactic_vectors already
+loads, so a prediction costs a few milliseconds and no network.
+
+outcome.judge_outcome uses it according to HAGGLER_OUTCOME_CLASSIFIER:
+- remote (default): W&B Inference only.
+- local: this classifier only (works offline, no WANDB_API_KEY needed).
+- hybrid: this classifier, escalating to the remote judge when its confidence is below
+  HAGGLER_LOCAL_OUTCOME_CONFIDENCE (default 0.85).
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from tactic_vectors import EMBED_MODEL, embed_many
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent / ".models" / "outcome_head.npz"
+TAIL_LINES = 6
+CHUNK_LINES = 8
+# Bumped when transcript_features changes; heads trained on older features are rejected
+FEATURE_VERSION = 1
+
+_classifier: "LocalOutcomeClassifier | None" = None
+_classifier_loaded = False
+_classifier_lock = threading.Lock()
+
+
+def classifier_mode() -> str:
+    mode = os.getenv("HAGGLER_OUTCOME_CLASSIFIER", "remote").lower()
+    return mode if mode in ("remote", "local", "hybrid") else "remote"
+
+
+def confidence_threshold() -> float:
+    return float(os.getenv("HAGGLER_LOCAL_OUTCOME_CONFIDENCE", "0.85"))
+
+
+def model_path() -> Path:
+    return Path(os.getenv("HAGGLER_LOCAL_OUTCOME_MODEL") or DEFAULT_MODEL_PATH)
+
+
+def _segments(transcript: str) -> tuple[str, list[str]]:
+    lines = [line for line in transcript.strip().splitlines() if line.strip()]
+    tail = "\n".join(lines[-TAIL_LINES:])
+    chunks = ["\n".join(lines[i : i + CHUNK_LINES]) for i in range(0, len(lines), CHUNK_LINES)]
+    return tail, chunks
+
+
+def transcript_features(transcripts: list[str], modes: list[str]) -> np.ndarray:
+    """(n, 2 * dim + 1) float32 feature matrix; all texts are embedded in one batched call."""
+    texts: list[str] = []
+    spans: list[tuple[int, int, int]] = []
+    for transcript in transcripts:
+        tail, chunks = _segments(transcript)
+        start = len(texts)
+        texts.append(tail)
+        texts.extend(chunks)
+        spans.append((start, start + 1, len(texts)))
+    vecs = embed_many(texts)
+    dim = len(next((v for v in vecs if v), [])) or 384
+    features = np.zeros((len(transcripts), 2 * dim + 1), dtype=np.float32)
+    for row, ((tail_i, chunk_start, chunk_end), mode) in enumerate(zip(spans, modes)):
+        if vecs[tail_i]:
+            features[row, :dim] = vecs[tail_i]
+        chunk_vecs = [vecs[i] for i in range(chunk_start, chunk_end) if vecs[i]]
+        if chunk_vecs:
+            mean = np.mean(np.asarray(chunk_vecs, dtype=np.float32), axis=0)
+            features[row, dim : 2 * dim] = mean / (np.linalg.norm(mean) or 1.0)
+        features[row, -1] = 1.0 if mode == "refund" else 0.0
+    return features
+
+
+class LocalOutcomeClassifier:
+    """Logistic-regression head over transcript_features; P(success) per transcript."""
+
+    def __init__(self, weights: np.ndarray, bias: float):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+
+    @classmethod
+    def fit(
+        cls,
+        transcripts: list[str],
+        modes: list[str],
+        labels: list[str],
+        l2: float = 1e-2,
+        epochs: int = 500,
+        lr: float = 0.5,
+    ) -> "LocalOutcomeClassifier":
+        """Full-batch gradient descent on L2-regularized log loss (classes reweighted to balance)."""
+        x = transcript_features(transcripts, modes).astype(np.float64)
+        y = np.array([1.0 if label == "success" else 0.0 for label in labels])
+        pos = y.mean() if len(y) else 0.5
+        sample_w = np.where(y == 1.0, 0.5 / max(pos, 1e-6), 0.5 / max(1.0 - pos, 1e-6))
+        w = np.zeros(x.shape[1])
+        b = 0.0
+        for _ in range(epochs):
+            p = 1.0 / (1.0 + np.exp(-(x @ w + b)))
+            err = sample_w * (p - y) / len(y)
+            w -= lr * (x.T @ err + l2 * w)
+            b -= lr * err.sum()
+        return cls(w, b)
+
+    def predict_proba(self, transcripts: list[str], modes: list[str]) -> np.ndarray:
+        x = transcript_features(transcripts, modes)
+        return 1.0 / (1.0 + np.exp(-(x @ self.weights + self.bias)))
+
+    def predict(self, transcript: str, mode: str) -> dict:
+        """{"outcome", "confidence"} where confidence is the probability of the chosen class."""
+        if not transcript.strip():
+            return {"outcome": "failure", "confidence": 1.0}
+        p = float(self.predict_proba([transcript], [mode])[0])
+        outcome = "success" if p >= 0.5 else "failure"
+        return {"outcome": outcome, "confidence": p if outcome == "success" else 1.0 - p}
+
+    def save(self, path: str | Path | None = None) -> Path:
+        path = Path(path or model_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            weights=self.weights,
+            bias=np.float32(self.bias),
+            feature_version=np.int32(FEATURE_VERSION),
+            embed_model=np.str_(EMBED_MODEL),
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: str | Path | None = None) -> "LocalOutcomeClassifier":
+        data = np.load(Path(path or model_path()))
+        if int(data["feature_version"]) != FEATURE_VERSION or str(data["embed_model"]) != EMBED_MODEL:
+            raise ValueError("outcome head was trained on different features; retrain it")
+        return cls(data["weights"], float(data["bias"]))
+
+
+def get_local_classifier() -> LocalOutcomeClassifier | None:
+    """Process-wide classifier loaded from model_path(), or None if it is missing/invalid."""
+    global _classifier, _classifier_loaded
+    if not _classifier_loaded:
+        with _classifier_lock:
+            if not _classifier_loaded:
+                path = model_path()
+                try:
+                    _classifier = LocalOutcomeClassifier.load(path)
+                    logger.info(f"Loaded local outcome classifier {path}")
+                except FileNotFoundError:
+                    logger.warning(f"No local outcome classifier at {path}; run scripts/train_local_outcome.py")
+                except Exception as e:
+                    logger.warning(f"Local outcome classifier {path} unusable ({e})")
+                _classifier_loaded = True
+    return _classifier
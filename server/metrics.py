@@ -0,0 +1,198 @@
+"""In-process latency metrics with a Prometheus text endpoint.
+
+Histograms and counters live in one process-wide registry. timed() / instrument() time a
+block or function (Redis ops, inference calls, post-call stages); session_metrics feeds
+per-call pipeline timings, and bot.py the size of each session's system prompt. With HAGGLER_METRICS_PORT set, start_metrics_server() serves
+the registry at http://<host>:<port>/metrics in Prometheus text format (stdlib only, one
+daemon thread). Per-call numbers are also attached to the Weave trace (log_session_end).
+"""
+
+import functools
+import inspect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; covers sub-ms Redis calls up to slow post-call jobs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Histograms that aren't durations
+SIZE_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+BUCKETS = {
+    "haggler_prompt_chars": SIZE_BUCKETS,
+    "haggler_prompt_tokens": SIZE_BUCKETS,
+}
+
+HELP = {
+    "haggler_config_fetch_seconds": "Session config fetch (get_session_config) time",
+    "haggler_first_bot_audio_seconds": "Client connected to first bot audio",
+    "haggler_turn_response_seconds": "User stopped speaking to bot started speaking",
+    "haggler_vad_stop_to_response_seconds": "VAD detected end of speech to bot started speaking",
+    "haggler_llm_ttfb_seconds": "Realtime LLM time to first byte (pipecat TTFB metrics)",
+    "haggler_teardown_seconds": "Client disconnected to pipeline finished",
+    "haggler_postcall_stage_seconds": "Post-call job stage time",
+    "haggler_redis_seconds": "Redis operation time",
+    "haggler_inference_seconds": "W&B Inference call time",
+    "haggler_sessions_total": "Sessions started",
+    "haggler_sessions_active": "Sessions currently running",
+    "haggler_prompt_chars": "Session system prompt size (characters)",
+    "haggler_prompt_tokens": "Session system prompt size (estimated tokens)",
+}
+
+_lock = threading.Lock()
+_server: ThreadingHTTPServer | None = None
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape_label(value) -> str:
+    """Label value escaped per the Prometheus text format (backslash, quote, newline)."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+
+class Registry:
+    """Histograms (name -> labels -> bucket counts, sum, count) and counters/gauges."""
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: dict[str, dict[tuple, list]] = {}
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._gauges: dict[str, dict[tuple, float]] = {}
+
+    def buckets_for(self, name: str) -> tuple:
+        return BUCKETS.get(name, self.buckets)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = self.buckets_for(name)
+        with _lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        with _lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + amount
+
+    def gauge_add(self, name: str, amount: float, **labels) -> None:
+        with _lock:
+            series = self._gauges.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0.0) + amount
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: list[str] = []
+        with _lock:
+            for name, series in sorted(self._counters.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+                lines += [f"{name}{_format_labels(k)} {v}" for k, v in series.items()]
+            for name, series in sorted(self._gauges.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} gauge"]
+                lines += [f"{name}{_format_labels(k)} {v}" for k, v in series.items()]
+            for name, series in sorted(self._histograms.items()):
+                lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                buckets = self.buckets_for(name)
+                for key, (counts, total, count) in series.items():
+                    for bound, c in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', bound),))} {c}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def observe(name: str, value: float, **labels) -> None:
+    registry.observe(name, value, **labels)
+
+
+class timed:
+    """Context manager timing a block into histogram name; .seconds holds the duration."""
+
+    def __init__(self, name: str, **labels):
+        self.name, self.labels = name, labels
+        self.seconds = 0.0
+
+    def __enter__(self) -> "timed":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.seconds = time.perf_counter() - self._t0
+        registry.observe(self.name, self.seconds, **self.labels)
+
+
+def instrument(name: str, **labels):
+    """Decorator: time every call of a sync or async function into histogram name."""
+
+    def wrap(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timed(name, **labels):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(name, **labels):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return wrap
+
+
+def start_metrics_server(port: int | None = None) -> int | None:
+    """Serve /metrics on HAGGLER_METRICS_PORT (or port) in a daemon thread; idempotent.
+
+    Returns the bound port, or None when disabled (port unset or 0).
+    """
+    global _server
+    if _server is not None:
+        return _server.server_address[1]
+    port = int(os.getenv("HAGGLER_METRICS_PORT", "0")) if port is None else port
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("content-type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    host = os.getenv("HAGGLER_METRICS_HOST", "127.0.0.1")
+    _server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server.server_address[1]
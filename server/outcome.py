@@ -1,24 +1,47 @@
 """Single outcome classifier for haggler: success vs failure.
 
 Used by:
-- bot.py: at session end, outcome from W&B eval model; run Weave Evaluation after each run; Redis from eval outcome.
+- post_call.py: at session end, outcome from W&B eval model; finished sessions are evaluated in batches
+  (EvaluationBatcher: OutcomeModel's verdict, reused from the live judge when it ran the same
+  prompt, against the local classifier's label); Redis from eval outcome.
 - run_outcome_eval.py: Weave Evaluation on dataset (seed + live examples from bot).
 
-One prompt, one parse. Eval runs after each run via W&B mechanism.
+One prompt, one parse. Evals run over batches of finished sessions via W&B mechanism.
+W&B Inference clients are shared per process (keep-alive connections). The combined judge
+(judge_call) returns outcome and suggested tactic from one request. Both judges cache results
+by (transcript, mode, prompt, model) in judge_cache, so re-evaluating a row is free.
 """
 
 # Weave Dataset name for outcome evals; bot adds row every run; run_outcome_eval runs Evaluation on it
 OUTCOME_DATASET_NAME = "haggler-outcome-examples"
 
 import asyncio
+import hashlib
+import json
 import os
+import random
+import re
+import threading
+import weakref
 from typing import Literal
 
 import weave
-from openai import OpenAI
+from loguru import logger
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
 from pydantic import PrivateAttr
 from weave import Dataset, Evaluation, Model
 
+from judge_cache import cache_key, judge_cache
+from local_outcome import classifier_mode, confidence_threshold, get_local_classifier
+from metrics import timed
+
 # Canonical prompt; do not duplicate in bot or run_outcome_eval.
 OUTCOME_SYSTEM = (
     "You are evaluating a voice call. The customer is the 'assistant' in the transcript; 'user' is support/agent. "
@@ -29,6 +52,57 @@ OUTCOME_SYSTEM = (
 OUTCOME_USER_TEMPLATE = (
     "The customer was {goal}. Answer with exactly one word: success or failure.\n\nTranscript:\n{transcript}"
 )
+INFERENCE_MODEL = "OpenPipe/Qwen3-14B-Instruct"
+RETRY_BASE_DELAY = 1.0
+
+_client: OpenAI | None = None
+# Keyed by the loop object: a closed loop's id() can be reused by a new loop
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI] = (
+    weakref.WeakKeyDictionary()
+)
+_client_lock = threading.Lock()
+
+
+def _client_kwargs() -> dict:
+    return {
+        "base_url": os.getenv("WANDB_INFERENCE_BASE_URL", "https://api.inference.wandb.ai/v1"),
+        "api_key": os.environ["WANDB_API_KEY"],
+        "project": os.getenv("WEAVE_PROJECT", "factorio/haggler"),
+    }
+
+
+def get_inference_client() -> OpenAI:
+    """Process-wide W&B Inference client (reuses its HTTP connection pool)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(**_client_kwargs())
+    return _client
+
+
+def get_async_inference_client() -> AsyncOpenAI:
+    """AsyncOpenAI client for W&B Inference, one per event loop (httpx pools are loop-bound)."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncOpenAI(**_client_kwargs())
+    return client
+
+
+def init_weave() -> None:
+    """weave.init the project from env (no-op without WANDB_API_KEY). Used by the bot and post-call workers."""
+    if not os.getenv("WANDB_API_KEY"):
+        return
+    # Use entity/project (e.g. factorio/haggler) so traces appear in the right W&B project
+    project = os.getenv("WEAVE_PROJECT", "haggler")
+    entity = os.getenv("WANDB_ENTITY")
+    if entity and "/" not in project:
+        project = f"{entity}/{project}"
+    try:
+        weave.init(project)
+    except Exception as e:
+        logger.warning(f"Weave init failed ({e}); running without tracing")
 
 
 def parse_outcome(raw: str) -> Literal["success", "failure"]:
@@ -41,6 +115,11 @@ def goal_for_mode(mode: str) -> str:
     return "seeking a refund" if mode == "refund" else "negotiating (discount/booking/deal)"
 
 
+def outcome_messages(system: str, transcript: str, mode: str) -> list[dict]:
+    user_content = OUTCOME_USER_TEMPLATE.format(goal=goal_for_mode(mode), transcript=transcript)
+    return [{"role": "system", "content": system}, {"role": "user", "content": user_content}]
+
+
 @weave.op()
 def outcome_scorer(expected_outcome: str, output: dict) -> dict:
     pred = (output.get("outcome") or "").strip().lower()
@@ -51,32 +130,31 @@ def outcome_scorer(expected_outcome: str, output: dict) -> dict:
 class OutcomeModel(Model):
     """Same prompt as outcome.py; used by Weave Evaluation and by bot for outcome."""
     prompt: weave.Prompt = weave.StringPrompt(OUTCOME_SYSTEM)
-    model: str = "OpenPipe/Qwen3-14B-Instruct"
+    model: str = INFERENCE_MODEL
     _client: OpenAI = PrivateAttr()
 
     def __init__(self, **data):
         super().__init__(**data)
-        self._client = OpenAI(
-            base_url="https://api.inference.wandb.ai/v1",
-            api_key=os.environ["WANDB_API_KEY"],
-            project=os.getenv("WEAVE_PROJECT", "factorio/haggler"),
-        )
+        self._client = get_inference_client()
 
     @weave.op
     def predict(self, transcript: str, mode: str) -> dict:
         if not transcript.strip():
             return {"outcome": "failure"}
-        goal = goal_for_mode(mode)
-        user_content = f"The customer was {goal}. Answer with exactly one word: success or failure.\n\nTranscript:\n{transcript}"
-        response = self._client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": self.prompt.format()},
-                {"role": "user", "content": user_content},
-            ],
-        )
+        system = self.prompt.format()
+        # Same transcript/prompt/model always gets the same answer: skip the remote call
+        key = cache_key("outcome", self.model, system, mode, transcript)
+        cached = judge_cache.get(key)
+        if cached is not None:
+            return cached
+        with timed("haggler_inference_seconds", call="outcome"):
+            response = self._client.chat.completions.create(
+                model=self.model,
+                messages=outcome_messages(system, transcript, mode),
+            )
         raw = (response.choices[0].message.content or "").strip()
         outcome = parse_outcome(raw)
+        judge_cache.put(key, {"outcome": outcome})
         return {"outcome": outcome}
 
 
@@ -89,16 +167,140 @@ def evaluate_outcome_wandb(transcript: str, mode: str) -> Literal["success", "fa
     return OutcomeModel().predict(transcript, mode)["outcome"]  # type: ignore
 
 
-def run_single_row_eval_sync(transcript: str, mode: str, expected_outcome: str) -> None:
-    """Run Weave Evaluation on this one row (W&B eval after each run). weave.init(project) must already be called."""
-    row = {"transcript": transcript, "mode": mode, "expected_outcome": expected_outcome}
-    evaluation = Evaluation(
-        dataset=[row],
-        scorers=[outcome_scorer],
-        evaluation_name="haggler-outcome-eval",
-    )
-    model = OutcomeModel()
-    asyncio.run(evaluation.evaluate(model))
+def _retry_after(e: Exception, attempt: int) -> float:
+    """Seconds to wait before retrying: the server's Retry-After if given, else exponential backoff."""
+    response = getattr(e, "response", None)
+    header = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(header), 60.0)
+    except (TypeError, ValueError):
+        return min(RETRY_BASE_DELAY * 2**attempt, 60.0) * (0.5 + random.random() / 2)
+
+
+async def apredict_outcome(
+    transcript: str,
+    mode: str,
+    system: str = OUTCOME_SYSTEM,
+    model: str = INFERENCE_MODEL,
+    max_attempts: int = 6,
+) -> str:
+    """Async OutcomeModel.predict (same prompt, parse and judge cache) for bulk evaluation.
+
+    Rate-limit (429), timeout and 5xx errors are retried up to max_attempts times.
+    """
+    if not transcript.strip():
+        return "failure"
+    key = cache_key("outcome", model, system, mode, transcript)
+    cached = await asyncio.to_thread(judge_cache.get, key)
+    if cached is not None:
+        return cached["outcome"]
+    for attempt in range(max_attempts):
+        try:
+            with timed("haggler_inference_seconds", call="outcome"):
+                response = await get_async_inference_client().chat.completions.create(
+                    model=model,
+                    messages=outcome_messages(system, transcript, mode),
+                )
+            break
+        except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError) as e:
+            if attempt == max_attempts - 1:
+                raise
+            delay = _retry_after(e, attempt)
+            logger.debug(f"W&B Inference {type(e).__name__}; retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    outcome = parse_outcome((response.choices[0].message.content or "").strip())
+    await asyncio.to_thread(judge_cache.put, key, {"outcome": outcome})
+    return outcome
+
+
+def row_key(transcript: str, mode: str) -> str:
+    return hashlib.sha256(f"{mode}\0{transcript}".encode()).hexdigest()
+
+
+class RecordedOutcomeModel(OutcomeModel):
+    """OutcomeModel that returns predictions already made for these rows with the same prompt
+    (run_outcome_eval's concurrent pass, the live combined judge) and only calls W&B Inference
+    for unseen rows."""
+    _recorded: dict = PrivateAttr(default_factory=dict)
+
+    def record(self, transcript: str, mode: str, outcome: str) -> None:
+        self._recorded[row_key(transcript, mode)] = outcome
+
+    @weave.op
+    def predict(self, transcript: str, mode: str) -> dict:
+        outcome = self._recorded.get(row_key(transcript, mode))
+        if outcome is not None:
+            return {"outcome": outcome}
+        return super().predict(transcript, mode)
+
+
+class EvaluationBatcher:
+    """Accumulates finished sessions and runs one Weave Evaluation over the batch.
+
+    Flushes when HAGGLER_EVAL_BATCH_SIZE rows (default 20) are waiting or the oldest row
+    is HAGGLER_EVAL_BATCH_SECONDS old (default 300). Runs on the caller's event loop;
+    weave.init(project) must already be called.
+    """
+
+    def __init__(self):
+        self._rows: list[dict] = []
+        self._model: RecordedOutcomeModel | None = None
+        self._timer: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def batch_size() -> int:
+        return int(os.getenv("HAGGLER_EVAL_BATCH_SIZE", "20"))
+
+    @staticmethod
+    def batch_seconds() -> float:
+        return float(os.getenv("HAGGLER_EVAL_BATCH_SECONDS", "300"))
+
+    async def add(self, transcript: str, mode: str, expected_outcome: str, predicted: str | None = None) -> None:
+        """Queue one row. predicted is a verdict already made from OUTCOME_SYSTEM with
+        INFERENCE_MODEL (the combined judge embeds that prompt); it is reused while the model's
+        prompt and model still match, else the Evaluation runs OutcomeModel.predict.
+
+        expected_outcome must not come from OutcomeModel's prompt, or the row scores trivially.
+        Full batches are evaluated in a background task, so the caller doesn't wait.
+        """
+        if self._model is None:
+            self._model = RecordedOutcomeModel()
+        same_prompt = self._model.model == INFERENCE_MODEL and self._model.prompt.format() == OUTCOME_SYSTEM
+        if predicted is not None and same_prompt:
+            self._model.record(transcript, mode, predicted)
+        self._rows.append({"transcript": transcript, "mode": mode, "expected_outcome": expected_outcome})
+        if len(self._rows) >= self.batch_size():
+            task = asyncio.create_task(self.flush())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.batch_seconds())
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Evaluate everything queued so far (no-op when empty)."""
+        async with self._lock:
+            rows, model = self._rows, self._model
+            self._rows, self._model = [], None
+            if not rows or model is None:
+                return
+            evaluation = Evaluation(
+                dataset=rows,
+                scorers=[outcome_scorer],
+                evaluation_name="haggler-outcome-eval",
+            )
+            try:
+                await evaluation.evaluate(model)
+            except Exception as e:
+                logger.warning(f"Batched outcome evaluation of {len(rows)} rows failed: {e}")
+
+
+eval_batcher = EvaluationBatcher()
 
 
 TACTIC_SUGGEST_SYSTEM = (
@@ -116,19 +318,94 @@ def suggest_tactic_wandb(transcript: str, mode: str) -> str:
     user_content = (
         f"The customer got what they wanted ({goal}).\n\nTranscript:\n{transcript}"
     )
-    client = OpenAI(
-        base_url="https://api.inference.wandb.ai/v1",
-        api_key=os.environ["WANDB_API_KEY"],
-        project=os.getenv("WEAVE_PROJECT", "factorio/haggler"),
-    )
-    response = client.chat.completions.create(
-        model="OpenPipe/Qwen3-14B-Instruct",
-        messages=[
-            {"role": "system", "content": TACTIC_SUGGEST_SYSTEM},
-            {"role": "user", "content": user_content},
-        ],
-    )
+    with timed("haggler_inference_seconds", call="suggest_tactic"):
+        response = get_inference_client().chat.completions.create(
+            model=INFERENCE_MODEL,
+            messages=[
+                {"role": "system", "content": TACTIC_SUGGEST_SYSTEM},
+                {"role": "user", "content": user_content},
+            ],
+        )
     text = (response.choices[0].message.content or "").strip()
     return text
 
 
+JUDGE_COMBINED_SYSTEM = (
+    f"{OUTCOME_SYSTEM}\n\n"
+    "If the outcome is success, also suggest exactly one new tactic, based on what worked in this call, "
+    "that could help the customer get the same result next time: one clear sentence, no preamble or numbering. "
+    "Respond with only a JSON object: "
+    '{"outcome": "success" or "failure", "tactic": "<tactic sentence, or empty string on failure>"}'
+)
+
+
+def combined_judge_enabled() -> bool:
+    """HAGGLER_COMBINED_JUDGE=1 (default): one request for outcome + suggested tactic."""
+    return os.getenv("HAGGLER_COMBINED_JUDGE", "1") == "1"
+
+
+def parse_judge_response(raw: str) -> dict:
+    """Parse the combined judge's JSON; falls back to parse_outcome on free text."""
+    match = re.search(r"\{.*\}", raw or "", re.DOTALL)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+            outcome = parse_outcome(str(data.get("outcome", "")))
+            tactic = str(data.get("tactic") or "").strip() if outcome == "success" else ""
+            return {"outcome": outcome, "tactic": tactic}
+        except (ValueError, AttributeError):
+            pass
+    return {"outcome": parse_outcome(raw), "tactic": ""}
+
+
+@weave.op()
+async def judge_call(transcript: str, mode: str) -> dict:
+    """Outcome and (on success) one suggested tactic in a single W&B Inference request."""
+    if not transcript.strip() or not os.environ.get("WANDB_API_KEY"):
+        return {"outcome": "failure", "tactic": ""}
+    key = cache_key("combined", INFERENCE_MODEL, JUDGE_COMBINED_SYSTEM, mode, transcript)
+    cached = await asyncio.to_thread(judge_cache.get, key)
+    if cached is not None:
+        return cached
+    user_content = f"The customer was {goal_for_mode(mode)}.\n\nTranscript:\n{transcript}"
+    with timed("haggler_inference_seconds", call="combined_judge"):
+        response = await get_async_inference_client().chat.completions.create(
+            model=INFERENCE_MODEL,
+            messages=[
+                {"role": "system", "content": JUDGE_COMBINED_SYSTEM},
+                {"role": "user", "content": user_content},
+            ],
+            response_format={"type": "json_object"},
+        )
+    judged = parse_judge_response(response.choices[0].message.content or "")
+    await asyncio.to_thread(judge_cache.put, key, judged)
+    return judged
+
+
+async def judge_outcome(transcript: str, mode: str) -> dict:
+    """Outcome for a finished call per HAGGLER_OUTCOME_CLASSIFIER (see local_outcome).
+
+    Returns {"outcome", "tactic", "judge", "local"}: tactic is None unless the combined judge
+    ran; judge is "local", "remote", or None when nothing could judge the call (outcome
+    "failure"); local is the local classifier's verdict whenever it ran (also when escalated).
+    """
+    kind = classifier_mode()
+    remote = bool(os.environ.get("WANDB_API_KEY"))
+    local = None
+    if kind in ("local", "hybrid"):
+        classifier = await asyncio.to_thread(get_local_classifier)
+        if classifier is not None:
+            with timed("haggler_inference_seconds", call="local_outcome"):
+                local = await asyncio.to_thread(classifier.predict, transcript, mode)
+            if kind == "local" or not remote or local["confidence"] >= confidence_threshold():
+                outcome = local["outcome"]
+                return {"outcome": outcome, "tactic": None, "judge": "local", "local": outcome}
+            logger.debug(f"Local outcome confidence {local['confidence']:.2f}; escalating to W&B Inference")
+    local_outcome = local["outcome"] if local is not None else None
+    if not remote:
+        return {"outcome": "failure", "tactic": None, "judge": None, "local": local_outcome}
+    if combined_judge_enabled():
+        judged = await judge_call(transcript, mode)
+        return {**judged, "judge": "remote", "local": local_outcome}
+    outcome = await asyncio.to_thread(evaluate_outcome_wandb, transcript, mode)
+    return {"outcome": outcome, "tactic": None, "judge": "remote", "local": local_outcome}
@@ -0,0 +1,446 @@
+"""Post-call processing queue: outcome, dataset/eval logging and tactic updates off the call path.
+
+on_client_disconnected enqueues a PostCallJob and frees the session immediately; a pool of
+async workers (HAGGLER_POSTCALL_WORKERS, default 2) consumes jobs. With Redis the queue is
+the haggler:postcall stream (consumer group, so jobs survive a bot restart and can be
+consumed by a separate process: scripts/run_post_call_worker.py, with
+HAGGLER_POSTCALL_WORKERS=0 on the bot). Without Redis a bounded in-memory queue is used;
+with no local worker to consume it (HAGGLER_POSTCALL_WORKERS=0), jobs run inline.
+
+Failed jobs are retried with backoff up to HAGGLER_POSTCALL_MAX_ATTEMPTS times, then moved
+to haggler:postcall:dead. A retry waits in the haggler:postcall:delayed sorted set (score =
+not-before time) until a worker moves it back onto the stream; parking it, or dead-lettering
+it, is one transaction with acknowledging the attempt. A retry carries the judged outcome
+and the stages it already completed, so it doesn't count the session twice. Enqueue applies
+backpressure once HAGGLER_POSTCALL_MAX_PENDING jobs are waiting.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+
+import weave
+from loguru import logger
+
+import metrics
+from compaction import compaction_interval, run_compactor
+from dataset_spool import dataset_spool
+from outcome import eval_batcher, judge_outcome, suggest_tactic_wandb
+from redis_store import (
+    REDIS_FAILED_KEY,
+    REDIS_TACTICS_KEY,
+    REDIS_WINNING_KEY,
+    decode,
+    get_async_redis,
+    merge_tactics,
+    pop_session_tactics,
+    write_session_tactics,
+)
+from tactic_stats import record_session_outcome
+from transcript import delete_transcript, read_transcript
+
+POSTCALL_STREAM = "haggler:postcall"
+POSTCALL_DEAD_STREAM = "haggler:postcall:dead"
+# Sorted set of retries waiting for their not-before time (member = job JSON)
+POSTCALL_DELAYED_KEY = "haggler:postcall:delayed"
+POSTCALL_GROUP = "postcall-workers"
+# Pending entries idle this long belong to a dead consumer and are reclaimed
+RECLAIM_IDLE_MS = 5 * 60 * 1000
+RETRY_BASE_DELAY = 2.0
+# Longest enqueue waits for room in a full queue (then Redis enqueues anyway, local drops)
+ENQUEUE_WAIT_SECONDS = 30.0
+# Due retries moved back onto the stream per worker loop iteration
+PROMOTE_BATCH = 100
+
+# KEYS: delayed zset, stream. ARGV: now, max jobs. Moves due retries onto the stream.
+_PROMOTE_DUE_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, job in ipairs(due) do
+  redis.call('XADD', KEYS[2], '*', 'job', job)
+  redis.call('ZREM', KEYS[1], job)
+end
+return #due
+"""
+
+_promote_script = None
+
+
+@dataclass
+class PostCallJob:
+    session_id: str
+    config: dict
+    transcript: str
+    duration_seconds: float
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    # Call latency numbers from session_metrics (seconds), attached to the Weave trace
+    timings: dict = field(default_factory=dict)
+    # transcript is empty and the turns are in session:<id>:transcript (transcript.py)
+    transcript_stored: bool = False
+    # Set by earlier attempts: judge_outcome's result and the stages that already ran
+    judged: dict | None = None
+    done: list[str] = field(default_factory=list)
+    # Retries wait until this time (epoch seconds)
+    not_before: float = 0.0
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, raw: str | bytes) -> "PostCallJob":
+        return cls(**json.loads(decode(raw)))
+
+
+def _workers_from_env() -> int:
+    return int(os.getenv("HAGGLER_POSTCALL_WORKERS", "2"))
+
+
+def _max_attempts() -> int:
+    return int(os.getenv("HAGGLER_POSTCALL_MAX_ATTEMPTS", "3"))
+
+
+def _max_pending() -> int:
+    return int(os.getenv("HAGGLER_POSTCALL_MAX_PENDING", "100"))
+
+
+def wandb_enabled() -> bool:
+    """Whether the W&B stages (dataset rows, eval, trace, dataset flusher) run."""
+    return bool(os.getenv("WANDB_API_KEY"))
+
+
+@weave.op()
+def log_session_end(
+    session_id: str,
+    config: dict,
+    duration_seconds: float,
+    outcome: str,
+    transcript_length: int = 0,
+    transcript_preview: str = "",
+    timings: dict | None = None,
+) -> dict:
+    """Log session end and outcome score to Weave so evals/traces show success/failure.
+
+    timings (call latencies and post-call stage times, seconds) is logged as an input.
+    """
+    score = 1.0 if outcome == "success" else 0.0
+    # Return only fields not already in inputs (avoids duplicate columns in trace tables)
+    return {
+        "score": score,
+        "tactics_count": config.get("tactics_count", 0),
+        "mode": config.get("mode", "refund"),
+    }
+
+
+async def _merge_winning_tactics(session_id: str, tactics: list[str]) -> None:
+    """Merge session tactics into agent:winning_tactics (cosine-similarity dedupe)."""
+    session_tactics = await pop_session_tactics(session_id)
+    await merge_tactics(REDIS_WINNING_KEY, session_tactics or tactics)
+
+
+async def process_job(job: PostCallJob) -> str:
+    """Outcome, Weave dataset/eval/trace, tactic stats and Redis tactic updates for one call."""
+    session_id, config, transcript = job.session_id, job.config, job.transcript
+    if job.transcript_stored:
+        # Streamed during the call; still there if an earlier attempt of this job failed
+        transcript = await read_transcript(session_id)
+    mode = config.get("mode", "refund")
+    transcript_length = len(transcript)
+    preview = (transcript[:600] + "…") if len(transcript) > 600 else transcript
+    stages = {"queue_wait_s": max(0.0, time.time() - job.created_at)}
+    metrics.observe("haggler_postcall_stage_seconds", stages["queue_wait_s"], stage="queue_wait")
+    if job.judged is None:
+        with metrics.timed("haggler_postcall_stage_seconds", stage="judge") as t:
+            job.judged = await judge_outcome(transcript, mode)
+        stages["judge_s"] = t.seconds
+    judged = job.judged
+    outcome = judged["outcome"]
+    # Set when the combined judge already produced the success tactic
+    suggested: str | None = judged["tactic"]
+    if judged["judge"] is None:
+        logger.warning(
+            "WANDB_API_KEY not set and no local outcome classifier; skipping outcome/eval/tactic updates"
+        )
+    else:
+        with metrics.timed("haggler_postcall_stage_seconds", stage="dataset_eval") as t:
+            if wandb_enabled():
+                if "dataset" not in job.done:
+                    # Spooled locally; uploaded to the Weave dataset in batches (dataset_spool)
+                    row = {"transcript": transcript, "mode": mode, "expected_outcome": outcome, "judge": judged["judge"]}
+                    await asyncio.to_thread(dataset_spool.append, row)
+                    job.done.append("dataset")
+                # The eval scores OutcomeModel (the remote verdict, when there is one) against
+                # an independent label: the local classifier's, so only when it ran
+                if "eval" not in job.done:
+                    label = judged.get("local")
+                    if label is not None:
+                        predicted = outcome if judged["judge"] == "remote" else None
+                        await eval_batcher.add(transcript, mode, label, predicted=predicted)
+                    job.done.append("eval")
+            if "stats" not in job.done:
+                # Only judged sessions count toward tactic rankings
+                await record_session_outcome(config.get("tactics", []), outcome)
+                job.done.append("stats")
+        stages["dataset_eval_s"] = t.seconds
+    logger.info(f"Outcome (eval) session_id={session_id} outcome={outcome} judge={judged['judge']}")
+    tactics = config.get("tactics") or []
+    # An unjudged call's "failure" is a default, not a verdict: leave the tactic lists alone
+    judged_ok = judged["judge"] is not None
+    if judged_ok and get_async_redis() is not None and tactics and "tactics" not in job.done:
+        with metrics.timed("haggler_postcall_stage_seconds", stage="tactic_update") as t:
+            await _update_tactics(session_id, tactics, transcript, mode, outcome, suggested)
+        stages["tactic_update_s"] = t.seconds
+        job.done.append("tactics")
+    if judged["judge"] is not None and wandb_enabled() and "trace" not in job.done:
+        log_session_end(
+            session_id,
+            config,
+            job.duration_seconds,
+            outcome,
+            transcript_length=transcript_length,
+            transcript_preview=preview,
+            timings={**job.timings, **{k: round(v, 4) for k, v in stages.items()}},
+        )
+        job.done.append("trace")
+    await delete_transcript(session_id)
+    return outcome
+
+
+async def _update_tactics(
+    session_id: str, tactics: list[str], transcript: str, mode: str, outcome: str, suggested: str | None
+) -> None:
+    """Snapshot session tactics, then merge into winning (plus a suggested tactic) or failed."""
+    await write_session_tactics(session_id, tactics)
+    if outcome == "success":
+        await _merge_winning_tactics(session_id, tactics)
+        if suggested is None:
+            suggested = (
+                await asyncio.to_thread(suggest_tactic_wandb, transcript, mode)
+                if wandb_enabled()
+                else ""
+            )
+        if suggested:
+            # Exact check against base + winning, similarity check against winning
+            added = await merge_tactics(
+                REDIS_WINNING_KEY, [suggested], exclude_keys=(REDIS_TACTICS_KEY,)
+            )
+            if added == ["added"]:
+                logger.info(
+                    "Suggested new tactic (session_id={}): {}",
+                    session_id,
+                    suggested,
+                )
+    else:
+        # Entries age out individually (compaction), not by expiring the whole list
+        await merge_tactics(REDIS_FAILED_KEY, tactics, exclude_keys=(REDIS_TACTICS_KEY,))
+
+
+class PostCallQueue:
+    """Job queue plus worker pool; Redis stream when REDIS_URL is set, else in-memory."""
+
+    def __init__(self):
+        self._local: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._flusher: asyncio.Task | None = None
+        self._compactor: asyncio.Task | None = None
+        # Local retries waiting for their not-before time
+        self._retries: set[asyncio.Task] = set()
+        self._group_ready = False
+        self._inline_warned = False
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+    def _local_queue(self) -> asyncio.Queue:
+        if self._local is None:
+            self._local = asyncio.Queue(maxsize=_max_pending())
+        return self._local
+
+    async def _ensure_group(self, r) -> None:
+        if self._group_ready:
+            return
+        try:
+            await r.xgroup_create(POSTCALL_STREAM, POSTCALL_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def enqueue(self, job: PostCallJob) -> None:
+        """Queue a job; waits (backpressure) while HAGGLER_POSTCALL_MAX_PENDING jobs are queued.
+
+        Without Redis the job is dropped (logged) if the queue stays full for
+        ENQUEUE_WAIT_SECONDS, and run inline when no local worker is running to consume it.
+        """
+        r = get_async_redis()
+        if r is None:
+            if not any(not w.done() for w in self._workers):
+                if not self._inline_warned:
+                    logger.warning(
+                        "No Redis and no post-call workers running (HAGGLER_POSTCALL_WORKERS=0?); "
+                        "running post-call jobs inline"
+                    )
+                    self._inline_warned = True
+                if not await self._run(job):
+                    await self._retry_or_drop(job)
+                return
+            queue = self._local_queue()
+            try:
+                await asyncio.wait_for(queue.put(job), ENQUEUE_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                logger.error(
+                    f"Post-call queue full ({queue.qsize()} jobs); dropping job session_id={job.session_id}"
+                )
+            return
+        await self._ensure_group(r)
+        waited = 0.0
+        while await r.xlen(POSTCALL_STREAM) >= _max_pending() and waited < ENQUEUE_WAIT_SECONDS:
+            await asyncio.sleep(0.5)
+            waited += 0.5
+        if waited:
+            logger.warning(f"Post-call queue backpressure: waited {waited:.1f}s to enqueue")
+        await r.xadd(POSTCALL_STREAM, {"job": job.to_json()})
+
+    def start(self, workers: int | None = None) -> None:
+        """Start the worker pool on the running loop (idempotent)."""
+        workers = _workers_from_env() if workers is None else workers
+        self._workers = [w for w in self._workers if not w.done()]
+        for i in range(len(self._workers), workers):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+        if workers and wandb_enabled() and (self._flusher is None or self._flusher.done()):
+            self._flusher = asyncio.create_task(dataset_spool.run_flusher())
+        if (
+            workers
+            and compaction_interval() > 0
+            and get_async_redis() is not None
+            and (self._compactor is None or self._compactor.done())
+        ):
+            # Passes are shared across processes (lock + last-run stamp in Redis)
+            self._compactor = asyncio.create_task(run_compactor())
+
+    async def stop(self) -> None:
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for task in self._retries:
+            task.cancel()
+        await asyncio.gather(*self._retries, return_exceptions=True)
+        if self._compactor is not None:
+            self._compactor.cancel()
+            await asyncio.gather(self._compactor, return_exceptions=True)
+            self._compactor = None
+        # Don't lose rows still waiting for a batched evaluation / dataset upload
+        await eval_batcher.flush()
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+            try:
+                await asyncio.to_thread(dataset_spool.flush_all)
+            except Exception as e:
+                logger.warning(f"Final dataset spool flush failed ({e}); rows stay spooled")
+
+    async def drain(self) -> None:
+        """Wait until the in-memory queue is empty (Redis-backed jobs persist across restarts)."""
+        while True:
+            # A job that fails while draining schedules a retry, which lands back on the queue
+            await asyncio.gather(*self._retries, return_exceptions=True)
+            if self._local is not None:
+                await self._local.join()
+            if not self._retries:
+                return
+
+    async def _run(self, job: PostCallJob) -> bool:
+        try:
+            await process_job(job)
+            return True
+        except Exception as e:
+            logger.exception(f"Post-call job failed session_id={job.session_id} attempt={job.attempts + 1}: {e}")
+            return False
+
+    async def _retry_or_drop(self, job: PostCallJob, r=None, entry_id=None) -> None:
+        """Dead-letter the job after the last attempt, else schedule a retry. With a stream
+        entry, acknowledging it is part of the same transaction."""
+        job.attempts += 1
+        gave_up = job.attempts >= _max_attempts()
+        if gave_up:
+            logger.error(f"Post-call job gave up session_id={job.session_id} after {job.attempts} attempts")
+        else:
+            job.not_before = time.time() + RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+        if r is not None:
+            pipe = r.pipeline(transaction=True)
+            if gave_up:
+                pipe.xadd(POSTCALL_DEAD_STREAM, {"job": job.to_json()})
+            else:
+                pipe.zadd(POSTCALL_DELAYED_KEY, {job.to_json(): job.not_before})
+            if entry_id is not None:
+                pipe.xack(POSTCALL_STREAM, POSTCALL_GROUP, entry_id)
+                pipe.xdel(POSTCALL_STREAM, entry_id)
+            await pipe.execute()
+            return
+        if gave_up:
+            return
+        task = asyncio.create_task(self._requeue_local(job))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue_local(self, job: PostCallJob) -> None:
+        await asyncio.sleep(max(0.0, job.not_before - time.time()))
+        await self.enqueue(job)
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            try:
+                r = get_async_redis()
+                if r is None:
+                    job = await self._local_queue().get()
+                    try:
+                        if not await self._run(job):
+                            await self._retry_or_drop(job)
+                    finally:
+                        self._local_queue().task_done()
+                    continue
+                await self._ensure_group(r)
+                if n == 0:
+                    await self._promote_due(r)
+                entries = await self._claim(r) if n == 0 else []
+                if not entries:
+                    reply = await r.xreadgroup(
+                        POSTCALL_GROUP, self.consumer, {POSTCALL_STREAM: ">"}, count=1, block=1000
+                    )
+                    entries = reply[0][1] if reply else []
+                for entry_id, fields in entries:
+                    job = PostCallJob.from_json(fields[b"job"])
+                    if await self._run(job):
+                        pipe = r.pipeline(transaction=True)
+                        pipe.xack(POSTCALL_STREAM, POSTCALL_GROUP, entry_id)
+                        pipe.xdel(POSTCALL_STREAM, entry_id)
+                        await pipe.execute()
+                    else:
+                        await self._retry_or_drop(job, r, entry_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Post-call worker {n} error ({e}); retrying")
+                await asyncio.sleep(1.0)
+
+    async def _promote_due(self, r) -> int:
+        """Move retries whose not-before time has passed back onto the stream (atomically)."""
+        global _promote_script
+        if _promote_script is None:
+            _promote_script = r.register_script(_PROMOTE_DUE_LUA)
+        return await _promote_script(
+            keys=[POSTCALL_DELAYED_KEY, POSTCALL_STREAM], args=[time.time(), PROMOTE_BATCH], client=r
+        )
+
+    async def _claim(self, r) -> list:
+        """Take over jobs left pending by a consumer that died mid-job."""
+        reply = await r.xautoclaim(
+            POSTCALL_STREAM, POSTCALL_GROUP, self.consumer, min_idle_time=RECLAIM_IDLE_MS, count=1
+        )
+        return [(entry_id, fields) for entry_id, fields in reply[1] if fields]
+
+
+post_call_queue = PostCallQueue()
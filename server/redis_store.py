@@ -0,0 +1,272 @@
+"""Shared Redis access for the haggler server: one connection pool per process.
+
+REDIS_URL is normalized once here (bot, tactic_vectors callers and scripts all go
+through get_redis / get_async_redis). The async tactic-store operations use
+redis.asyncio so session setup/teardown never blocks the audio pipeline; embedding
+work for dedupe runs in a thread against the sync pool.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+
+import redis
+import redis.asyncio as aioredis
+from loguru import logger
+
+from metrics import instrument
+
+REDIS_TACTICS_KEY = "agent:tactics"
+REDIS_WINNING_KEY = "agent:winning_tactics"
+REDIS_FAILED_KEY = "agent:failed_tactics"
+REDIS_SESSION_TACTICS_PREFIX = "session:"
+REDIS_SESSION_TACTICS_SUFFIX = ":tactics"
+REDIS_SESSION_TRANSCRIPT_SUFFIX = ":transcript"
+# Bumped (and announced on TACTICS_CHANNEL) whenever a tactic list is rewritten; see session_config
+TACTICS_VERSION_KEY = "agent:tactics_version"
+TACTICS_CHANNEL = "agent:tactics_changed"
+SESSION_TACTICS_TTL = 86400
+# Failed tactics unused this long are dropped by compaction
+FAILED_TACTICS_TTL = 86400 * 7
+# Long enough for a dead-lettered post-call job to be replayed
+SESSION_TRANSCRIPT_TTL = 86400 * 7
+# Supervisor mode (supervisor.py): per-worker active-session counters and session routing
+WORKER_KEY_PREFIX = "haggler:worker:"
+SESSION_ROUTE_PREFIX = "haggler:route:"
+
+
+_url: str | None = None
+_url_loaded = False
+_sync_pool: redis.ConnectionPool | None = None
+# Keyed by the loop object: a closed loop's id() can be reused by a new loop
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis] = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.Lock()
+
+
+def normalize_redis_url(url: str | None) -> str | None:
+    """Strip and add a redis:// scheme to bare host:port URLs."""
+    if not url:
+        return None
+    url = url.strip()
+    if not url:
+        return None
+    if not url.startswith(("redis://", "rediss://", "unix://")):
+        url = "redis://" + url
+    return url
+
+
+def redis_url() -> str | None:
+    """Normalized REDIS_URL (read from the environment once), or None if unset."""
+    global _url, _url_loaded
+    if not _url_loaded:
+        _url = normalize_redis_url(os.getenv("REDIS_URL"))
+        _url_loaded = True
+    return _url
+
+
+def _pool_kwargs() -> dict:
+    # Pool sizing / timeouts (seconds); a stalled Redis should not hang a call
+    timeout = float(os.getenv("REDIS_SOCKET_TIMEOUT", "5"))
+    return {
+        "max_connections": int(os.getenv("REDIS_POOL_MAX_CONNECTIONS", "32")),
+        "socket_timeout": timeout,
+        "socket_connect_timeout": timeout,
+        "health_check_interval": 30,
+    }
+
+
+def get_redis() -> redis.Redis | None:
+    """Sync client on the shared pool; None when REDIS_URL is unset. Do not close() it."""
+    global _sync_pool
+    url = redis_url()
+    if not url:
+        return None
+    if _sync_pool is None:
+        with _lock:
+            if _sync_pool is None:
+                _sync_pool = redis.ConnectionPool.from_url(url, **_pool_kwargs())
+    return redis.Redis(connection_pool=_sync_pool)
+
+
+def get_async_redis() -> aioredis.Redis | None:
+    """redis.asyncio client on a pool bound to the running event loop; None when REDIS_URL is unset."""
+    url = redis_url()
+    if not url:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = aioredis.from_url(url, **_pool_kwargs())
+    return client
+
+
+async def close_async_redis() -> None:
+    """Close the async pool for the running loop (e.g. at the end of a script's asyncio.run)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def bump_tactics_version(r: redis.Redis) -> None:
+    """Mark the tactic lists as changed for every process's session config cache."""
+    pipe = r.pipeline(transaction=False)
+    pipe.incr(TACTICS_VERSION_KEY)
+    pipe.publish(TACTICS_CHANNEL, "changed")
+    pipe.execute()
+
+
+def decode(b: bytes | str) -> str:
+    return b.decode() if isinstance(b, bytes) else b
+
+
+def decode_list(raw) -> list[str]:
+    return [decode(x) for x in (raw or [])]
+
+
+def session_tactics_key(session_id: str) -> str:
+    return f"{REDIS_SESSION_TACTICS_PREFIX}{session_id}{REDIS_SESSION_TACTICS_SUFFIX}"
+
+
+def session_transcript_key(session_id: str) -> str:
+    return f"{REDIS_SESSION_TACTICS_PREFIX}{session_id}{REDIS_SESSION_TRANSCRIPT_SUFFIX}"
+
+
+@instrument("haggler_redis_seconds", op="fetch_tactic_lists")
+async def fetch_tactic_lists() -> tuple[list[str], list[str]]:
+    """Return (winning_tactics, base_tactics) in one round trip; empty lists without Redis."""
+    r = get_async_redis()
+    if r is None:
+        return [], []
+    pipe = r.pipeline(transaction=False)
+    pipe.lrange(REDIS_WINNING_KEY, 0, -1)
+    pipe.lrange(REDIS_TACTICS_KEY, 0, -1)
+    winning_raw, base_raw = await pipe.execute()
+    return decode_list(winning_raw), decode_list(base_raw)
+
+
+@instrument("haggler_redis_seconds", op="fetch_list")
+async def fetch_list(key: str) -> list[str]:
+    r = get_async_redis()
+    if r is None:
+        return []
+    return decode_list(await r.lrange(key, 0, -1))
+
+
+@instrument("haggler_redis_seconds", op="write_session_tactics")
+async def write_session_tactics(session_id: str, tactics: list[str]) -> None:
+    """Snapshot the tactics used this session in session:<id>:tactics (TTL 24h)."""
+    r = get_async_redis()
+    if r is None or not tactics:
+        return
+    key = session_tactics_key(session_id)
+    pipe = r.pipeline(transaction=True)
+    pipe.delete(key)
+    pipe.rpush(key, *tactics)
+    pipe.expire(key, SESSION_TACTICS_TTL)
+    await pipe.execute()
+
+
+@instrument("haggler_redis_seconds", op="pop_session_tactics")
+async def pop_session_tactics(session_id: str) -> list[str]:
+    """Read and delete the session:<id>:tactics snapshot."""
+    r = get_async_redis()
+    if r is None:
+        return []
+    key = session_tactics_key(session_id)
+    pipe = r.pipeline(transaction=True)
+    pipe.lrange(key, 0, -1)
+    pipe.delete(key)
+    raw, _ = await pipe.execute()
+    return decode_list(raw)
+
+
+@instrument("haggler_redis_seconds", op="append_transcript")
+async def append_session_transcript(session_id: str, role: str, text: str) -> bool:
+    """XADD one turn to the session:<id>:transcript stream; False without Redis."""
+    r = get_async_redis()
+    if r is None:
+        return False
+    key = session_transcript_key(session_id)
+    pipe = r.pipeline(transaction=False)
+    pipe.xadd(key, {"role": role, "text": text})
+    pipe.expire(key, SESSION_TRANSCRIPT_TTL)
+    await pipe.execute()
+    return True
+
+
+@instrument("haggler_redis_seconds", op="read_transcript")
+async def read_session_transcript(session_id: str) -> list[tuple[str, str]]:
+    """(role, text) turns from session:<id>:transcript, oldest first."""
+    r = get_async_redis()
+    if r is None:
+        return []
+    entries = await r.xrange(session_transcript_key(session_id))
+    return [(decode(f[b"role"]), decode(f[b"text"])) for _, f in entries]
+
+
+async def delete_session_transcript(session_id: str) -> None:
+    r = get_async_redis()
+    if r is not None:
+        await r.delete(session_transcript_key(session_id))
+
+
+@instrument("haggler_redis_seconds", op="merge_tactics")
+async def merge_tactics(
+    list_key: str,
+    tactics: list[str],
+    exclude_keys: tuple[str, ...] = (),
+    expire_seconds: int | None = None,
+) -> list[str]:
+    """Add tactics to list_key with similarity dedupe (tactic_vectors) off the event loop.
+
+    The insert is one atomic script per batch; tactics already in any exclude_keys list
+    are treated as duplicates. Return per-tactic results ("added" / "duplicate" / "skip").
+    """
+    from tactic_vectors import add_tactics_with_dedupe
+
+    r = get_redis()
+    if r is None or not tactics:
+        return []
+    return await asyncio.to_thread(
+        add_tactics_with_dedupe,
+        r,
+        list_key,
+        tactics,
+        exclude_keys=exclude_keys,
+        expire_seconds=expire_seconds,
+    )
+
+
+@instrument("haggler_redis_seconds", op="expire")
+async def expire(key: str, seconds: int) -> None:
+    r = get_async_redis()
+    if r is not None:
+        await r.expire(key, seconds)
+
+
+def worker_sessions_key(worker_id: str) -> str:
+    return f"{WORKER_KEY_PREFIX}{worker_id}:sessions"
+
+
+def worker_started_key(worker_id: str) -> str:
+    return f"{WORKER_KEY_PREFIX}{worker_id}:started"
+
+
+async def track_worker_session(delta: int) -> None:
+    """Adjust this bot worker's active-session counter (and, on start, its count of sessions
+    ever started); no-op unless run by supervisor.py."""
+    worker_id = os.getenv("HAGGLER_WORKER_ID")
+    r = get_async_redis()
+    if not worker_id or r is None:
+        return
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.incrby(worker_sessions_key(worker_id), delta)
+        if delta > 0:
+            pipe.incrby(worker_started_key(worker_id), delta)
+        await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Worker session counter update failed ({e})")
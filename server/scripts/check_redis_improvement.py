@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 """Query Redis to show improvement-loop state: tactics, winning_tactics, failed_tactics.
 
-Deduplicates winning_tactics and failed_tactics by cosine similarity on every run.
-Run from server/: uv run python scripts/check_redis_improvement.py
+Deduplicates winning_tactics and failed_tactics by cosine similarity on every run: only
+tactics added since the last dedupe or compaction are checked; --full re-clusters everything.
+Run from server/: uv run python scripts/check_redis_improvement.py [--full]
 """
-import os
 import sys
 from pathlib import Path
 
@@ -12,19 +12,17 @@ import redis
 from dotenv import load_dotenv
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from tactic_vectors import dedupe_list_by_similarity
-
 load_dotenv(Path(__file__).resolve().parent.parent / ".env")
 
-REDIS_TACTICS_KEY = "agent:tactics"
-REDIS_WINNING_KEY = "agent:winning_tactics"
-REDIS_FAILED_KEY = "agent:failed_tactics"
-REDIS_SESSION_PREFIX = "session:"
-REDIS_SESSION_SUFFIX = ":tactics"
-
-
-def _decode(b: bytes | str) -> str:
-    return b.decode() if isinstance(b, bytes) else b
+from redis_store import REDIS_FAILED_KEY, REDIS_TACTICS_KEY, REDIS_WINNING_KEY, get_redis
+from redis_store import decode as _decode
+from tactic_stats import rebuild_rank_index
+from tactic_vectors import (
+    dedupe_list_by_similarity,
+    dedupe_watermark_key,
+    migrate_vectors,
+    rewrites_key,
+)
 
 
 def _drop_base_tactics_from_failed(r: redis.Redis) -> int:
@@ -38,24 +36,32 @@ def _drop_base_tactics_from_failed(r: redis.Redis) -> int:
     if removed:
         r.delete(REDIS_FAILED_KEY)
         r.delete(REDIS_FAILED_KEY + ":vecs")
+        r.delete(dedupe_watermark_key(REDIS_FAILED_KEY))
         if kept:
             r.rpush(REDIS_FAILED_KEY, *kept)
+        r.incr(rewrites_key(REDIS_FAILED_KEY))
     return removed
 
 
 def main() -> None:
-    url = os.getenv("REDIS_URL")
-    if not url:
+    r = get_redis()
+    if r is None:
         print("REDIS_URL not set in .env")
         return
-    url = url.strip()
-    if not url.startswith(("redis://", "rediss://", "unix://")):
-        url = "redis://" + url
-    r = redis.from_url(url)
+
+    # Rewrite legacy JSON vectors in the binary format (no-op once migrated)
+    n_migrated = migrate_vectors(r, REDIS_WINNING_KEY) + migrate_vectors(r, REDIS_FAILED_KEY)
+    if n_migrated:
+        print(f"(Migrated {n_migrated} cached vectors to binary format)\n")
+    # Bandit selection's rank index, for counters recorded before it existed (no-op once built)
+    n_ranked = rebuild_rank_index(r)
+    if n_ranked:
+        print(f"(Indexed {n_ranked} tactics in the tactic rank sorted set)\n")
 
     # Vector dedupe (cosine similarity); drop base tactics from failed
-    n_winning = dedupe_list_by_similarity(r, REDIS_WINNING_KEY)
-    n_failed = dedupe_list_by_similarity(r, REDIS_FAILED_KEY)
+    incremental = "--full" not in sys.argv[1:]
+    n_winning = dedupe_list_by_similarity(r, REDIS_WINNING_KEY, incremental=incremental)
+    n_failed = dedupe_list_by_similarity(r, REDIS_FAILED_KEY, incremental=incremental)
     n_dropped_base = _drop_base_tactics_from_failed(r)
     if n_winning or n_failed or n_dropped_base:
         print(f"(Deduped by similarity: {n_winning} from winning_tactics, {n_failed} from failed_tactics; {n_dropped_base} base tactics removed from failed_tactics)\n")
@@ -82,7 +88,6 @@ def main() -> None:
         print(f"  {i}. {t[:80]}{'...' if len(t) > 80 else ''}")
     print()
 
-    r.close()
     print("(Bot uses: winning_tactics first, then tactics; failed_tactics are recorded for evals.)")
 
 if __name__ == "__main__":
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Run one tactic store compaction pass (dedupe clusters, evict to caps, GC vectors/stats).
+
+Same pass the bot's post-call workers run every HAGGLER_COMPACTION_INTERVAL seconds; see
+compaction.py for the policy. --dry-run only reports what would be removed.
+Run from server/: uv run python scripts/compact_tactics.py [--dry-run]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+load_dotenv(Path(__file__).resolve().parent.parent / ".env")
+
+from compaction import compact
+from redis_store import get_redis
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report removals without writing")
+    args = parser.parse_args()
+    r = get_redis()
+    if r is None:
+        print("REDIS_URL not set in .env")
+        raise SystemExit(1)
+    report = compact(r, dry_run=args.dry_run)
+    if report is None:
+        print("Another compaction pass is running; try again later")
+        raise SystemExit(1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
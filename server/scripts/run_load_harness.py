@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""Offline load test: N concurrent synthetic sessions through run_bot in one process.
+
+Nothing leaves the machine:
+- FakeTransport stands in for SmallWebRTC. Its input side plays canned counterparty turns
+  (VAD start, TranscriptionFrame, VAD stop; optionally a 16 kHz mono WAV streamed in real
+  time first, so Silero VAD does real work). Its output side waits for the bot's reply.
+- FakeRealtimeLLM stands in for GeminiLiveLLMService. It answers each user turn after
+  --reply-latency with a text reply and a chunk of silent audio.
+- No W&B credentials are used: the outcome judge is stubbed (--inference-latency per call,
+  --success-rate verdicts with a suggested tactic), evaluation rows are only counted, and
+  dataset rows go to a throwaway spool whose upload is a no-op.
+- Redis is --redis-url (use a local/throwaway instance), or fakeredis with --fakeredis,
+  or none (in-memory post-call queue).
+
+Reports sessions/sec, latency percentiles per stage (config fetch, first response, turn
+response, teardown, post-call), process CPU time and peak RSS.
+Run from server/: uv run python scripts/run_load_harness.py --sessions 50 --concurrency 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import wave
+import weakref
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# Keep load-test sessions out of the W&B project (bot.py calls init_weave at import)
+os.environ["WEAVE_DISABLED"] = "true"
+
+from pipecat.frames.frames import (  # noqa: E402
+    CancelFrame,
+    EndFrame,
+    InputAudioRawFrame,
+    LLMContextFrame,
+    LLMFullResponseEndFrame,
+    LLMFullResponseStartFrame,
+    LLMTextFrame,
+    StartFrame,
+    TranscriptionFrame,
+    TTSAudioRawFrame,
+    VADUserStartedSpeakingFrame,
+    VADUserStoppedSpeakingFrame,
+)
+from pipecat.processors.frame_processor import FrameProcessor  # noqa: E402
+from pipecat.transports.base_transport import BaseTransport  # noqa: E402
+
+import bot  # noqa: E402  (loads server/.env; overridden below)
+import post_call  # noqa: E402
+import redis_store  # noqa: E402
+from dataset_spool import DatasetSpool  # noqa: E402
+
+DEFAULT_TURNS = [
+    "Thanks for calling customer support, how can I help you today?",
+    "I see the flight was cancelled. Our policy only allows a travel credit.",
+    "Let me check with my supervisor about a refund.",
+    "Okay, I've approved a full refund to your original payment method.",
+]
+REPLY_TEXT = "I understand, but the airline cancelled the flight, so I'm entitled to a refund."
+AUDIO_CHUNK_SECONDS = 0.02
+
+
+class Stats:
+    """Stage name -> list of durations (seconds)."""
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.samples.setdefault(stage, []).append(seconds)
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def summary(self) -> dict:
+        out = {}
+        for stage, values in self.samples.items():
+            arr = np.asarray(values) * 1000
+            out[stage] = {
+                "n": len(values),
+                "p50_ms": float(np.percentile(arr, 50)),
+                "p90_ms": float(np.percentile(arr, 90)),
+                "p99_ms": float(np.percentile(arr, 99)),
+                "max_ms": float(arr.max()),
+            }
+        return out
+
+
+stats = Stats()
+
+
+class _FakeInput(FrameProcessor):
+    """Plays the counterparty's turns once the pipeline has started."""
+
+    def __init__(self, transport: "FakeTransport"):
+        super().__init__(name="FakeInput")
+        self._transport = transport
+        self._task = None
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        await self.push_frame(frame, direction)
+        if isinstance(frame, StartFrame):
+            self._task = self.create_task(self._play())
+        elif isinstance(frame, (EndFrame, CancelFrame)) and self._task:
+            await self.cancel_task(self._task)
+            self._task = None
+
+    async def _play(self):
+        t = self._transport
+        await t._call_event_handler("on_client_connected", t.client)
+        for i, text in enumerate(t.turns):
+            await asyncio.sleep(t.think_time)
+            await self.push_frame(VADUserStartedSpeakingFrame())
+            if t.audio:
+                for chunk in t.audio:
+                    await self.push_frame(
+                        InputAudioRawFrame(audio=chunk, sample_rate=t.sample_rate, num_channels=1)
+                    )
+                    await asyncio.sleep(AUDIO_CHUNK_SECONDS)
+            await self.push_frame(TranscriptionFrame(text, "counterparty", time.strftime("%Y-%m-%dT%H:%M:%S")))
+            t.reply.clear()
+            turn_end = time.monotonic()
+            await self.push_frame(VADUserStoppedSpeakingFrame())
+            try:
+                await asyncio.wait_for(t.reply.wait(), t.turn_timeout)
+                latency = t.first_audio_at - turn_end
+                stats.add("turn_response", latency)
+                if i == 0:
+                    stats.add("first_response", latency)
+            except asyncio.TimeoutError:
+                stats.error("turn_timeout")
+        t.disconnected_at = time.monotonic()
+        await t._call_event_handler("on_client_disconnected", t.client)
+
+
+class _FakeOutput(FrameProcessor):
+    """Marks when the bot's reply audio starts and when the reply is complete."""
+
+    def __init__(self, transport: "FakeTransport"):
+        super().__init__(name="FakeOutput")
+        self._transport = transport
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        t = self._transport
+        if isinstance(frame, TTSAudioRawFrame) and not t.reply.is_set():
+            t.first_audio_at = time.monotonic()
+        elif isinstance(frame, LLMFullResponseEndFrame):
+            t.reply.set()
+        await self.push_frame(frame, direction)
+
+
+class FakeTransport(BaseTransport):
+    """Local transport: canned counterparty turns in, bot replies observed out."""
+
+    def __init__(self, turns, audio, sample_rate, think_time, turn_timeout):
+        super().__init__(name="FakeTransport")
+        self.turns, self.audio, self.sample_rate = turns, audio, sample_rate
+        self.think_time, self.turn_timeout = think_time, turn_timeout
+        self.client = object()
+        self.reply = asyncio.Event()
+        self.first_audio_at = 0.0
+        self.disconnected_at = 0.0
+        self._input = _FakeInput(self)
+        self._output = _FakeOutput(self)
+        self._register_event_handler("on_client_connected")
+        self._register_event_handler("on_client_disconnected")
+
+    def input(self) -> FrameProcessor:
+        return self._input
+
+    def output(self) -> FrameProcessor:
+        return self._output
+
+
+class FakeRealtimeLLM(FrameProcessor):
+    """GeminiLiveLLMService stand-in: answers each user turn with text and silent audio."""
+
+    def __init__(self, reply_latency: float):
+        super().__init__(name="FakeRealtimeLLM")
+        self._reply_latency = reply_latency
+
+    async def process_frame(self, frame, direction):
+        await super().process_frame(frame, direction)
+        if isinstance(frame, LLMContextFrame):
+            # Like the realtime service, the context is consumed here rather than forwarded
+            await asyncio.sleep(self._reply_latency)
+            await self.push_frame(LLMFullResponseStartFrame())
+            await self.push_frame(LLMTextFrame(REPLY_TEXT))
+            await self.push_frame(TTSAudioRawFrame(audio=b"\0" * 960, sample_rate=24000, num_channels=1))
+            await self.push_frame(LLMFullResponseEndFrame())
+        else:
+            await self.push_frame(frame, direction)
+
+
+class EvalRecorder:
+    """eval_batcher stand-in: counts the rows post-call would evaluate."""
+
+    def __init__(self):
+        self.rows = 0
+
+    async def add(self, transcript: str, mode: str, expected_outcome: str, predicted: str | None = None) -> None:
+        self.rows += 1
+
+    async def flush(self) -> None:
+        pass
+
+
+def _stub_wandb(args) -> EvalRecorder:
+    """Run post-call's W&B stages against local stand-ins instead of W&B."""
+
+    async def judge_outcome(transcript: str, mode: str) -> dict:
+        # Stands in for the W&B Inference round trip
+        await asyncio.sleep(args.inference_latency)
+        outcome = "success" if random.random() < args.success_rate else "failure"
+        tactic = f"Calmly restate the cancellation and ask for a refund (variant {random.randint(0, 999)})."
+        return {
+            "outcome": outcome,
+            "tactic": tactic if outcome == "success" else "",
+            "judge": "remote",
+            "local": None,
+        }
+
+    spool = DatasetSpool(os.path.join(tempfile.mkdtemp(prefix="haggler-loadtest-"), "dataset.sqlite3"))
+    # Rows are spooled to local disk as in production; only the Weave upload is skipped
+    spool._upload = lambda rows: None
+    recorder = EvalRecorder()
+    post_call.judge_outcome = judge_outcome
+    post_call.dataset_spool = spool
+    post_call.eval_batcher = recorder
+    post_call.wandb_enabled = lambda: True
+    return recorder
+
+
+def _load_audio(path: str | None) -> tuple[list[bytes], int]:
+    """Split a 16-bit mono WAV into AUDIO_CHUNK_SECONDS chunks."""
+    if not path:
+        return [], 16000
+    with wave.open(path, "rb") as w:
+        if w.getnchannels() != 1 or w.getsampwidth() != 2:
+            raise SystemExit("--audio must be a 16-bit mono WAV")
+        rate = w.getframerate()
+        frames = w.readframes(w.getnframes())
+    step = int(rate * AUDIO_CHUNK_SECONDS) * 2
+    return [frames[i : i + step] for i in range(0, len(frames), step)], rate
+
+
+def _configure_env(args) -> None:
+    """Point every external dependency at local stand-ins (after bot.py loaded .env)."""
+    # Whatever .env holds, nothing here may reach W&B
+    os.environ.pop("WANDB_API_KEY", None)
+    os.environ["REDIS_URL"] = args.redis_url or ""
+    for var, value in (
+        ("CUSTOMER_NAME", "Load Test"),
+        ("CUSTOMER_EMAIL", "loadtest@example.com"),
+        ("CUSTOMER_PHONE", "555-0100"),
+        ("CUSTOMER_ORDER_NUMBER", "LT-0001"),
+    ):
+        os.environ.setdefault(var, value)
+    redis_store._url_loaded = False
+    if args.fakeredis:
+        try:
+            import fakeredis
+            import fakeredis.aioredis
+        except ImportError:
+            raise SystemExit("--fakeredis needs `pip install fakeredis[lua]`")
+        server = fakeredis.FakeServer()
+        sync_client = fakeredis.FakeRedis(server=server)
+        async_clients = weakref.WeakKeyDictionary()
+
+        def get_async_redis():
+            loop = asyncio.get_running_loop()
+            if loop not in async_clients:
+                async_clients[loop] = fakeredis.aioredis.FakeRedis(server=server)
+            return async_clients[loop]
+
+        # Every module resolved these names at import, so patch each binding
+        originals = {"get_redis": redis_store.get_redis, "get_async_redis": redis_store.get_async_redis}
+        replacements = {"get_redis": lambda: sync_client, "get_async_redis": get_async_redis}
+        for module in list(sys.modules.values()):
+            for name, original in originals.items():
+                if getattr(module, name, None) is original:
+                    setattr(module, name, replacements[name])
+
+
+def _instrument() -> dict:
+    """Wrap config fetch and post-call processing with timers; returns post-call counters."""
+    done = {"ok": 0, "failed": 0}
+    get_session_config = bot.get_session_config
+    process_job = post_call.process_job
+
+    async def timed_config(*a, **kw):
+        t0 = time.monotonic()
+        try:
+            return await get_session_config(*a, **kw)
+        finally:
+            stats.add("config_fetch", time.monotonic() - t0)
+
+    async def timed_process_job(job):
+        t0 = time.monotonic()
+        try:
+            result = await process_job(job)
+            done["ok"] += 1
+            return result
+        except Exception:
+            done["failed"] += 1
+            raise
+        finally:
+            stats.add("post_call", time.monotonic() - t0)
+
+    bot.get_session_config = timed_config
+    post_call.process_job = timed_process_job
+    return done
+
+
+async def _session(args, turns, audio, rate, llm_factory) -> None:
+    transport = FakeTransport(turns, audio, rate, args.think_time, args.turn_timeout)
+    t0 = time.monotonic()
+    try:
+        await bot.run_bot(transport, llm_factory=llm_factory)
+    except Exception:
+        stats.error("session_error")
+        raise
+    end = time.monotonic()
+    if transport.disconnected_at:
+        stats.add("teardown", end - transport.disconnected_at)
+    stats.add("session", end - t0)
+
+
+async def _run(args) -> dict:
+    turns = json.loads(Path(args.turns_file).read_text()) if args.turns_file else DEFAULT_TURNS
+    audio, rate = _load_audio(args.audio)
+    post_calls = _instrument()
+    eval_rows = _stub_wandb(args)
+
+    # One factory object for all sessions, so pre-warmed session resources can be reused
+    def llm_factory(config: dict) -> FakeRealtimeLLM:
+        return FakeRealtimeLLM(args.reply_latency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with semaphore:
+            try:
+                await _session(args, turns, audio, rate, llm_factory)
+            except Exception as e:
+                print(f"session failed: {e!r}")
+
+    cpu0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.monotonic()
+    await asyncio.gather(*(one() for _ in range(args.sessions)))
+    calls_done = time.monotonic()
+    # Let post-call processing catch up before measuring the totals
+    deadline = time.monotonic() + args.post_call_timeout
+    while sum(post_calls.values()) < args.sessions and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    wall = time.monotonic() - t0
+    await post_call.post_call_queue.stop()
+    cpu1 = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (cpu1.ru_utime - cpu0.ru_utime) + (cpu1.ru_stime - cpu0.ru_stime)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss_mb = cpu1.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "calls_wall_s": calls_done - t0,
+        "total_wall_s": wall,
+        "sessions_per_s": args.sessions / (calls_done - t0),
+        "post_calls": post_calls,
+        "eval_rows": eval_rows.rows,
+        "cpu_s": cpu,
+        "cpu_util": cpu / wall,
+        "peak_rss_mb": rss_mb,
+        "errors": stats.errors,
+        "stages": stats.summary(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20, help="Total sessions")
+    parser.add_argument("--concurrency", type=int, default=10, help="Sessions running at once")
+    parser.add_argument("--turns-file", help="JSON list of counterparty lines (default: a short refund call)")
+    parser.add_argument("--audio", help="16-bit mono WAV streamed before each turn (exercises Silero VAD)")
+    parser.add_argument("--think-time", type=float, default=0.2, help="Counterparty pause before each turn (s)")
+    parser.add_argument("--reply-latency", type=float, default=0.3, help="Fake realtime LLM reply delay (s)")
+    parser.add_argument("--turn-timeout", type=float, default=10.0, help="Give up waiting for a reply (s)")
+    parser.add_argument("--inference-latency", type=float, default=0.2, help="Stub outcome judge delay (s)")
+    parser.add_argument("--success-rate", type=float, default=0.5, help="Fraction of calls judged success")
+    parser.add_argument("--post-call-timeout", type=float, default=120.0, help="Max wait for post-call jobs (s)")
+    parser.add_argument("--redis-url", help="Local/throwaway Redis to use (never point this at production)")
+    parser.add_argument("--fakeredis", action="store_true", help="Use in-process fakeredis instead of Redis")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    _configure_env(args)
+    report = asyncio.run(_run(args))
+    print(
+        f"\n{report['sessions']} sessions, concurrency {report['concurrency']}: "
+        f"{report['sessions_per_s']:.2f} sessions/s, calls {report['calls_wall_s']:.1f}s, "
+        f"total incl. post-call {report['total_wall_s']:.1f}s"
+    )
+    print(
+        f"CPU {report['cpu_s']:.1f}s ({report['cpu_util']:.0%} of one core), peak RSS {report['peak_rss_mb']:.0f} MB, "
+        f"post-call ok={report['post_calls']['ok']} failed={report['post_calls']['failed']}, errors={report['errors']}"
+    )
+    print(f"\n{'stage':<16} {'n':>5} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for stage, s in report["stages"].items():
+        print(f"{stage:<16} {s['n']:>5} {s['p50_ms']:>9.1f} {s['p90_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,20 @@
 """Run Weave Evaluation for the haggler outcome classifier (native W&B evals).
 
 Uses Weave Dataset by name (seed + live examples added by bot). Same prompt/parse as bot (outcome.py).
-Requires: WANDB_API_KEY. Run from server dir: uv run scripts/run_outcome_eval.py
+Predictions are made first with the async client, at most --concurrency (HAGGLER_EVAL_CONCURRENCY,
+default 16) in flight, retrying rate limits; each is appended to a progress file keyed by
+transcript/mode/prompt/model, so an interrupted run resumes where it stopped and reruns only
+score new rows. The Evaluation then replays the recorded predictions.
+Requires: WANDB_API_KEY. Run from server dir: uv run scripts/run_outcome_eval.py [--concurrency N]
 Ref: https://docs.wandb.ai/weave/guides/core-types/evaluations
 """
 
+import argparse
 import asyncio
+import json
 import os
 import sys
+import time
 
 import weave
 from dotenv import load_dotenv
@@ -15,10 +22,22 @@ from weave import Dataset, Evaluation
 
 # server/ on path so outcome is importable
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from outcome import OUTCOME_DATASET_NAME, OutcomeModel, outcome_scorer
+from judge_cache import cache_key
+from outcome import (
+    INFERENCE_MODEL,
+    OUTCOME_DATASET_NAME,
+    OUTCOME_SYSTEM,
+    RecordedOutcomeModel,
+    apredict_outcome,
+    outcome_scorer,
+)
 
 load_dotenv(override=True)
 
+DEFAULT_PROGRESS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".spool", "outcome_eval_progress.jsonl"
+)
+
 # Seed examples; bootstrap dataset if not exists (bot adds row every run)
 OUTCOME_EXAMPLES = [
     {
@@ -55,7 +74,73 @@ def _get_or_create_outcome_dataset():
         return dataset
 
 
+def _progress_key(row: dict) -> str:
+    return cache_key("outcome", INFERENCE_MODEL, OUTCOME_SYSTEM, row.get("mode", "refund"), row["transcript"])
+
+
+def _load_progress(path: str) -> dict[str, str]:
+    """Progress key -> outcome for rows already scored (by this or an interrupted run)."""
+    done: dict[str, str] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                done[entry["key"]] = entry["outcome"]
+            except (ValueError, KeyError):
+                continue  # partial line from a killed run
+    return done
+
+
+async def _predict_all(rows: list[dict], done: dict[str, str], progress_path: str, concurrency: int) -> None:
+    """Score rows missing from done, concurrency-limited, appending each result to progress_path."""
+    todo = {}
+    for row in rows:
+        key = _progress_key(row)
+        if key not in done:
+            todo[key] = row
+    print(f"{len(rows) - len(todo)} of {len(rows)} rows already scored; predicting {len(todo)}")
+    if not todo:
+        return
+    os.makedirs(os.path.dirname(progress_path), exist_ok=True)
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    failed = 0
+
+    with open(progress_path, "a") as progress:
+
+        async def score(key: str, row: dict) -> None:
+            nonlocal failed
+            async with semaphore:
+                try:
+                    outcome = await apredict_outcome(row["transcript"], row.get("mode", "refund"))
+                except Exception as e:
+                    failed += 1
+                    print(f"Prediction failed ({e}); row will be retried on the next run")
+                    return
+            done[key] = outcome
+            progress.write(json.dumps({"key": key, "outcome": outcome}) + "\n")
+            progress.flush()
+            if len(done) % 100 == 0:
+                print(f"  {len(done)} scored ({time.monotonic() - started:.0f}s)")
+
+        await asyncio.gather(*(score(key, row) for key, row in todo.items()))
+    print(f"Predicted {len(todo) - failed} rows in {time.monotonic() - started:.1f}s ({failed} failed)")
+
+
 def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.getenv("HAGGLER_EVAL_CONCURRENCY", "16")),
+        help="Max in-flight W&B Inference requests",
+    )
+    parser.add_argument("--progress", default=DEFAULT_PROGRESS_PATH, help="Resumable progress file (JSONL)")
+    parser.add_argument("--restart", action="store_true", help="Ignore previous progress and rescore all rows")
+    args = parser.parse_args()
+
     if not os.environ.get("WANDB_API_KEY"):
         print("WANDB_API_KEY is not set (e.g. https://wandb.ai/authorize).")
         raise SystemExit(1)
@@ -64,12 +149,21 @@ def main() -> None:
     weave.init(project)
 
     dataset = _get_or_create_outcome_dataset()
+    rows = [dict(row) for row in dataset.rows]
+    done = {} if args.restart else _load_progress(args.progress)
+    asyncio.run(_predict_all(rows, done, args.progress, max(1, args.concurrency)))
+
+    # The Evaluation replays recorded predictions; rows that still failed are predicted inline
+    model = RecordedOutcomeModel()
+    for row in rows:
+        outcome = done.get(_progress_key(row))
+        if outcome is not None:
+            model.record(row["transcript"], row.get("mode", "refund"), outcome)
     evaluation = Evaluation(
         dataset=dataset,
         scorers=[outcome_scorer],
         evaluation_name="haggler-outcome-eval",
     )
-    model = OutcomeModel()
     asyncio.run(evaluation.evaluate(model))
     print("Eval done. Check the run in W&B.")
 
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Run post-call workers (outcome, evals, tactic updates) as a standalone process.
+
+Consumes the haggler:postcall Redis stream that bot.py enqueues to, so post-call
+throughput scales independently of live calls. Set HAGGLER_POSTCALL_WORKERS=0 on the
+bot to leave all post-call work to these processes.
+Run from server/: uv run python scripts/run_post_call_worker.py [--workers N]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+load_dotenv(Path(__file__).resolve().parent.parent / ".env", override=True)
+
+from metrics import start_metrics_server
+from outcome import init_weave
+from post_call import post_call_queue
+from redis_store import redis_url
+
+
+async def _run(workers: int) -> None:
+    post_call_queue.start(workers)
+    print(f"Post-call workers running ({workers}, consumer {post_call_queue.consumer}); Ctrl+C to stop")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await post_call_queue.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent jobs in this process")
+    args = parser.parse_args()
+    if not redis_url():
+        print("REDIS_URL not set in .env (the post-call queue needs Redis)")
+        raise SystemExit(1)
+    init_weave()
+    port = start_metrics_server()
+    if port:
+        print(f"Metrics on http://127.0.0.1:{port}/metrics")
+    try:
+        asyncio.run(_run(args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
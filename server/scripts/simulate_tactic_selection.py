@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Compare tactic selectors (thompson / ucb / rank) on a simulated refinement loop.
+
+Each tactic gets a hidden win rate; every simulated session injects --slots tactics chosen
+by tactic_stats.select_tactics and succeeds with the mean win rate of those tactics. Stats
+are updated as record_session_outcome would (in memory, no Redis). Reports the regret
+against always injecting the truly best tactics and how many of them are in the prompt by
+the end, averaged over --runs seeds.
+
+Run from server/: uv run python scripts/simulate_tactic_selection.py --tactics 200 --sessions 2000
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tactic_stats import SELECTORS, select_tactics  # noqa: E402
+
+
+def simulate(method: str, n_tactics: int, sessions: int, slots: int, seed: int) -> tuple[float, float]:
+    """Return (cumulative regret, fraction of the best `slots` tactics in the final prompt)."""
+    rng = random.Random(seed)
+    tactics = [f"tactic {i}" for i in range(n_tactics)]
+    # Most tactics are mediocre, a few are good
+    rates = {t: rng.betavariate(2, 5) for t in tactics}
+    best = sorted(tactics, key=lambda t: -rates[t])[:slots]
+    best_rate = sum(rates[t] for t in best) / slots
+    stats = {t: {"uses": 0, "wins": 0, "losses": 0, "last_win": 0} for t in tactics}
+    regret = 0.0
+    chosen: list[str] = []
+    for _ in range(sessions):
+        chosen = select_tactics(tactics, stats, budget=0, max_count=slots, method=method, rng=rng)
+        p = sum(rates[t] for t in chosen) / len(chosen)
+        regret += best_rate - p
+        won = rng.random() < p
+        for t in chosen:
+            st = stats[t]
+            st["uses"] += 1
+            if won:
+                st["wins"] += 1
+            else:
+                st["losses"] += 1
+    return regret, len(set(chosen) & set(best)) / slots
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tactics", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--slots", type=int, default=10, help="tactics injected per session")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    print(f"{'selector':<10} {'regret':>10} {'best in prompt':>15}")
+    for method in SELECTORS:
+        results = [simulate(method, args.tactics, args.sessions, args.slots, seed) for seed in range(args.runs)]
+        regret = sum(r for r, _ in results) / args.runs
+        found = sum(f for _, f in results) / args.runs
+        print(f"{method:<10} {regret:>10.1f} {found:>14.0%}")
+
+
+if __name__ == "__main__":
+    main()
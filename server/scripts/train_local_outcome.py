@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Train the local outcome classifier head (local_outcome) on labelled transcripts.
+
+Rows come from the Weave outcome dataset (seed + live examples; rows the local classifier
+labelled itself are skipped) and/or a JSONL file of {"transcript", "mode",
+"expected_outcome"} rows, so it can be trained offline. Prints held-out accuracy and how
+many rows clear the hybrid-mode confidence threshold, then saves the head.
+Run from server/: uv run python scripts/train_local_outcome.py [--jsonl rows.jsonl] [--no-weave]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+load_dotenv(Path(__file__).resolve().parent.parent / ".env", override=True)
+
+from local_outcome import LocalOutcomeClassifier, confidence_threshold, model_path
+
+
+def _weave_rows() -> list[dict]:
+    import weave
+
+    from outcome import OUTCOME_DATASET_NAME, init_weave
+
+    init_weave()
+    try:
+        dataset = weave.ref(OUTCOME_DATASET_NAME).get()
+    except Exception as e:
+        print(f"Could not load Weave dataset {OUTCOME_DATASET_NAME} ({e})")
+        return []
+    return [dict(row) for row in dataset.rows if row.get("judge") != "local"]
+
+
+def _jsonl_rows(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _accuracy(clf: LocalOutcomeClassifier, rows: list[dict]) -> tuple[float, float]:
+    """(accuracy, fraction of rows at or above the confidence threshold)."""
+    if not rows:
+        return 0.0, 0.0
+    probs = clf.predict_proba([r["transcript"] for r in rows], [r.get("mode", "refund") for r in rows])
+    correct = confident = 0
+    for p, row in zip(probs, rows):
+        pred = "success" if p >= 0.5 else "failure"
+        correct += pred == row["expected_outcome"]
+        confident += max(p, 1.0 - p) >= confidence_threshold()
+    return correct / len(rows), confident / len(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jsonl", help="Extra labelled rows (JSONL)")
+    parser.add_argument("--no-weave", action="store_true", help="Do not read the Weave dataset")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction held out for accuracy")
+    parser.add_argument("--out", default=str(model_path()), help="Where to save the head (.npz)")
+    args = parser.parse_args()
+
+    rows: list[dict] = []
+    if not args.no_weave and os.getenv("WANDB_API_KEY"):
+        rows += _weave_rows()
+    if args.jsonl:
+        rows += _jsonl_rows(args.jsonl)
+    rows = [r for r in rows if r.get("transcript", "").strip() and r.get("expected_outcome")]
+    if len({r["expected_outcome"] for r in rows}) < 2:
+        print(f"Need labelled success and failure rows (got {len(rows)} rows)")
+        raise SystemExit(1)
+
+    random.Random(0).shuffle(rows)
+    n_test = int(len(rows) * args.holdout) if len(rows) >= 10 else 0
+    test, train = rows[:n_test], rows[n_test:]
+    clf = LocalOutcomeClassifier.fit(
+        [r["transcript"] for r in train],
+        [r.get("mode", "refund") for r in train],
+        [r["expected_outcome"] for r in train],
+    )
+    train_acc, _ = _accuracy(clf, train)
+    print(f"Trained on {len(train)} rows: train accuracy {train_acc:.1%}")
+    if test:
+        test_acc, confident = _accuracy(clf, test)
+        print(
+            f"Held-out ({len(test)} rows): accuracy {test_acc:.1%}, "
+            f"{confident:.1%} at confidence >= {confidence_threshold():.2f} (answered locally in hybrid mode)"
+        )
+    print(f"Saved {clf.save(args.out)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Per-mode session config (system instruction + tactics), cached in-process.
+
+Tactic lists only change at session end, so each mode's tactic candidates are cached and
+keyed by a version stamp: the agent:tactics_version counter (INCR'd by tactic list writers)
+plus the lengths of agent:winning_tactics / agent:tactics (catches edits made outside the
+bot, e.g. redis-cli LPUSH). Checking the stamp is one pipelined round trip. With
+HAGGLER_CONFIG_PUBSUB=1 a background listener on the agent:tactics_changed channel marks
+entries stale instead, so a fresh entry is served with no Redis round trip; the stamp is
+still checked after each session start, off the hot path, for edits that don't publish.
+
+Which candidates go into the prompt is drawn per session: the bandit selector (tactic_stats,
+Thompson sampling by default) runs on the current win/loss stats and only tactics that fit
+the prompt budget are injected. Recording an outcome doesn't touch the version stamp. Each
+mode keeps one ready-made config per stamp, served at once and redrawn in the background
+after every session start; draws can also be made ahead of time (upcoming) so
+session_resources can pre-build the next call's components for the exact instruction it
+will get. With HAGGLER_TACTIC_RETRIEVAL=topk the candidates are first narrowed to the
+tactics most similar to the session's scenario (tactic_retrieval); a session that brings
+its own scenario text or first utterance gets a config built for it instead.
+"""
+
+import asyncio
+import os
+from collections import deque
+
+from loguru import logger
+
+from metrics import instrument
+from redis_store import (
+    REDIS_TACTICS_KEY,
+    REDIS_WINNING_KEY,
+    TACTICS_CHANNEL,
+    TACTICS_VERSION_KEY,
+    decode,
+    fetch_tactic_lists,
+    get_async_redis,
+)
+from tactic_retrieval import corpus_size, fetch_relevant_tactics, retrieval_mode
+from tactic_stats import (
+    bandit_candidates,
+    estimate_tokens,
+    fetch_tactic_stats,
+    select_tactics,
+    selector,
+)
+
+BASE_REFUND = (
+    "You are a customer on a voice call with customer support. You are seeking a refund for a flight cancellation. "
+    "Use the tactics provided. Stay in character as the customer. You are calling them; they answer. "
+    "When the support agent grants the refund, no need to ask for more details; if they refuse the refund, end the call, do not persist."
+)
+BASE_NEGOTIATION = (
+    "You are a customer on a voice call negotiating (e.g. a discount, booking, or deal). "
+    "Use the tactics provided. Stay in character as the customer. You are calling them; they answer."
+)
+
+
+def current_mode() -> str:
+    return os.getenv("HAGGLER_MODE", "refund").lower()
+
+
+def _caller_identity_block() -> str:
+    """Caller (customer) name, email, phone, order number for the bot to use when asked."""
+    name = os.getenv("CUSTOMER_NAME")
+    email = os.getenv("CUSTOMER_EMAIL")
+    phone = os.getenv("CUSTOMER_PHONE")
+    order = os.getenv("CUSTOMER_ORDER_NUMBER")
+    if not name or not email or not phone or not order:
+        raise ValueError(
+            "CUSTOMER_NAME, CUSTOMER_EMAIL, CUSTOMER_PHONE, CUSTOMER_ORDER_NUMBER must be set in .env."
+        )
+    return (
+        f"You are {name}. Your email is {email}, phone {phone}, order number {order}. "
+        "Provide these when the agent asks (e.g. for refund processing)."
+    )
+
+
+def scenario_query(mode: str, session_context: dict | None = None) -> str:
+    """Text embedded for top-k tactic retrieval: the mode's scenario, the caller context and,
+    when the session request carries them, "scenario" and "first_utterance"."""
+    base = BASE_REFUND if mode == "refund" else BASE_NEGOTIATION
+    parts = [base, _caller_identity_block(), os.getenv("HAGGLER_SCENARIO", "")]
+    for field in ("scenario", "first_utterance"):
+        value = (session_context or {}).get(field)
+        if isinstance(value, str):
+            parts.append(value)
+    return "\n".join(p.strip() for p in parts if p and p.strip())
+
+
+def _has_session_scenario(session_context: dict | None) -> bool:
+    context = session_context or {}
+    return any(isinstance(context.get(f), str) for f in ("scenario", "first_utterance"))
+
+
+def merge_tactics_for_prompt(winning: list[str], base_tactics: list[str]) -> list[str]:
+    """Winning tactics first, then base tactics not already present."""
+    seen = set(winning)
+    tactics = list(winning)
+    for t in base_tactics:
+        if t not in seen:
+            tactics.append(t)
+            seen.add(t)
+    return tactics
+
+
+def build_config(
+    mode: str,
+    winning: list[str],
+    base_tactics: list[str],
+    stats: dict[str, dict] | None = None,
+    corpus: int | None = None,
+) -> dict:
+    """Compile the system instruction for mode from the tactic lists.
+
+    Tactics are ordered by the tactic selector and trimmed to the prompt budget; prompt size
+    metrics are returned alongside (and end up in the Weave trace). corpus is the full
+    tactic count when the lists are already a subset (top-k retrieval, bandit pool).
+    """
+    base = BASE_REFUND if mode == "refund" else BASE_NEGOTIATION
+    base = f"{base}\n\n{_caller_identity_block()}"
+    available = merge_tactics_for_prompt(winning, base_tactics)
+    tactics = select_tactics(available, stats or {})
+    total = len(available) if corpus is None else corpus
+    if tactics:
+        base = f"{base}\n\nWinning tactics to use when appropriate:\n" + "\n".join(f"- {t}" for t in tactics)
+    return {
+        "system_instruction": base,
+        "tactics_count": len(tactics),
+        "tactics": tactics,
+        "mode": mode,
+        "tactics_available": total,
+        "tactics_candidates": len(available),
+        "tactics_dropped": total - len(tactics),
+        "prompt_chars": len(base),
+        "prompt_tokens_est": estimate_tokens(base),
+    }
+
+
+class SessionConfigCache:
+    """Tactic candidates per mode, rebuilt only when the tactics version stamp changes; the
+    tactic selection itself is drawn per session."""
+
+    def __init__(self):
+        self._entries: dict[str, tuple[tuple | None, dict]] = {}
+        # Modes whose entry is known current (only maintained while the pub/sub listener runs)
+        self._fresh: set[str] = set()
+        self._listener: asyncio.Task | None = None
+        self._subscribed = False
+        self._lock = asyncio.Lock()
+        # Bumped on every invalidation so a rebuild racing a change isn't marked fresh
+        self._generation = 0
+        # Configs drawn ahead of get() per mode: (candidates entry they were drawn from, config)
+        self._upcoming: dict[str, deque[tuple[dict, dict]]] = {}
+        # Ready-made config per mode for get() without an upcoming draw, same pairing
+        self._ready: dict[str, tuple[dict, dict]] = {}
+        self._redraws: dict[str, asyncio.Task] = {}
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._fresh.clear()
+
+    @instrument("haggler_redis_seconds", op="config_stamp")
+    async def _stamp(self) -> tuple | None:
+        r = get_async_redis()
+        if r is None:
+            return None
+        pipe = r.pipeline(transaction=False)
+        pipe.get(TACTICS_VERSION_KEY)
+        pipe.llen(REDIS_WINNING_KEY)
+        pipe.llen(REDIS_TACTICS_KEY)
+        version, n_winning, n_base = await pipe.execute()
+        return (decode(version) if version is not None else "0", n_winning, n_base)
+
+    async def _candidates(self, mode: str, session_context: dict | None = None) -> dict:
+        """The tactic lists a session config is drawn from (narrowed by retrieval / bandit pool)."""
+        if retrieval_mode() == "topk":
+            try:
+                query = scenario_query(mode, session_context)
+                winning, base_tactics = await fetch_relevant_tactics(query)
+                return {
+                    "mode": mode,
+                    "winning": winning,
+                    "base_tactics": base_tactics,
+                    "corpus": corpus_size(),
+                }
+            except Exception as e:
+                logger.warning(f"Top-k tactic retrieval failed ({e}); using the full tactic lists")
+        winning, base_tactics = await fetch_tactic_lists()
+        available = merge_tactics_for_prompt(winning, base_tactics)
+        corpus = None
+        if selector() != "rank":
+            # Large stores: only a bounded pool of candidates gets stats and a bandit score
+            pool = set(await bandit_candidates(available))
+            if len(pool) < len(available):
+                corpus = len(available)
+                winning = [t for t in winning if t in pool]
+                base_tactics = [t for t in base_tactics if t in pool]
+        return {"mode": mode, "winning": winning, "base_tactics": base_tactics, "corpus": corpus}
+
+    async def _draw(self, candidates: dict) -> dict:
+        """One session's config: the selector run on the candidates' current stats."""
+        winning, base_tactics = candidates["winning"], candidates["base_tactics"]
+        stats = await fetch_tactic_stats(merge_tactics_for_prompt(winning, base_tactics))
+        return build_config(
+            candidates["mode"], winning, base_tactics, stats, corpus=candidates["corpus"]
+        )
+
+    async def _current(self, mode: str, verify: bool = False) -> dict:
+        """Cached candidates for mode, rebuilt (with a ready-made config) if the stamp changed.
+
+        verify checks the stamp even when the pub/sub listener vouches for the entry.
+        """
+        self._ensure_listener()
+        entry = self._entries.get(mode)
+        if entry is not None and mode in self._fresh and not verify:
+            return entry[1]
+        async with self._lock:
+            generation = self._generation
+            stamp = await self._stamp()
+            entry = self._entries.get(mode)
+            if entry is not None and stamp is not None and entry[0] == stamp:
+                self._mark_fresh(mode, generation)
+                return entry[1]
+            candidates = await self._candidates(mode)
+            self._ready[mode] = (candidates, await self._draw(candidates))
+            self._entries[mode] = (stamp, candidates)
+            self._mark_fresh(mode, generation)
+            logger.debug(f"Rebuilt session tactic candidates mode={mode} stamp={stamp}")
+            return candidates
+
+    async def get(self, mode: str, session_context: dict | None = None) -> dict:
+        """Return a config for one session: a draw made ahead by upcoming() when there is one,
+        else the mode's ready-made config (a fresh one is drawn in the background).
+
+        In top-k retrieval mode, a session_context with its own scenario text gets candidates
+        retrieved for that session (not cached).
+        """
+        if retrieval_mode() == "topk" and _has_session_scenario(session_context):
+            return await self._draw(await self._candidates(mode, session_context))
+        candidates = await self._current(mode)
+        queue = self._upcoming.get(mode)
+        while queue:
+            drawn_from, config = queue.popleft()
+            if drawn_from is candidates:
+                return config
+        ready = self._ready.get(mode)
+        if ready is not None and ready[0] is candidates:
+            config = ready[1]
+        else:
+            config = await self._draw(candidates)
+        self._redraw_later(mode)
+        return config
+
+    def _redraw_later(self, mode: str) -> None:
+        task = self._redraws.get(mode)
+        if task is None or task.done():
+            self._redraws[mode] = asyncio.create_task(self._redraw(mode))
+
+    async def _redraw(self, mode: str) -> None:
+        """Check the stamp and replace the mode's ready-made config with a new draw."""
+        try:
+            candidates = await self._current(mode, verify=True)
+            config = await self._draw(candidates)
+            entry = self._entries.get(mode)
+            if entry is not None and entry[1] is candidates:
+                self._ready[mode] = (candidates, config)
+        except Exception as e:
+            logger.warning(f"Background session config draw failed ({e})")
+
+    async def upcoming(self, mode: str, n: int) -> list[dict]:
+        """The configs the next n get(mode) calls will return, drawing them now if needed."""
+        candidates = await self._current(mode)
+        queue = self._upcoming.setdefault(mode, deque())
+        while queue and queue[0][0] is not candidates:
+            queue.popleft()
+        while len(queue) < n:
+            queue.append((candidates, await self._draw(candidates)))
+        return [config for _, config in list(queue)[:n]]
+
+    def _mark_fresh(self, mode: str, generation: int) -> None:
+        if self._subscribed and generation == self._generation:
+            self._fresh.add(mode)
+
+    def _ensure_listener(self) -> None:
+        if os.getenv("HAGGLER_CONFIG_PUBSUB", "0") != "1":
+            return
+        if self._listener is None or self._listener.done():
+            self._fresh.clear()
+            if get_async_redis() is not None:
+                self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        r = get_async_redis()
+        pubsub = r.pubsub()
+        try:
+            await pubsub.subscribe(TACTICS_CHANNEL)
+            # Anything built before the subscription was active may have missed a change
+            self.invalidate()
+            self._subscribed = True
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    self.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Tactics change listener stopped ({e}); falling back to version checks")
+        finally:
+            self._subscribed = False
+            self.invalidate()
+            await pubsub.aclose()
+
+
+config_cache = SessionConfigCache()
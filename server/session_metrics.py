@@ -0,0 +1,101 @@
+"""Per-session pipeline latency observer (pipecat BaseObserver) feeding metrics.
+
+Watches frames as they move through the pipeline and records, per call:
+- time from client connected to the first bot audio,
+- per-turn response latency (UserStoppedSpeakingFrame -> BotStartedSpeakingFrame),
+- VAD stop-to-response gap (VADUserStoppedSpeakingFrame -> BotStartedSpeakingFrame),
+- realtime LLM TTFB from pipecat's MetricsFrame (PipelineParams.enable_metrics).
+Each is observed into the process histograms; summary() returns the call's numbers for
+the Weave trace.
+"""
+
+import time
+
+from pipecat.frames.frames import (
+    BotStartedSpeakingFrame,
+    MetricsFrame,
+    UserStoppedSpeakingFrame,
+    VADUserStoppedSpeakingFrame,
+)
+from pipecat.metrics.metrics import TTFBMetricsData
+from pipecat.observers.base_observer import BaseObserver, FramePushed
+
+import metrics
+
+# Frames hop through every processor; remember this many ids to count each frame once
+_SEEN_LIMIT = 1024
+
+
+class SessionMetricsObserver(BaseObserver):
+    def __init__(self, session_id: str):
+        super().__init__()
+        self.session_id = session_id
+        self.timings: dict[str, float] = {}
+        self.turn_latencies: list[float] = []
+        self.vad_gaps: list[float] = []
+        self.llm_ttfb: list[float] = []
+        self._connected_at: float | None = None
+        self._user_stopped_at: float | None = None
+        self._vad_stopped_at: float | None = None
+        self._seen: dict[int, None] = {}
+
+    def mark(self, name: str, seconds: float) -> None:
+        """Record a call-level timing measured outside the pipeline (e.g. config fetch)."""
+        self.timings[name] = seconds
+
+    def connected(self) -> None:
+        self._connected_at = time.monotonic()
+
+    def _first_sighting(self, frame) -> bool:
+        if frame.id in self._seen:
+            return False
+        self._seen[frame.id] = None
+        if len(self._seen) > _SEEN_LIMIT:
+            self._seen.pop(next(iter(self._seen)))
+        return True
+
+    async def on_push_frame(self, data: FramePushed):
+        frame = data.frame
+        if not isinstance(
+            frame, (BotStartedSpeakingFrame, UserStoppedSpeakingFrame, VADUserStoppedSpeakingFrame, MetricsFrame)
+        ) or not self._first_sighting(frame):
+            return
+        now = time.monotonic()
+        if isinstance(frame, VADUserStoppedSpeakingFrame):
+            self._vad_stopped_at = now
+        elif isinstance(frame, UserStoppedSpeakingFrame):
+            self._user_stopped_at = now
+        elif isinstance(frame, BotStartedSpeakingFrame):
+            if "first_bot_audio_s" not in self.timings and self._connected_at is not None:
+                self.timings["first_bot_audio_s"] = now - self._connected_at
+                metrics.observe("haggler_first_bot_audio_seconds", self.timings["first_bot_audio_s"])
+            if self._user_stopped_at is not None:
+                latency = now - self._user_stopped_at
+                self.turn_latencies.append(latency)
+                metrics.observe("haggler_turn_response_seconds", latency)
+                self._user_stopped_at = None
+            if self._vad_stopped_at is not None:
+                gap = now - self._vad_stopped_at
+                self.vad_gaps.append(gap)
+                metrics.observe("haggler_vad_stop_to_response_seconds", gap)
+                self._vad_stopped_at = None
+        else:
+            for item in frame.data:
+                if isinstance(item, TTFBMetricsData) and item.value:
+                    self.llm_ttfb.append(item.value)
+                    metrics.observe("haggler_llm_ttfb_seconds", item.value)
+
+    def summary(self) -> dict:
+        """Call-level numbers (seconds) for the Weave trace."""
+        out = {k: round(v, 4) for k, v in self.timings.items()}
+        for name, values in (
+            ("turn_response", self.turn_latencies),
+            ("vad_stop_to_response", self.vad_gaps),
+            ("llm_ttfb", self.llm_ttfb),
+        ):
+            if values:
+                ordered = sorted(values)
+                out[f"{name}_p50_s"] = round(ordered[len(ordered) // 2], 4)
+                out[f"{name}_max_s"] = round(ordered[-1], 4)
+        out["turns"] = len(self.turn_latencies)
+        return out
@@ -0,0 +1,233 @@
+"""Per-process session resources: one Silero VAD model, pre-built per-call components.
+
+SileroVADAnalyzer loads the Silero ONNX model (an onnxruntime InferenceSession) in its
+constructor, so every call paid the model load and kept its own copy in memory. Here the
+model file pipecat ships is loaded into one InferenceSession per process and shared: each
+call gets a SharedSileroVADAnalyzer (a plain pipecat VADAnalyzer) that carries only that
+call's recurrent state (onnxruntime sessions are safe to run concurrently). The analyzer
+mirrors pipecat's Silero inference for the pinned pipecat version, so the model's inputs and
+outputs are checked when it is loaded; without onnxruntime or the model file, or with a model
+of a different signature, calls fall back to pipecat's own SileroVADAnalyzer.
+
+SessionResourcePool keeps HAGGLER_PREWARM_SESSIONS (default 1) sets of per-call components
+(realtime LLM service + VAD analyzer) built ahead of time for the instructions the next
+sessions will get (session_config draws those ahead), so a new call only has to take one.
+bot.py fills it once at process start (prefill) and each take() refills it on the loop.
+Components are handed out once and never reused; a set built for an instruction no longer
+coming up (tactics changed) is discarded.
+"""
+
+import asyncio
+import importlib.resources
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import numpy as np
+from loguru import logger
+from pipecat.audio.vad.silero import SileroVADAnalyzer
+from pipecat.audio.vad.vad_analyzer import VADAnalyzer, VADParams
+from pipecat.processors.frame_processor import FrameProcessor
+
+VAD_STOP_SECS = 0.2
+# Model file inside the pipecat package (the one SileroVADAnalyzer loads)
+VAD_MODEL_PACKAGE = "pipecat.audio.vad.data"
+VAD_MODEL_FILE = "silero_vad.onnx"
+# The recurrent state is reset this often (as pipecat does) so it doesn't drift
+VAD_STATE_RESET_SECS = 5.0
+# Signature of the Silero model this analyzer drives (pipecat-ai 0.0.101)
+VAD_INPUTS = {"input", "state", "sr"}
+VAD_STATE_SHAPE = (2, 1, 128)
+
+_vad_session = None
+_vad_session_loaded = False
+_vad_lock = threading.Lock()
+
+
+def _load_vad_session():
+    import onnxruntime
+
+    opts = onnxruntime.SessionOptions()
+    opts.inter_op_num_threads = 1
+    opts.intra_op_num_threads = 1
+    model = importlib.resources.files(VAD_MODEL_PACKAGE).joinpath(VAD_MODEL_FILE)
+    with importlib.resources.as_file(model) as path:
+        session = onnxruntime.InferenceSession(
+            str(path), providers=["CPUExecutionProvider"], sess_options=opts
+        )
+    _check_vad_model(session)
+    return session
+
+
+def _check_vad_model(session) -> None:
+    """Raise if the model's inputs or outputs differ from what SharedSileroVADAnalyzer feeds it."""
+    names = {i.name for i in session.get_inputs()}
+    if names != VAD_INPUTS:
+        raise ValueError(f"unexpected Silero VAD inputs {sorted(names)}")
+    x = np.zeros((1, 64 + 512), dtype=np.float32)
+    state = np.zeros(VAD_STATE_SHAPE, dtype=np.float32)
+    outputs = session.run(None, {"input": x, "state": state, "sr": np.array(16000, dtype=np.int64)})
+    if len(outputs) != 2 or np.size(outputs[0]) != 1 or np.shape(outputs[1]) != VAD_STATE_SHAPE:
+        raise ValueError(f"unexpected Silero VAD outputs {[np.shape(o) for o in outputs]}")
+
+
+def _shared_vad_session():
+    """The process-wide Silero InferenceSession (loaded on first use), or None if unavailable."""
+    global _vad_session, _vad_session_loaded
+    if not _vad_session_loaded:
+        with _vad_lock:
+            if not _vad_session_loaded:
+                try:
+                    _vad_session = _load_vad_session()
+                    logger.info("Loaded shared Silero VAD model")
+                except Exception as e:
+                    logger.warning(f"Shared Silero VAD unavailable ({e}); loading the model per call")
+                _vad_session_loaded = True
+    return _vad_session
+
+
+def warm_vad(background: bool = True) -> None:
+    """Load the shared VAD model now (in a daemon thread by default)."""
+    if background:
+        threading.Thread(target=_shared_vad_session, name="vad-warmup", daemon=True).start()
+    else:
+        _shared_vad_session()
+
+
+class SharedSileroVADAnalyzer(VADAnalyzer):
+    """Silero VAD on a shared InferenceSession; only the recurrent state belongs to the call."""
+
+    def __init__(self, session, *, sample_rate: int | None = None, params: VADParams | None = None):
+        super().__init__(sample_rate=sample_rate, params=params)
+        self._session = session
+        self._reset_state()
+
+    def _reset_state(self) -> None:
+        self._state = np.zeros(VAD_STATE_SHAPE, dtype=np.float32)
+        self._context = np.zeros((1, 0), dtype=np.float32)
+        self._state_since = time.monotonic()
+
+    def set_sample_rate(self, sample_rate: int) -> None:
+        if sample_rate not in (8000, 16000):
+            raise ValueError(f"Silero VAD needs a 16000 or 8000 Hz sample rate (got {sample_rate})")
+        super().set_sample_rate(sample_rate)
+        self._reset_state()
+
+    def num_frames_required(self) -> int:
+        return 512 if self.sample_rate == 16000 else 256
+
+    def voice_confidence(self, buffer) -> float:
+        try:
+            audio = np.frombuffer(buffer, np.int16).astype(np.float32) / 32768.0
+            context_size = 64 if self.sample_rate == 16000 else 32
+            if self._context.shape[1] != context_size:
+                self._context = np.zeros((1, context_size), dtype=np.float32)
+            x = np.concatenate((self._context, audio[np.newaxis, :]), axis=1)
+            sr = np.array(self.sample_rate, dtype=np.int64)
+            out, self._state = self._session.run(None, {"input": x, "state": self._state, "sr": sr})
+            self._context = x[:, -context_size:]
+            if time.monotonic() - self._state_since >= VAD_STATE_RESET_SECS:
+                self._reset_state()
+            return float(np.ravel(out)[0])
+        except Exception as e:
+            logger.error(f"Error analyzing audio with shared Silero VAD: {e}")
+            return 0.0
+
+
+def create_vad_analyzer() -> VADAnalyzer:
+    params = VADParams(stop_secs=VAD_STOP_SECS)
+    session = _shared_vad_session()
+    if session is None:
+        return SileroVADAnalyzer(params=params)
+    return SharedSileroVADAnalyzer(session, params=params)
+
+
+@dataclass
+class SessionResources:
+    system_instruction: str
+    llm_factory: Callable[[dict], FrameProcessor]
+    llm: FrameProcessor
+    vad_analyzer: VADAnalyzer
+
+
+def prewarm_size() -> int:
+    return int(os.getenv("HAGGLER_PREWARM_SESSIONS", "1"))
+
+
+class SessionResourcePool:
+    """Ready-to-use per-call components for the upcoming system instructions."""
+
+    def __init__(self):
+        self._ready: list[SessionResources] = []
+        self._refill: asyncio.Task | None = None
+
+    @staticmethod
+    def build(config: dict, llm_factory: Callable[[dict], FrameProcessor]) -> SessionResources:
+        return SessionResources(
+            system_instruction=config["system_instruction"],
+            llm_factory=llm_factory,
+            llm=llm_factory(config),
+            vad_analyzer=create_vad_analyzer(),
+        )
+
+    def take(
+        self,
+        config: dict,
+        llm_factory: Callable[[dict], FrameProcessor],
+        upcoming: Callable[[int], Awaitable[list[dict]]] | None = None,
+    ) -> SessionResources:
+        """A pre-built set matching config (else a fresh one); refills the pool in the background.
+
+        upcoming(n) returns the configs the next n sessions will get; without it the pool
+        pre-builds for config again.
+        """
+        resources = None
+        for i, candidate in enumerate(self._ready):
+            if (
+                candidate.system_instruction == config["system_instruction"]
+                and candidate.llm_factory is llm_factory
+            ):
+                resources = self._ready.pop(i)
+                break
+        if resources is None:
+            resources = self.build(config, llm_factory)
+        if prewarm_size() > 0 and (self._refill is None or self._refill.done()):
+            self._refill = asyncio.create_task(self._fill(config, llm_factory, upcoming))
+        return resources
+
+    def prefill(self, configs: list[dict], llm_factory: Callable[[dict], FrameProcessor]) -> None:
+        """Build sets for configs now; called at process start, before the event loop runs."""
+        for config in configs[: prewarm_size()]:
+            self._ready.append(self.build(config, llm_factory))
+
+    async def _fill(
+        self,
+        config: dict,
+        llm_factory: Callable[[dict], FrameProcessor],
+        upcoming: Callable[[int], Awaitable[list[dict]]] | None,
+    ) -> None:
+        # Yield first so the session that triggered the refill starts without waiting on it
+        await asyncio.sleep(0)
+        try:
+            targets = await upcoming(prewarm_size()) if upcoming else [config] * prewarm_size()
+            wanted = [c["system_instruction"] for c in targets]
+            kept = []
+            for resources in self._ready:
+                if resources.llm_factory is llm_factory and resources.system_instruction in wanted:
+                    wanted.remove(resources.system_instruction)
+                    kept.append(resources)
+            self._ready = kept
+            # The model load is the only slow part; LLM services are built on the loop
+            await asyncio.to_thread(_shared_vad_session)
+            for target in targets:
+                if target["system_instruction"] in wanted:
+                    wanted.remove(target["system_instruction"])
+                    self._ready.append(self.build(target, llm_factory))
+                    await asyncio.sleep(0)
+        except Exception as e:
+            logger.warning(f"Pre-warming session resources failed ({e})")
+
+
+session_pool = SessionResourcePool()
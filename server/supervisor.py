@@ -0,0 +1,420 @@
+"""Supervisor mode: a pool of bot.py worker processes behind one /start endpoint.
+
+One bot.py process runs every call's VAD, transcript and embedding work under a single
+GIL. The supervisor starts HAGGLER_WORKERS (default: CPU count) bot.py processes on
+local ports and fronts them with the same HTTP API the pipecat runner serves:
+
+- POST /start and new POST /api/offer requests go to the least-loaded healthy worker
+  below HAGGLER_WORKER_MAX_SESSIONS (503 when every worker is full or draining). Load is
+  the worker's active-session counter in Redis (bot.run_bot, haggler:worker:<id>:sessions)
+  plus sessions assigned in the last few seconds that have not started yet (an assignment
+  is dropped once haggler:worker:<id>:started shows the worker picked it up).
+- /sessions/<id>/... and ICE PATCHes follow the session to the worker that owns it
+  (haggler:route:<id> in Redis). Everything else (the /client UI) goes to any worker.
+- Workers are health-checked every HAGGLER_WORKER_HEALTH_INTERVAL seconds and restarted
+  when they exit or fail HAGGLER_WORKER_HEALTH_FAILURES checks in a row.
+- Shutdown (SIGTERM / Ctrl-C) drains: no new sessions, wait up to HAGGLER_DRAIN_TIMEOUT
+  for running calls to end, then stop the workers. POST /supervisor/workers/<i>/restart
+  drains and restarts one worker (rolling restarts).
+
+Tactics, session config and post-call jobs already live in Redis, so workers share them.
+
+Run from server/::
+    uv run supervisor.py --workers 4 --port 7860
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+import uvicorn
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request, Response
+from loguru import logger
+
+from redis_store import (
+    SESSION_ROUTE_PREFIX,
+    decode,
+    get_async_redis,
+    worker_sessions_key,
+    worker_started_key,
+)
+
+load_dotenv(override=True)
+
+SERVER_DIR = Path(__file__).resolve().parent
+# Seconds an assignment counts toward load if the worker never reports starting it
+# (the client never connected, or no Redis to report through)
+ASSIGN_GRACE_SECONDS = 15.0
+ROUTE_TTL = 86400
+# Response headers that describe the upstream connection, not the body we forward
+HOP_HEADERS = {"connection", "content-encoding", "content-length", "keep-alive", "transfer-encoding"}
+
+
+@dataclass
+class Worker:
+    index: int
+    port: int
+    process: subprocess.Popen | None = None
+    healthy: bool = False
+    draining: bool = False
+    failures: int = 0
+    active: int = 0
+    # Assignment times not yet reflected in active, oldest first
+    assigned: list[float] = field(default_factory=list)
+    # Worker's started-sessions counter at the last refresh (None until first read)
+    started: int | None = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def load(self) -> int:
+        cutoff = time.monotonic() - ASSIGN_GRACE_SECONDS
+        self.assigned = [t for t in self.assigned if t > cutoff]
+        return self.active + len(self.assigned)
+
+    def report(self, active: int, started: int) -> None:
+        """Record counters read from Redis; sessions started since the last read are already
+        in active, so their pending assignments stop counting."""
+        if self.started is not None and started > self.started:
+            del self.assigned[: started - self.started]
+        self.active, self.started = max(active, 0), started
+
+
+class Supervisor:
+    def __init__(self, workers: int, base_port: int, max_sessions: int):
+        self.workers = [Worker(index=i, port=base_port + i) for i in range(workers)]
+        self.max_sessions = max_sessions
+        self.health_interval = float(os.getenv("HAGGLER_WORKER_HEALTH_INTERVAL", "5"))
+        self.max_failures = int(os.getenv("HAGGLER_WORKER_HEALTH_FAILURES", "3"))
+        self.drain_timeout = float(os.getenv("HAGGLER_DRAIN_TIMEOUT", "600"))
+        self.shutting_down = False
+        self.client = httpx.AsyncClient(timeout=30.0)
+        self._routes: dict[str, int] = {}
+        self._assign_lock = asyncio.Lock()
+        self._health_task: asyncio.Task | None = None
+        self._restarts: set[asyncio.Task] = set()
+
+    # Worker processes
+
+    async def spawn(self, worker: Worker) -> None:
+        """Start (or restart) a bot.py worker with a fresh session counter."""
+        r = get_async_redis()
+        if r is not None:
+            await r.delete(worker_sessions_key(str(worker.index)), worker_started_key(str(worker.index)))
+        env = {**os.environ, "HAGGLER_WORKER_ID": str(worker.index)}
+        metrics_port = int(os.getenv("HAGGLER_METRICS_PORT", "0"))
+        if metrics_port:
+            env["HAGGLER_METRICS_PORT"] = str(metrics_port + worker.index)
+        worker.process = subprocess.Popen(
+            [sys.executable, "bot.py", "--host", "127.0.0.1", "--port", str(worker.port)],
+            cwd=SERVER_DIR,
+            env=env,
+            # Own process group: Ctrl-C reaches the supervisor only, which then drains
+            start_new_session=True,
+        )
+        worker.healthy, worker.failures, worker.active, worker.assigned = False, 0, 0, []
+        worker.started = 0 if r is not None else None
+        logger.info(f"Started worker {worker.index} pid={worker.process.pid} port={worker.port}")
+
+    def stop(self, worker: Worker, timeout: float = 10.0) -> None:
+        if not worker.alive():
+            return
+        worker.process.terminate()
+        try:
+            worker.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            worker.process.kill()
+            worker.process.wait()
+        worker.healthy = False
+
+    async def start(self) -> None:
+        if get_async_redis() is None:
+            logger.warning("REDIS_URL unset: worker load is estimated from recent assignments only")
+        for worker in self.workers:
+            await self.spawn(worker)
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    # Health and load
+
+    async def _check(self, worker: Worker) -> None:
+        if not worker.alive():
+            if not self.shutting_down and not worker.draining:
+                logger.warning(f"Worker {worker.index} exited; restarting")
+                await self.spawn(worker)
+            return
+        try:
+            resp = await self.client.get(worker.url + "/", timeout=2.0)
+            ok = resp.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            if not worker.healthy:
+                logger.info(f"Worker {worker.index} ready")
+            worker.healthy, worker.failures = True, 0
+            return
+        worker.failures += 1
+        # A starting worker is not ready yet; only a worker that was serving gets restarted
+        if worker.healthy and worker.failures >= self.max_failures:
+            logger.warning(f"Worker {worker.index} failed {worker.failures} health checks; restarting")
+            await asyncio.to_thread(self.stop, worker)
+            await self.spawn(worker)
+
+    async def refresh_load(self) -> None:
+        """Read every worker's session counters from Redis in one round trip."""
+        r = get_async_redis()
+        if r is None:
+            return
+        keys = []
+        for w in self.workers:
+            keys += [worker_sessions_key(str(w.index)), worker_started_key(str(w.index))]
+        raw = await r.mget(keys)
+        for i, worker in enumerate(self.workers):
+            worker.report(int(raw[2 * i] or 0), int(raw[2 * i + 1] or 0))
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.gather(*(self._check(w) for w in self.workers))
+                await self.refresh_load()
+            except Exception as e:
+                logger.warning(f"Worker health check failed ({e})")
+            await asyncio.sleep(self.health_interval)
+
+    async def assign(self) -> Worker | None:
+        """Least-loaded healthy worker with room for one more session (reserved), or None."""
+        if self.shutting_down:
+            return None
+        async with self._assign_lock:
+            try:
+                await self.refresh_load()
+            except Exception as e:
+                logger.warning(f"Worker load refresh failed ({e})")
+            candidates = [
+                w for w in self.workers
+                if w.healthy and not w.draining and w.alive() and w.load() < self.max_sessions
+            ]
+            if not candidates:
+                return None
+            worker = min(candidates, key=lambda w: (w.load(), w.index))
+            worker.assigned.append(time.monotonic())
+            return worker
+
+    async def drain(self, worker: Worker) -> None:
+        """Stop assigning to worker and wait (up to drain_timeout) for its calls to end."""
+        worker.draining = True
+        deadline = time.monotonic() + self.drain_timeout
+        while time.monotonic() < deadline:
+            try:
+                await self.refresh_load()
+            except Exception:
+                pass
+            if worker.load() == 0 or not worker.alive():
+                return
+            await asyncio.sleep(1.0)
+        logger.warning(f"Worker {worker.index} still has {worker.load()} sessions after drain timeout")
+
+    async def restart(self, worker: Worker) -> None:
+        try:
+            await self.drain(worker)
+            await asyncio.to_thread(self.stop, worker)
+            await self.spawn(worker)
+        finally:
+            # If the restart failed, the health loop respawns the worker
+            worker.draining = False
+
+    def restart_in_background(self, worker: Worker) -> None:
+        """Drain and restart worker in a task that is kept until done; failures are logged."""
+        task = asyncio.create_task(self.restart(worker))
+        self._restarts.add(task)
+
+        def done(t: asyncio.Task) -> None:
+            self._restarts.discard(t)
+            if not t.cancelled() and t.exception() is not None:
+                logger.opt(exception=t.exception()).error(f"Restarting worker {worker.index} failed")
+
+        task.add_done_callback(done)
+
+    async def shutdown(self) -> None:
+        self.shutting_down = True
+        for task in list(self._restarts):
+            task.cancel()
+        await asyncio.gather(*self._restarts, return_exceptions=True)
+        logger.info("Draining workers")
+        await asyncio.gather(*(self.drain(w) for w in self.workers))
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for worker in self.workers:
+            await asyncio.to_thread(self.stop, worker)
+        await self.client.aclose()
+
+    # Session routing
+
+    async def remember(self, key: str, worker: Worker) -> None:
+        self._routes[key] = worker.index
+        r = get_async_redis()
+        if r is not None:
+            await r.set(SESSION_ROUTE_PREFIX + key, worker.index, ex=ROUTE_TTL)
+
+    async def route(self, key: str) -> Worker | None:
+        index = self._routes.get(key)
+        if index is None:
+            r = get_async_redis()
+            raw = await r.get(SESSION_ROUTE_PREFIX + key) if r is not None else None
+            if raw is None:
+                return None
+            index = self._routes[key] = int(decode(raw))
+        return self.workers[index] if index < len(self.workers) else None
+
+    def any_worker(self) -> Worker | None:
+        ready = [w for w in self.workers if w.healthy and w.alive()]
+        return min(ready, key=lambda w: w.load()) if ready else None
+
+    async def forward(self, worker: Worker, request: Request, path: str, body: bytes | None = None) -> Response:
+        """Replay request against worker; body overrides the (already consumed) request body."""
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+        try:
+            resp = await self.client.request(
+                request.method,
+                worker.url + path,
+                params=request.query_params,
+                content=await request.body() if body is None else body,
+                headers=headers,
+            )
+        except httpx.HTTPError as e:
+            logger.warning(f"Worker {worker.index} request failed ({e})")
+            return Response("Worker unavailable", status_code=502)
+        out_headers = {k: v for k, v in resp.headers.items() if k.lower() not in HOP_HEADERS}
+        return Response(resp.content, status_code=resp.status_code, headers=out_headers)
+
+
+def create_app(supervisor: Supervisor) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await supervisor.start()
+        try:
+            yield
+        finally:
+            await supervisor.shutdown()
+
+    app = FastAPI(lifespan=lifespan)
+    busy = lambda: Response("All bot workers are busy", status_code=503)  # noqa: E731
+
+    @app.get("/supervisor/workers")
+    async def workers():
+        return [
+            {
+                "index": w.index,
+                "port": w.port,
+                "pid": w.process.pid if w.process else None,
+                "alive": w.alive(),
+                "healthy": w.healthy,
+                "draining": w.draining,
+                "active_sessions": w.active,
+                "load": w.load(),
+            }
+            for w in supervisor.workers
+        ]
+
+    @app.post("/supervisor/workers/{index}/restart")
+    async def restart_worker(index: int):
+        if not 0 <= index < len(supervisor.workers):
+            return Response("Unknown worker", status_code=404)
+        supervisor.restart_in_background(supervisor.workers[index])
+        return {"status": "draining"}
+
+    @app.post("/start")
+    async def start(request: Request):
+        worker = await supervisor.assign()
+        if worker is None:
+            return busy()
+        resp = await supervisor.forward(worker, request, "/start")
+        if resp.status_code == 200:
+            try:
+                await supervisor.remember(json.loads(resp.body)["sessionId"], worker)
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Worker {worker.index} /start returned no sessionId ({e})")
+        return resp
+
+    @app.api_route("/sessions/{session_id}/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+    async def session_proxy(session_id: str, path: str, request: Request):
+        worker = await supervisor.route(session_id)
+        if worker is None:
+            return Response(content="Invalid or not-yet-ready session_id", status_code=404)
+        return await supervisor.forward(worker, request, f"/sessions/{session_id}/{path}")
+
+    @app.api_route("/api/offer", methods=["POST", "PATCH"])
+    async def offer(request: Request):
+        body = await request.body()
+        try:
+            pc_id = json.loads(body or b"{}").get("pc_id")
+        except ValueError:
+            pc_id = None
+        # Renegotiation and ICE candidates belong to the worker holding the peer connection
+        worker = await supervisor.route(f"pc:{pc_id}") if pc_id else None
+        if worker is None:
+            if request.method == "PATCH":
+                return Response("Unknown pc_id", status_code=404)
+            worker = await supervisor.assign()
+            if worker is None:
+                return busy()
+        resp = await supervisor.forward(worker, request, "/api/offer", body=body)
+        if request.method == "POST" and resp.status_code == 200:
+            try:
+                await supervisor.remember(f"pc:{json.loads(resp.body)['pc_id']}", worker)
+            except (ValueError, KeyError):
+                pass
+        return resp
+
+    @app.api_route("/{path:path}", methods=["GET"])
+    async def passthrough(path: str, request: Request):
+        worker = supervisor.any_worker()
+        if worker is None:
+            return busy()
+        return await supervisor.forward(worker, request, f"/{path}")
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run bot.py as a pool of worker processes")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("HAGGLER_WORKERS", "0")) or os.cpu_count() or 1
+    )
+    parser.add_argument(
+        "--worker-base-port",
+        type=int,
+        default=int(os.getenv("HAGGLER_WORKER_BASE_PORT", "0")) or None,
+        help="first worker port (default: --port + 1)",
+    )
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=int(os.getenv("HAGGLER_WORKER_MAX_SESSIONS", "8")),
+        help="per-worker session cap",
+    )
+    args = parser.parse_args()
+    supervisor = Supervisor(args.workers, args.worker_base_port or args.port + 1, args.max_sessions)
+    logger.info(
+        f"Supervisor on http://{args.host}:{args.port} workers={args.workers} "
+        f"max_sessions_per_worker={args.max_sessions}"
+    )
+    uvicorn.run(create_app(supervisor), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
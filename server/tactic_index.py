@@ -0,0 +1,182 @@
+"""In-memory NumPy similarity index over tactic embeddings, one per Redis list key.
+
+Each TacticIndex keeps a contiguous float32 matrix (one normalized row per tactic) so
+"max similarity to any existing tactic" is a single matrix-vector product and full-list
+near-duplicate clustering is a handful of blocked matrix products. tactic_vectors keeps
+the indexes in sync as it adds/removes tactics; load_index() reloads from Redis when the
+list was changed by another process.
+"""
+
+import threading
+
+import numpy as np
+
+EMBED_DIM = 384
+# Rows per block when clustering a whole list (bounds the similarity matrix to BLOCK x n)
+CLUSTER_BLOCK = 1024
+
+
+def as_matrix(vecs) -> np.ndarray:
+    """Stack vectors into a C-contiguous float32 (n, dim) matrix."""
+    if isinstance(vecs, np.ndarray):
+        return np.ascontiguousarray(vecs, dtype=np.float32).reshape(len(vecs), -1)
+    if not vecs:
+        return np.empty((0, EMBED_DIM), dtype=np.float32)
+    return np.asarray(vecs, dtype=np.float32)
+
+
+class TacticIndex:
+    """Growable float32 matrix of tactic vectors with O(1) add/remove by tactic text."""
+
+    def __init__(self, dim: int = EMBED_DIM):
+        self.dim = dim
+        self.tactics: list[str] = []
+        self._rows: dict[str, int] = {}
+        self._row_tactics: list[str] = []
+        self._buf = np.empty((16, dim), dtype=np.float32)
+        self.lock = threading.RLock()
+        # Redis list length, last element and rewrite counter when last synced
+        # (see tactic_vectors.load_index)
+        self.list_len: int | None = None
+        self.tail: str | None = None
+        self.rewrites: int | None = None
+        # Bumped whenever existing rows move or disappear (remove / clear); appends keep it
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._row_tactics)
+
+    def __contains__(self, tactic: str) -> bool:
+        return tactic in self._rows
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """View of the live rows (row order is not list order; see row_tactics)."""
+        return self._buf[: len(self._row_tactics)]
+
+    @property
+    def row_tactics(self) -> list[str]:
+        return self._row_tactics
+
+    def _grow(self, extra: int) -> None:
+        need = len(self._row_tactics) + extra
+        if need <= len(self._buf):
+            return
+        cap = max(need, 2 * len(self._buf))
+        buf = np.empty((cap, self.dim), dtype=np.float32)
+        buf[: len(self._row_tactics)] = self.matrix
+        self._buf = buf
+
+    def add(self, tactic: str, vec) -> None:
+        self.add_many([tactic], [vec])
+
+    def add_many(self, tactics: list[str], vecs) -> None:
+        """Append tactics (in list order) with their vectors; already-indexed tactics are skipped."""
+        mat = as_matrix(vecs)
+        with self.lock:
+            fresh = [i for i, t in enumerate(tactics) if t not in self._rows]
+            if not fresh:
+                return
+            self._grow(len(fresh))
+            start = len(self._row_tactics)
+            self._buf[start : start + len(fresh)] = mat[fresh]
+            for offset, i in enumerate(fresh):
+                t = tactics[i]
+                self._rows[t] = start + offset
+                self._row_tactics.append(t)
+                self.tactics.append(t)
+
+    def remove(self, tactic: str) -> bool:
+        """Drop tactic (swap-with-last row). Return False if it wasn't indexed."""
+        with self.lock:
+            row = self._rows.pop(tactic, None)
+            if row is None:
+                return False
+            last = len(self._row_tactics) - 1
+            if row != last:
+                moved = self._row_tactics[last]
+                self._buf[row] = self._buf[last]
+                self._row_tactics[row] = moved
+                self._rows[moved] = row
+            self._row_tactics.pop()
+            self.tactics.remove(tactic)
+            self.generation += 1
+            return True
+
+    def clear(self) -> None:
+        with self.lock:
+            self.tactics.clear()
+            self._rows.clear()
+            self._row_tactics.clear()
+            self.list_len = None
+            self.tail = None
+            self.rewrites = None
+            self.generation += 1
+
+    def vector(self, tactic: str) -> np.ndarray | None:
+        row = self._rows.get(tactic)
+        return None if row is None else self._buf[row]
+
+    def max_similarity(self, vec) -> tuple[float, str | None]:
+        """Return (best cosine similarity, most similar tactic); (0.0, None) when empty."""
+        with self.lock:
+            if not self._row_tactics or vec is None or len(vec) != self.dim:
+                return 0.0, None
+            scores = self.matrix @ np.asarray(vec, dtype=np.float32)
+            best = int(np.argmax(scores))
+            return float(scores[best]), self._row_tactics[best]
+
+    def max_similarities(self, vecs, exclude=()) -> np.ndarray:
+        """Best similarity to any indexed tactic (other than those in exclude) for each row of
+        vecs (one matrix product)."""
+        mat = as_matrix(vecs)
+        with self.lock:
+            if not self._row_tactics or not len(mat):
+                return np.zeros(len(mat), dtype=np.float32)
+            sims = mat @ self.matrix.T
+            skip = [self._rows[t] for t in exclude if t in self._rows]
+            if skip:
+                sims[:, skip] = -1.0
+            return sims.max(axis=1)
+
+
+def dedupe_mask(matrix: np.ndarray, threshold: float) -> np.ndarray:
+    """Keep-first near-duplicate clustering: True for rows that are not within threshold of
+    an earlier kept row. Rows are processed in blocks so memory stays O(block * n)."""
+    matrix = as_matrix(matrix)
+    n = len(matrix)
+    keep = np.zeros(n, dtype=bool)
+    for start in range(0, n, CLUSTER_BLOCK):
+        block = matrix[start : start + CLUSTER_BLOCK]
+        kept_before = np.flatnonzero(keep[:start])
+        if len(kept_before):
+            dup_of_earlier = (block @ matrix[kept_before].T).max(axis=1) >= threshold
+        else:
+            dup_of_earlier = np.zeros(len(block), dtype=bool)
+        inner = block @ block.T
+        block_keep = np.zeros(len(block), dtype=bool)
+        for i in range(len(block)):
+            if dup_of_earlier[i]:
+                continue
+            if not (inner[i, :i][block_keep[:i]] >= threshold).any():
+                block_keep[i] = True
+        keep[start : start + len(block)] = block_keep
+    return keep
+
+
+_indexes: dict[str, TacticIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def index_for(list_key: str) -> TacticIndex:
+    """Process-wide index for list_key (created empty on first use)."""
+    with _indexes_lock:
+        index = _indexes.get(list_key)
+        if index is None:
+            index = _indexes[list_key] = TacticIndex()
+        return index
+
+
+def drop_index(list_key: str) -> None:
+    with _indexes_lock:
+        _indexes.pop(list_key, None)
@@ -0,0 +1,187 @@
+"""Semantic top-k tactic retrieval for the session prompt.
+
+With HAGGLER_TACTIC_RETRIEVAL=topk, session_config embeds a short scenario query (mode,
+caller context, optional scenario text / first utterance from the session request) and
+injects only the HAGGLER_RETRIEVAL_TOP_K tactics closest to it from agent:winning_tactics
+and agent:tactics, instead of the full lists. Candidates then go through the usual stats
+ranking and prompt budget (tactic_stats.select_tactics).
+
+Search runs against the in-memory tactic indexes (tactic_index / tactic_vectors.load_index).
+Lists below HAGGLER_ANN_MIN_TACTICS (default 5000) are scanned exactly; larger ones use an
+IVF index (spherical k-means clusters, HAGGLER_ANN_NPROBE nearest clusters scanned per
+query). Tactics appended since the IVF build are scanned exactly until enough accumulate
+for a rebuild; removals trigger a rebuild.
+"""
+
+import asyncio
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from loguru import logger
+
+from redis_store import REDIS_TACTICS_KEY, REDIS_WINNING_KEY, get_redis
+from tactic_index import TacticIndex, index_for
+from tactic_vectors import embed, load_index
+
+RETRIEVAL_KEYS = (REDIS_WINNING_KEY, REDIS_TACTICS_KEY)
+KMEANS_ITERATIONS = 8
+# k-means trains on at most this many rows per cluster
+KMEANS_SAMPLE_PER_LIST = 64
+# Rebuild the IVF once appended (unclustered) rows exceed this fraction of the built rows
+REBUILD_FRACTION = 0.25
+QUERY_CACHE_SIZE = 64
+
+
+def retrieval_mode() -> str:
+    """HAGGLER_TACTIC_RETRIEVAL: all (every tactic, ranked and budgeted) | topk."""
+    mode = os.getenv("HAGGLER_TACTIC_RETRIEVAL", "all").lower()
+    return mode if mode in ("all", "topk") else "all"
+
+
+def top_k() -> int:
+    return int(os.getenv("HAGGLER_RETRIEVAL_TOP_K", "20"))
+
+
+def ann_min_tactics() -> int:
+    return int(os.getenv("HAGGLER_ANN_MIN_TACTICS", "5000"))
+
+
+def ann_nprobe() -> int:
+    return int(os.getenv("HAGGLER_ANN_NPROBE", "8"))
+
+
+def _top_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, k)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+class IVFIndex:
+    """Inverted-file ANN over a TacticIndex snapshot: rows grouped by nearest centroid."""
+
+    def __init__(self, matrix: np.ndarray, generation: int, seed: int = 0):
+        n = len(matrix)
+        self.generation = generation
+        self.built_rows = n
+        nlist = min(max(16, int(math.sqrt(n))), 1024, n)
+        rng = np.random.default_rng(seed)
+        sample = matrix[rng.choice(n, min(n, nlist * KMEANS_SAMPLE_PER_LIST), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.centroids = centroids
+        assign = np.concatenate(
+            [np.argmax(block @ centroids.T, axis=1) for block in np.array_split(matrix, max(1, n // 8192))]
+        )
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.lists = [order[bounds[c] : bounds[c + 1]] for c in range(nlist)]
+
+    def stale(self, index: TacticIndex) -> bool:
+        appended = len(index) - self.built_rows
+        return (
+            index.generation != self.generation
+            or appended < 0
+            or appended > REBUILD_FRACTION * self.built_rows
+        )
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, k: int, nprobe: int) -> tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) of the best k among the nprobe nearest clusters plus unclustered rows."""
+        probe = _top_rows(self.centroids @ query, nprobe)
+        candidates = [self.lists[c] for c in probe]
+        if len(matrix) > self.built_rows:
+            candidates.append(np.arange(self.built_rows, len(matrix)))
+        rows = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+        scores = matrix[rows] @ query
+        best = _top_rows(scores, k)
+        return rows[best], scores[best]
+
+
+_ivf: dict[str, IVFIndex] = {}
+_ivf_lock = threading.Lock()
+_query_vecs: OrderedDict[str, np.ndarray] = OrderedDict()
+_query_lock = threading.Lock()
+
+
+def _query_vector(text: str) -> np.ndarray:
+    """Embedding of a retrieval query, from a small LRU cache (called from to_thread workers)."""
+    with _query_lock:
+        vec = _query_vecs.get(text)
+        if vec is not None:
+            _query_vecs.move_to_end(text)
+            return vec
+    # Encode outside the lock; two threads missing on the same text both encode it once
+    vec = np.asarray(embed(text), dtype=np.float32)
+    with _query_lock:
+        _query_vecs[text] = vec
+        _query_vecs.move_to_end(text)
+        while len(_query_vecs) > QUERY_CACHE_SIZE:
+            _query_vecs.popitem(last=False)
+    return vec
+
+
+def search_index(list_key: str, index: TacticIndex, query: np.ndarray, k: int) -> list[tuple[str, float]]:
+    """Best k (tactic, similarity) in index; IVF once the list is past ann_min_tactics()."""
+    with index.lock:
+        n = len(index)
+        if not n or len(query) != index.dim:
+            return []
+        matrix = index.matrix
+        if n < ann_min_tactics():
+            scores = matrix @ query
+            rows = _top_rows(scores, k)
+            return [(index.row_tactics[i], float(scores[i])) for i in rows]
+        with _ivf_lock:
+            ivf = _ivf.get(list_key)
+            if ivf is None or ivf.stale(index):
+                ivf = _ivf[list_key] = IVFIndex(matrix, index.generation)
+                logger.debug(f"Built IVF index for {list_key}: rows={n} lists={len(ivf.lists)}")
+        rows, scores = ivf.search(matrix, query, k, ann_nprobe())
+        return [(index.row_tactics[i], float(s)) for i, s in zip(rows, scores)]
+
+
+def retrieve(query_text: str, k: int | None = None) -> dict[str, list[str]]:
+    """Top-k tactics for query_text across the winning and base lists (blocking; Redis + encoder).
+
+    Returns {list_key: [tactic, ...]}, each ordered by similarity; k applies to the union.
+    """
+    k = top_k() if k is None else k
+    r = get_redis()
+    if r is None:
+        return {key: [] for key in RETRIEVAL_KEYS}
+    query = _query_vector(query_text)
+    hits: list[tuple[float, str, str]] = []
+    for key in RETRIEVAL_KEYS:
+        index = load_index(r, key)
+        hits += [(score, key, t) for t, score in search_index(key, index, query, k)]
+    hits.sort(key=lambda h: -h[0])
+    out: dict[str, list[str]] = {key: [] for key in RETRIEVAL_KEYS}
+    seen: set[str] = set()
+    for _, key, t in hits:
+        if len(seen) >= k:
+            break
+        if t not in seen:
+            seen.add(t)
+            out[key].append(t)
+    return out
+
+
+def corpus_size() -> int:
+    """Tactics currently indexed across the retrieval lists (after the last retrieve)."""
+    return sum(len(index_for(key)) for key in RETRIEVAL_KEYS)
+
+
+async def fetch_relevant_tactics(query_text: str, k: int | None = None) -> tuple[list[str], list[str]]:
+    """(winning, base) top-k tactics for query_text, off the event loop."""
+    out = await asyncio.to_thread(retrieve, query_text, k)
+    return out[REDIS_WINNING_KEY], out[REDIS_TACTICS_KEY]
@@ -0,0 +1,250 @@
+"""Per-tactic usage/outcome counters, bandit tactic selection and the prompt tactic budget.
+
+Each session end records, in one script call, which tactics were in the prompt and whether
+the session succeeded: uses / wins / losses counters and last-used / last-win times
+(hashes keyed by tactic text), plus the posterior mean win rate (wins+1)/(uses+2) in the
+agent:tactic_stats:rank sorted set.
+
+select_tactics orders candidates by HAGGLER_TACTIC_SELECTOR and keeps the best ones that fit
+the prompt budget (HAGGLER_TACTIC_BUDGET_CHARS / HAGGLER_MAX_PROMPT_TACTICS):
+- thompson (default): a Beta(wins+1, losses+1) sample per tactic, so under-tried tactics
+  still get prompt slots while proven ones dominate. Samples are drawn per session
+  (session_config), on the stats as of that draw.
+- ucb: UCB1, win rate plus an exploration bonus shrinking with uses.
+- rank: smoothed success rate plus a recency bonus for the last win (deterministic).
+For large candidate sets, bandit_candidates narrows the pool to the top of the rank sorted
+set (O(log n) in Redis) plus a random exploration slice before stats are fetched.
+"""
+
+import math
+import os
+import random
+import time
+
+from metrics import instrument
+from redis_store import decode, decode_list, get_async_redis
+
+STATS_USES_KEY = "agent:tactic_stats:uses"
+STATS_WINS_KEY = "agent:tactic_stats:wins"
+STATS_LOSSES_KEY = "agent:tactic_stats:losses"
+STATS_LAST_WIN_KEY = "agent:tactic_stats:last_win"
+STATS_LAST_USED_KEY = "agent:tactic_stats:last_used"
+# When compaction first saw a tactic that was never used in a session (its idle-age fallback)
+STATS_FIRST_SEEN_KEY = "agent:tactic_stats:first_seen"
+# Sorted set: tactic -> posterior mean win rate, for O(log n) top-candidate lookups
+STATS_RANK_KEY = "agent:tactic_stats:rank"
+SELECTORS = ("thompson", "ucb", "rank")
+
+DEFAULT_BUDGET_CHARS = 0
+# A win this many days ago counts half as much toward the recency bonus
+RECENCY_HALF_LIFE_DAYS = 7.0
+RECENCY_WEIGHT = 0.25
+# Rough chars-per-token for English prompt text (prompt size metrics only)
+CHARS_PER_TOKEN = 4
+
+
+def budget_chars() -> int:
+    """Character budget for the tactics block (0 = unlimited)."""
+    return int(os.getenv("HAGGLER_TACTIC_BUDGET_CHARS", str(DEFAULT_BUDGET_CHARS)))
+
+
+def max_prompt_tactics() -> int:
+    """Cap on tactic count in the prompt (0 = unlimited)."""
+    return int(os.getenv("HAGGLER_MAX_PROMPT_TACTICS", "0"))
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def selector() -> str:
+    """HAGGLER_TACTIC_SELECTOR: thompson (default) | ucb | rank."""
+    name = os.getenv("HAGGLER_TACTIC_SELECTOR", "thompson").lower()
+    return name if name in SELECTORS else "thompson"
+
+
+def bandit_pool() -> int:
+    """Candidates considered by the bandit when the tactic lists are larger (0 = all)."""
+    return int(os.getenv("HAGGLER_BANDIT_POOL", "500"))
+
+
+def ucb_exploration() -> float:
+    return float(os.getenv("HAGGLER_UCB_C", "1.0"))
+
+
+# KEYS: uses, wins, losses, last_win, last_used, rank zset.
+# ARGV: 1 if success else 0, now, then tactics.
+_RECORD_OUTCOME_LUA = """
+local success = ARGV[1] == '1'
+for i = 3, #ARGV do
+  local t = ARGV[i]
+  local uses = redis.call('HINCRBY', KEYS[1], t, 1)
+  local wins
+  if success then
+    wins = redis.call('HINCRBY', KEYS[2], t, 1)
+    redis.call('HSET', KEYS[4], t, ARGV[2])
+  else
+    redis.call('HINCRBY', KEYS[3], t, 1)
+    wins = tonumber(redis.call('HGET', KEYS[2], t) or '0')
+  end
+  redis.call('HSET', KEYS[5], t, ARGV[2])
+  redis.call('ZADD', KEYS[6], (wins + 1) / (uses + 2), t)
+end
+return #ARGV - 2
+"""
+_record_script = None
+
+
+@instrument("haggler_redis_seconds", op="record_session_outcome")
+async def record_session_outcome(tactics: list[str], outcome: str) -> None:
+    """Count one use of each tactic and a win or loss, in one round trip (Lua script).
+
+    Also refreshes each tactic's rank score. The tactics version is left alone: session
+    configs draw their selection from the current stats per session (session_config).
+    """
+    global _record_script
+    r = get_async_redis()
+    if r is None or not tactics:
+        return
+    if _record_script is None:
+        _record_script = r.register_script(_RECORD_OUTCOME_LUA)
+    keys = [
+        STATS_USES_KEY,
+        STATS_WINS_KEY,
+        STATS_LOSSES_KEY,
+        STATS_LAST_WIN_KEY,
+        STATS_LAST_USED_KEY,
+        STATS_RANK_KEY,
+    ]
+    args = [1 if outcome == "success" else 0, int(time.time()), *dict.fromkeys(tactics)]
+    await _record_script(keys=keys, args=args, client=r)
+
+
+def rebuild_rank_index(r) -> int:
+    """Backfill agent:tactic_stats:rank from the counters (sync client). No-op once populated.
+
+    Return the number of tactics indexed.
+    """
+    if r.zcard(STATS_RANK_KEY) or not r.hlen(STATS_USES_KEY):
+        return 0
+    uses = {decode(k): int(v) for k, v in r.hgetall(STATS_USES_KEY).items()}
+    wins = {decode(k): int(v) for k, v in r.hgetall(STATS_WINS_KEY).items()}
+    r.zadd(STATS_RANK_KEY, {t: (wins.get(t, 0) + 1) / (u + 2) for t, u in uses.items()})
+    return len(uses)
+
+
+@instrument("haggler_redis_seconds", op="fetch_tactic_stats")
+async def fetch_tactic_stats(tactics: list[str]) -> dict[str, dict]:
+    """Return tactic -> {"uses", "wins", "losses", "last_win"} (zeros when never recorded).
+
+    Counters from before losses were tracked count every non-win use as a loss.
+    """
+    r = get_async_redis()
+    if r is None or not tactics:
+        return {t: {"uses": 0, "wins": 0, "losses": 0, "last_win": 0} for t in tactics}
+    pipe = r.pipeline(transaction=False)
+    pipe.hmget(STATS_USES_KEY, tactics)
+    pipe.hmget(STATS_WINS_KEY, tactics)
+    pipe.hmget(STATS_LOSSES_KEY, tactics)
+    pipe.hmget(STATS_LAST_WIN_KEY, tactics)
+    uses, wins, losses, last_win = await pipe.execute()
+    out = {}
+    for t, u, w, lo, lw in zip(tactics, uses, wins, losses, last_win):
+        u, w = int(u or 0), int(w or 0)
+        out[t] = {"uses": u, "wins": w, "losses": max(int(lo or 0), u - w), "last_win": int(lw or 0)}
+    return out
+
+
+@instrument("haggler_redis_seconds", op="bandit_candidates")
+async def bandit_candidates(available: list[str], pool: int | None = None) -> list[str]:
+    """Narrow a large candidate list to at most pool tactics (input order kept).
+
+    Three quarters come from the top of the rank sorted set (ZREVRANGE, O(log n + pool)),
+    the rest are a random sample of the other candidates so untried tactics still get
+    explored. Lists within the pool (or without Redis) are returned unchanged.
+    """
+    pool = bandit_pool() if pool is None else pool
+    r = get_async_redis()
+    if r is None or not pool or len(available) <= pool:
+        return available
+    allowed = set(available)
+    # Over-fetch: the rank set also holds tactics that are no longer in the lists
+    ranked = decode_list(await r.zrevrange(STATS_RANK_KEY, 0, 2 * pool - 1))
+    chosen = [t for t in ranked if t in allowed][: pool * 3 // 4]
+    taken = set(chosen)
+    rest = [t for t in available if t not in taken]
+    chosen_set = taken | set(random.sample(rest, min(len(rest), pool - len(chosen))))
+    return [t for t in available if t in chosen_set]
+
+
+def rank_score(stats: dict, now: float | None = None) -> float:
+    """Laplace-smoothed success rate plus a decaying bonus for a recent win."""
+    uses, wins, last_win = stats.get("uses", 0), stats.get("wins", 0), stats.get("last_win", 0)
+    score = (wins + 1) / (uses + 2)
+    if last_win:
+        age_days = max(0.0, ((now or time.time()) - last_win) / 86400)
+        score += RECENCY_WEIGHT * 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+    return score
+
+
+def _losses(stats: dict) -> int:
+    return max(stats.get("losses", 0), stats.get("uses", 0) - stats.get("wins", 0))
+
+
+def selection_scores(
+    tactics: list[str],
+    stats: dict[str, dict],
+    method: str | None = None,
+    rng: random.Random | None = None,
+) -> dict[str, float]:
+    """Score per tactic for the given selector (higher is injected first)."""
+    method = selector() if method is None else method
+    if method == "thompson":
+        rng = rng or random.Random()
+        return {
+            t: rng.betavariate(stats.get(t, {}).get("wins", 0) + 1, _losses(stats.get(t, {})) + 1)
+            for t in tactics
+        }
+    if method == "ucb":
+        total = sum(stats.get(t, {}).get("uses", 0) for t in tactics)
+        log_total = math.log(max(total, 1) + 1)
+        c = ucb_exploration()
+        scores = {}
+        for t in tactics:
+            st = stats.get(t, {})
+            uses = st.get("uses", 0)
+            mean = (st.get("wins", 0) + 1) / (uses + 2)
+            scores[t] = mean + c * math.sqrt(2 * log_total / (uses + 1))
+        return scores
+    now = time.time()
+    return {t: rank_score(stats.get(t, {}), now) for t in tactics}
+
+
+def select_tactics(
+    tactics: list[str],
+    stats: dict[str, dict],
+    budget: int | None = None,
+    max_count: int | None = None,
+    method: str | None = None,
+    rng: random.Random | None = None,
+) -> list[str]:
+    """Order tactics by the selector (stable: ties keep input order) and keep those that
+    fit the budget.
+
+    Each tactic costs len(tactic) + 3 chars (the "- " bullet and newline).
+    """
+    budget = budget_chars() if budget is None else budget
+    max_count = max_prompt_tactics() if max_count is None else max_count
+    scores = selection_scores(tactics, stats, method, rng)
+    ranked = sorted(tactics, key=lambda t: -scores[t])
+    selected: list[str] = []
+    used = 0
+    for t in ranked:
+        if max_count and len(selected) >= max_count:
+            break
+        cost = len(t) + 3
+        if budget and used + cost > budget:
+            continue
+        selected.append(t)
+        used += cost
+    return selected
@@ -1,59 +1,220 @@
 """Tactic vector store and cosine-similarity deduplication.
 
-Stores tactic embeddings in Redis hashes (list_key:vecs). When adding a tactic,
+Stores tactic embeddings in Redis hashes (list_key:vecs) in a compact binary format
+(see encode_vector; legacy JSON entries are still read and migrated). When adding a tactic,
 embeds it and skips if cosine similarity to any existing tactic exceeds threshold.
+Similarity queries run against an in-memory float32 matrix per list (tactic_index).
+
+The sentence encoder is loaded once per process (get_encoder) and shared by all
+sessions. Set HAGGLER_EMBED_WORKER=1 to host it in a separate worker process instead.
 """
 
 import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from typing import Literal
 
+import numpy as np
 import redis
+from loguru import logger
+
+from redis_store import TACTICS_CHANNEL, TACTICS_VERSION_KEY, bump_tactics_version
+from tactic_index import TacticIndex, as_matrix, dedupe_mask, index_for
 
 # Model name for sentence embeddings (local, no API)
 EMBED_MODEL = "all-MiniLM-L6-v2"
 VECS_SUFFIX = ":vecs"
+WATERMARK_SUFFIX = ":dedupe_watermark"
+REWRITES_SUFFIX = ":rewrites"
 DEFAULT_SIMILARITY_THRESHOLD = 0.92
+EMBED_BATCH_SIZE = 64
+
+# Binary vector format: b"TV" + version byte + dtype code, then the raw little-endian
+# values. int8 adds a float32 scale after the header (value = int8 * scale).
+VEC_MAGIC = b"TV"
+VEC_FORMAT_VERSION = 1
+VEC_HEADER_LEN = 4
+_DTYPE_CODES = {"float32": 0, "float16": 1, "int8": 2}
+_CODE_DTYPES = {v: k for k, v in _DTYPE_CODES.items()}
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+# Model instance inside the embedding worker process (see _ProcessEncoder)
+_worker_model = None
 
 
-def _get_encoder():
+def _load_model():
     from sentence_transformers import SentenceTransformer
     return SentenceTransformer(EMBED_MODEL)
 
 
+def _worker_init() -> None:
+    global _worker_model
+    _worker_model = _load_model()
+
+
+def _worker_encode(sentences, kwargs: dict):
+    return _worker_model.encode(sentences, **kwargs)
+
+
+class _ProcessEncoder:
+    """Encoder hosted in a single worker process; same encode() call shape as SentenceTransformer."""
+
+    def __init__(self):
+        import multiprocessing
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_worker_init,
+        )
+
+    def encode(self, sentences, **kwargs):
+        return self._pool.submit(_worker_encode, sentences, kwargs).result()
+
+
+def get_encoder():
+    """Return the process-wide sentence encoder, loading it on first use (thread-safe)."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                if os.getenv("HAGGLER_EMBED_WORKER", "0") == "1":
+                    encoder = _ProcessEncoder()
+                else:
+                    encoder = _load_model()
+                # Force the model load now so the first dedupe doesn't pay for it
+                encoder.encode(["warmup"], normalize_embeddings=True)
+                _encoder = encoder
+                logger.info(f"Loaded sentence encoder {EMBED_MODEL} ({type(encoder).__name__})")
+    return _encoder
+
+
+def warm_encoder(background: bool = True) -> None:
+    """Load the shared encoder ahead of the first session end (in a daemon thread by default)."""
+    if background:
+        threading.Thread(target=get_encoder, name="encoder-warmup", daemon=True).start()
+    else:
+        get_encoder()
+
+
 def embed(tactic: str) -> list[float]:
     """Return sentence embedding for tactic (normalized for cosine sim)."""
     if not tactic.strip():
         return []
-    model = _get_encoder()
+    model = get_encoder()
     vec = model.encode(tactic.strip(), normalize_embeddings=True)
     return vec.tolist()
 
 
+def embed_many(tactics: list[str]) -> list[list[float]]:
+    """Batched embed: one encode call for all tactics. Empty tactics map to []."""
+    texts = [t.strip() for t in tactics if t.strip()]
+    if not texts:
+        return [[] for _ in tactics]
+    model = get_encoder()
+    vecs = iter(model.encode(texts, normalize_embeddings=True, batch_size=EMBED_BATCH_SIZE).tolist())
+    return [next(vecs) if t.strip() else [] for t in tactics]
+
+
 def cosine_similarity(a: list[float], b: list[float]) -> float:
     """Cosine similarity (assumes vectors are normalized)."""
-    if not a or not b or len(a) != len(b):
+    if len(a) == 0 or len(b) == 0 or len(a) != len(b):
         return 0.0
-    return sum(x * y for x, y in zip(a, b))
+    return float(np.dot(np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)))
 
 
 def _vecs_key(list_key: str) -> str:
     return list_key + VECS_SUFFIX
 
 
-def _get_cached_vectors(r: redis.Redis, list_key: str, tactics: list[str]) -> dict[str, list[float]]:
-    """Return dict tactic -> vector for tactics that have cached vectors."""
+def vector_dtype() -> str:
+    """Storage dtype for new vectors: HAGGLER_VECTOR_DTYPE = float32 (default) | float16 | int8."""
+    dtype = os.getenv("HAGGLER_VECTOR_DTYPE", "float32").lower()
+    return dtype if dtype in _DTYPE_CODES else "float32"
+
+
+def encode_vector(vec, dtype: str | None = None) -> bytes:
+    """Serialize a normalized embedding to the versioned binary format."""
+    dtype = dtype or vector_dtype()
+    arr = np.asarray(vec, dtype=np.float32)
+    header = VEC_MAGIC + bytes((VEC_FORMAT_VERSION, _DTYPE_CODES[dtype]))
+    if dtype == "int8":
+        scale = float(np.abs(arr).max()) / 127.0 if arr.size else 0.0
+        q = np.round(arr / scale).astype("<i1") if scale else np.zeros(arr.shape, "<i1")
+        return header + np.float32(scale).astype("<f4").tobytes() + q.tobytes()
+    return header + arr.astype("<f4" if dtype == "float32" else "<f2").tobytes()
+
+
+def decode_vector(raw: bytes | str) -> np.ndarray:
+    """Decode a stored vector to float32. float32 payloads are a zero-copy view of raw;
+    legacy JSON lists (written before the binary format) are parsed as before."""
+    if isinstance(raw, str) or not raw.startswith(VEC_MAGIC):
+        return np.asarray(json.loads(_decode(raw)), dtype=np.float32)
+    version, code = raw[2], raw[3]
+    if version != VEC_FORMAT_VERSION or code not in _CODE_DTYPES:
+        raise ValueError(f"Unsupported tactic vector format version={version} dtype={code}")
+    dtype = _CODE_DTYPES[code]
+    if dtype == "float32":
+        return np.frombuffer(raw, dtype="<f4", offset=VEC_HEADER_LEN)
+    if dtype == "float16":
+        return np.frombuffer(raw, dtype="<f2", offset=VEC_HEADER_LEN).astype(np.float32)
+    scale = np.frombuffer(raw, dtype="<f4", count=1, offset=VEC_HEADER_LEN)[0]
+    return np.frombuffer(raw, dtype="<i1", offset=VEC_HEADER_LEN + 4).astype(np.float32) * scale
+
+
+def _is_legacy(raw: bytes | str) -> bool:
+    return isinstance(raw, str) or not raw.startswith(VEC_MAGIC)
+
+
+def _get_cached_vectors(r: redis.Redis, list_key: str, tactics: list[str]) -> dict[str, np.ndarray]:
+    """Return dict tactic -> vector for tactics that have cached vectors (one HMGET).
+
+    Legacy JSON entries found along the way are rewritten in the binary format.
+    """
+    if not tactics:
+        return {}
     key = _vecs_key(list_key)
+    unique = list(dict.fromkeys(tactics))
     out = {}
-    for t in tactics:
-        raw = r.hget(key, t)
+    legacy = {}
+    for t, raw in zip(unique, r.hmget(key, unique)):
         if raw:
-            out[t] = json.loads(raw.decode() if isinstance(raw, bytes) else raw)
+            out[t] = decode_vector(raw)
+            if _is_legacy(raw):
+                legacy[t] = encode_vector(out[t])
+    if legacy:
+        r.hset(key, mapping=legacy)
     return out
 
 
-def _ensure_vector_cached(r: redis.Redis, list_key: str, tactic: str, vec: list[float]) -> None:
+def _ensure_vector_cached(r: redis.Redis, list_key: str, tactic: str, vec) -> None:
+    key = _vecs_key(list_key)
+    r.hset(key, tactic, encode_vector(vec))
+
+
+def migrate_vectors(r: redis.Redis, list_key: str, dtype: str | None = None) -> int:
+    """Rewrite every JSON (or other-dtype) entry in list_key:vecs in the current binary
+    format. Return count rewritten."""
+    dtype = dtype or vector_dtype()
     key = _vecs_key(list_key)
-    r.hset(key, tactic, json.dumps(vec))
+    code = _DTYPE_CODES[dtype]
+    rewritten = 0
+    batch = {}
+    for field, raw in r.hscan_iter(key, count=500):
+        if not _is_legacy(raw) and raw[3] == code:
+            continue
+        batch[field] = encode_vector(decode_vector(raw), dtype)
+        if len(batch) >= 500:
+            r.hset(key, mapping=batch)
+            rewritten += len(batch)
+            batch = {}
+    if batch:
+        r.hset(key, mapping=batch)
+        rewritten += len(batch)
+    return rewritten
 
 
 def is_near_duplicate(
@@ -62,18 +223,86 @@ def is_near_duplicate(
     existing_vectors: dict[str, list[float]],
     encoder,
     threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    new_vec: list[float] | None = None,
 ) -> tuple[bool, list[float]]:
-    """Return (True, new_vec) if tactic is near-duplicate of any existing; else (False, new_vec)."""
+    """Return (True, new_vec) if tactic is near-duplicate of any existing; else (False, new_vec).
+
+    Pass new_vec when the tactic was already embedded (e.g. by embed_many) to skip encoding.
+    """
     if not tactic.strip():
         return True, []
-    new_vec = encoder.encode(tactic.strip(), normalize_embeddings=True).tolist()
-    for existing in existing_tactics:
-        existing_vec = existing_vectors.get(existing)
-        if existing_vec is None:
-            continue
-        if cosine_similarity(new_vec, existing_vec) >= threshold:
-            return True, new_vec
-    return False, new_vec
+    if new_vec is None:
+        new_vec = encoder.encode(tactic.strip(), normalize_embeddings=True).tolist()
+    vecs = [existing_vectors[t] for t in existing_tactics if t in existing_vectors]
+    vecs = [v for v in vecs if len(v) == len(new_vec)]
+    if not vecs:
+        return False, new_vec
+    sims = as_matrix(vecs) @ np.asarray(new_vec, dtype=np.float32)
+    return bool(sims.max() >= threshold), new_vec
+
+
+def rewrites_key(list_key: str) -> str:
+    """Counter bumped by every write that removes or reorders list_key entries (not appends)."""
+    return list_key + REWRITES_SUFFIX
+
+
+def _vectors_for(r: redis.Redis, list_key: str, tactics: list[str]) -> dict[str, np.ndarray]:
+    """Cached vectors for tactics; the ones without a cached vector are embedded in one batch
+    and cached."""
+    vectors = _get_cached_vectors(r, list_key, tactics)
+    missing = list(dict.fromkeys(t for t in tactics if t not in vectors and t.strip()))
+    if missing:
+        fresh = dict(zip(missing, embed_many(missing)))
+        r.hset(_vecs_key(list_key), mapping={t: encode_vector(v) for t, v in fresh.items()})
+        vectors.update(fresh)
+    return vectors
+
+
+def load_index(r: redis.Redis, list_key: str) -> TacticIndex:
+    """Return the in-memory index for list_key, synced with writes from other processes.
+
+    One round trip reads the list length, its rewrite counter (rewrites_key), the element at
+    the last synced tail position and anything appended after it. Appends are added to the
+    index; only a rewrite (counter moved, list shrank or the old tail moved) reloads the list.
+    """
+    index = index_for(list_key)
+    with index.lock:
+        old_len = index.list_len
+        if old_len is not None and index.rewrites is not None:
+            pipe = r.pipeline(transaction=True)
+            pipe.get(rewrites_key(list_key))
+            pipe.llen(list_key)
+            pipe.lrange(list_key, old_len, -1)
+            if old_len:
+                pipe.lindex(list_key, old_len - 1)
+            rewrites, length, appended, *old_tail = pipe.execute()
+            unchanged = (
+                int(rewrites or 0) == index.rewrites
+                and length >= old_len
+                and (not old_len or (old_tail[0] is not None and _decode(old_tail[0]) == index.tail))
+            )
+            if unchanged:
+                if appended:
+                    tactics = [_decode(x) for x in appended]
+                    vectors = _vectors_for(r, list_key, tactics)
+                    indexed = [t for t in dict.fromkeys(tactics) if t in vectors]
+                    index.add_many(indexed, [vectors[t] for t in indexed])
+                    index.list_len = old_len + len(tactics)
+                    index.tail = tactics[-1]
+                return index
+        pipe = r.pipeline(transaction=True)
+        pipe.get(rewrites_key(list_key))
+        pipe.lrange(list_key, 0, -1)
+        rewrites, raw = pipe.execute()
+        tactics = [_decode(x) for x in raw or []]
+        vectors = _vectors_for(r, list_key, tactics)
+        indexed = [t for t in dict.fromkeys(tactics) if t in vectors]
+        index.clear()
+        index.add_many(indexed, [vectors[t] for t in indexed])
+        index.list_len = len(tactics)
+        index.tail = tactics[-1] if tactics else None
+        index.rewrites = int(rewrites or 0)
+        return index
 
 
 def add_tactic_with_dedupe(
@@ -86,66 +315,285 @@ def add_tactic_with_dedupe(
     Add tactic to list_key only if no existing tactic has cosine similarity >= threshold.
     Stores embedding in list_key:vecs hash. Returns "added", "duplicate", or "skip" (empty tactic).
     """
-    if not tactic.strip():
-        return "skip"
-    existing_raw = r.lrange(list_key, 0, -1) or []
-    existing_tactics = [x.decode() if isinstance(x, bytes) else x for x in existing_raw]
-    if tactic in existing_tactics:
-        return "duplicate"
-    encoder = _get_encoder()
-    existing_vectors = _get_cached_vectors(r, list_key, existing_tactics)
-    is_dup, new_vec = is_near_duplicate(tactic, existing_tactics, existing_vectors, encoder, threshold)
-    if is_dup:
-        return "duplicate"
-    r.rpush(list_key, tactic)
-    _ensure_vector_cached(r, list_key, tactic, new_vec)
-    return "added"
+    return add_tactics_with_dedupe(r, list_key, [tactic], threshold)[0]
+
+
+# Atomic insert for add_tactics_with_dedupe. KEYS: list, vecs hash, tactics version counter,
+# then the vecs hashes of lists that must not already contain the tactic. Membership is HEXISTS
+# on a list's vecs hash (O(1)), which holds a vector for every entry once the list's index has
+# been synced (load_index caches missing vectors). ARGV: expected LLEN of list (-1 = don't
+# check), EXPIRE seconds for list (0 = none), change channel, then tactic/vector pairs.
+# Returns {-1} if the list length changed (caller reloads its index and retries), else 1/0
+# per tactic (inserted / exact duplicate). Bumps the version and publishes if anything was added.
+_INSERT_TACTICS_LUA = """
+local expected = tonumber(ARGV[1])
+if expected >= 0 and redis.call('LLEN', KEYS[1]) ~= expected then
+  return {-1}
+end
+local out = {}
+local added = 0
+for i = 4, #ARGV, 2 do
+  local t = ARGV[i]
+  local exists = false
+  for k = 1, #KEYS do
+    if (k == 2 or k > 3) and redis.call('HEXISTS', KEYS[k], t) == 1 then
+      exists = true
+      break
+    end
+  end
+  if exists then
+    out[#out + 1] = 0
+  else
+    redis.call('RPUSH', KEYS[1], t)
+    redis.call('HSET', KEYS[2], t, ARGV[i + 1])
+    out[#out + 1] = 1
+    added = added + 1
+  end
+end
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+  redis.call('EXPIRE', KEYS[1], ttl)
+  redis.call('EXPIRE', KEYS[2], ttl)
+end
+if added > 0 then
+  redis.call('INCR', KEYS[3])
+  redis.call('PUBLISH', ARGV[3], 'changed')
+end
+return out
+"""
+MERGE_RETRIES = 3
+
+_insert_script = None
+
+
+def _run_insert_script(r: redis.Redis, keys: list[str], args: list) -> list[int]:
+    global _insert_script
+    if _insert_script is None:
+        _insert_script = r.register_script(_INSERT_TACTICS_LUA)
+    return _insert_script(keys=keys, args=args, client=r)
+
+
+def add_tactics_with_dedupe(
+    r: redis.Redis,
+    list_key: str,
+    tactics: list[str],
+    threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    exclude_keys: tuple[str, ...] = (),
+    expire_seconds: int | None = None,
+) -> list[Literal["added", "duplicate", "skip"]]:
+    """
+    Batched add_tactic_with_dedupe: embeds all candidates in one encode call and dedupes
+    against existing tactics and earlier tactics in the batch. The exact-duplicate check
+    (against list_key and any exclude_keys), RPUSH and vector write run in one Lua script,
+    guarded by the list length the similarity check saw, so concurrent merges from other
+    sessions can't push the same or a near-duplicate tactic. Optionally (re)sets an EXPIRE
+    on list_key in the same call. Returns one result per input tactic.
+    """
+    results: list[Literal["added", "duplicate", "skip"]] = ["skip"] * len(tactics)
+    vectors: dict[str, list[float]] = {}
+    # The script checks exclusions by their vecs hashes; syncing fills in entries pushed by hand
+    for key in exclude_keys:
+        load_index(r, key)
+    for attempt in range(MERGE_RETRIES + 1):
+        index = load_index(r, list_key)
+        with index.lock:
+            seen: set[str] = set()
+            pending: list[int] = []
+            for i, t in enumerate(tactics):
+                if not t.strip():
+                    continue
+                if t in index or t in seen:
+                    results[i] = "duplicate"
+                    continue
+                seen.add(t)
+                pending.append(i)
+            if not pending:
+                return results
+            to_embed = [tactics[i] for i in pending if tactics[i] not in vectors]
+            vectors.update(zip(to_embed, embed_many(to_embed)))
+            batch = as_matrix([vectors[tactics[i]] for i in pending])
+            best = index.max_similarities(batch)
+            accepted: list[int] = []
+            for row, i in enumerate(pending):
+                # Also compare with tactics accepted earlier in this batch
+                if accepted and (batch[accepted] @ batch[row]).max() >= threshold:
+                    best[row] = threshold
+                if best[row] >= threshold:
+                    results[i] = "duplicate"
+                else:
+                    accepted.append(row)
+            if not accepted:
+                return results
+            # Last attempt skips the length guard (exact-dup check still holds)
+            expected = index.list_len if attempt < MERGE_RETRIES else -1
+            args: list = [expected, expire_seconds or 0, TACTICS_CHANNEL]
+            for row in accepted:
+                t = tactics[pending[row]]
+                args += [t, encode_vector(batch[row])]
+            keys = [
+                list_key,
+                _vecs_key(list_key),
+                TACTICS_VERSION_KEY,
+                *(_vecs_key(k) for k in exclude_keys),
+            ]
+            reply = _run_insert_script(r, keys, args)
+            if reply and reply[0] == -1:
+                index.list_len = None
+                continue
+            for row, inserted in zip(accepted, reply):
+                i = pending[row]
+                if inserted:
+                    index.add(tactics[i], batch[row])
+                    index.list_len += 1
+                    index.tail = tactics[i]
+                    results[i] = "added"
+                else:
+                    results[i] = "duplicate"
+            return results
+    return results
+
+
+def dedupe_watermark_key(list_key: str) -> str:
+    """List length up to which list_key is known to hold no near-duplicates."""
+    return list_key + WATERMARK_SUFFIX
 
 
 def dedupe_list_by_similarity(
     r: redis.Redis,
     list_key: str,
     threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+    incremental: bool = False,
 ) -> int:
     """
     In-place dedupe: keep first of each near-duplicate cluster. Return count removed.
+
+    With incremental=True only tactics appended past the dedupe watermark are checked (against
+    the in-memory index) and removed with LREM/HDEL; without a usable watermark this falls back
+    to the full pass, which rewrites the list and sets the watermark.
     """
+    if incremental:
+        removed = _dedupe_tail(r, list_key, threshold)
+        if removed is not None:
+            return removed
     raw = r.lrange(list_key, 0, -1) or []
     tactics = [x.decode() if isinstance(x, bytes) else x for x in raw]
     if not tactics:
+        r.delete(dedupe_watermark_key(list_key))
         return 0
     vecs_key = _vecs_key(list_key)
     cached = _get_cached_vectors(r, list_key, tactics)
-    encoder = _get_encoder()
-    kept = []
-    kept_vectors = {}
-    for t in tactics:
-        vec = cached.get(t)
-        if vec is None:
-            vec = encoder.encode(t.strip(), normalize_embeddings=True).tolist()
-        is_dup, _ = is_near_duplicate(t, kept, kept_vectors, encoder, threshold)
-        if not is_dup:
-            kept.append(t)
-            kept_vectors[t] = vec
+    missing = list(dict.fromkeys(t for t in tactics if t not in cached and t.strip()))
+    if missing:
+        cached.update(zip(missing, embed_many(missing)))
+    rewrites = int(r.get(rewrites_key(list_key)) or 0)
+    # Empty tactics and exact repeats are always dropped; the rest cluster by similarity
+    first_seen: dict[str, int] = {}
+    for i, t in enumerate(tactics):
+        if t.strip():
+            first_seen.setdefault(t, i)
+    candidates = sorted(first_seen.values())
+    matrix = as_matrix([cached[tactics[i]] for i in candidates])
+    keep = dedupe_mask(matrix, threshold) if candidates else np.zeros(0, dtype=bool)
+    kept = [tactics[i] for i, k in zip(candidates, keep) if k]
     removed = len(tactics) - len(kept)
     if removed:
         r.delete(list_key)
         r.delete(vecs_key)
         if kept:
             r.rpush(list_key, *kept)
-            for t, v in kept_vectors.items():
-                r.hset(vecs_key, t, json.dumps(v))
+            r.hset(vecs_key, mapping={t: encode_vector(cached[t]) for t in kept})
+        rewrites = r.incr(rewrites_key(list_key))
+        bump_tactics_version(r)
+    r.set(dedupe_watermark_key(list_key), len(kept))
+    index = index_for(list_key)
+    with index.lock:
+        index.clear()
+        index.add_many(kept, [cached[t] for t in kept])
+        index.list_len = len(kept)
+        index.tail = kept[-1] if kept else None
+        index.rewrites = rewrites
     return removed
 
 
+def _dedupe_tail(r: redis.Redis, list_key: str, threshold: float) -> int | None:
+    """Incremental dedupe of the tactics past the watermark. None when a full pass is needed."""
+    mark_key = dedupe_watermark_key(list_key)
+    for _ in range(MERGE_RETRIES + 1):
+        index = load_index(r, list_key)
+        with r.pipeline(transaction=True) as pipe:
+            try:
+                # Any write to the list (or a compaction resetting the mark) aborts and retries
+                pipe.watch(list_key, mark_key, rewrites_key(list_key))
+                mark, length = pipe.get(mark_key), pipe.llen(list_key)
+                if mark is None or int(mark) > length:
+                    return None
+                mark = int(mark)
+                if mark == length:
+                    return 0
+                if index.list_len != length:
+                    # Appended between load_index and WATCH; reload so the index covers the tail
+                    continue
+                tail = [_decode(x) for x in pipe.lrange(list_key, mark, -1)]
+                counts: dict[str, int] = {}
+                for t in tail:
+                    counts[t] = counts.get(t, 0) + 1
+                in_checked: dict[str, int | None] = {}
+                if mark:
+                    # MAXLEN bounds the scan to the checked part (MAXLEN 0 would mean the whole list)
+                    lookup = r.pipeline(transaction=False)
+                    for t in counts:
+                        lookup.lpos(list_key, t, maxlen=mark)
+                    in_checked = dict(zip(counts, lookup.execute()))
+                # Tactics first seen in the tail; the rest are exact repeats of checked tactics
+                fresh = [t for t in counts if t.strip() and in_checked.get(t) is None]
+                drop = {t: n for t, n in counts.items() if t not in fresh}
+                drop.update((t, counts[t] - 1) for t in fresh if counts[t] > 1)
+                near: list[str] = []
+                if fresh:
+                    batch = as_matrix([index.vector(t) for t in fresh])
+                    best = index.max_similarities(batch, exclude=fresh)
+                    # Keep-first among the new tactics that match nothing already checked
+                    rows = np.flatnonzero(best < threshold)
+                    keep = np.zeros(len(fresh), dtype=bool)
+                    keep[rows] = dedupe_mask(batch[rows], threshold) if len(rows) else []
+                    near = [t for t, k in zip(fresh, keep) if not k]
+                    drop.update((t, counts[t]) for t in near)
+                removed = sum(drop.values())
+                pipe.multi()
+                if removed:
+                    pipe.incr(rewrites_key(list_key))
+                for t, n in drop.items():
+                    if n:
+                        # Negative count removes from the tail, i.e. the unchecked occurrences
+                        pipe.lrem(list_key, -n, t)
+                if near:
+                    pipe.hdel(_vecs_key(list_key), *near)
+                pipe.set(mark_key, length - removed)
+                replies = pipe.execute()
+            except redis.WatchError:
+                continue
+        if removed:
+            bump_tactics_version(r)
+            with index.lock:
+                index.rewrites = replies[0]
+                for t in near:
+                    index.remove(t)
+                index.list_len, index.tail = length - removed, None
+                left = dict(drop)
+                for t in reversed(tail):
+                    if left.get(t):
+                        left[t] -= 1
+                    else:
+                        index.tail = t
+                        break
+                if index.tail is None:
+                    # The whole tail went; the new last element wasn't read, so reload on next use
+                    index.list_len = None
+        return removed
+    # The list kept changing; the watermark stays put for the next run
+    return 0
+
+
 def _decode(b: bytes | str) -> str:
     return b.decode() if isinstance(b, bytes) else b
 
-
-def normalize_redis_url(url: str | None) -> str | None:
-    if not url:
-        return None
-    url = url.strip()
-    if not url.startswith(("redis://", "rediss://", "unix://")):
-        url = "redis://" + url
-    return url
@@ -0,0 +1,88 @@
+"""Fixtures for the behaviour tests: in-process fakeredis and a fake sentence encoder.
+
+Run from server/: uv run pytest tests/ (fakeredis[lua] is in the dev dependency group).
+REDIS_URL is never used: every module's get_redis / get_async_redis binding is pointed at
+a fresh fakeredis server per test, and the in-memory tactic indexes are dropped afterwards.
+"""
+
+import asyncio
+import hashlib
+import re
+import sys
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(SERVER_DIR))
+
+fakeredis = pytest.importorskip("fakeredis", reason="install fakeredis[lua] (dev dependency group)")
+import fakeredis.aioredis  # noqa: E402
+
+import redis_store  # noqa: E402
+import tactic_index  # noqa: E402
+import tactic_vectors  # noqa: E402
+from tactic_index import EMBED_DIM  # noqa: E402
+
+
+class FakeEncoder:
+    """SentenceTransformer.encode stand-in: one random unit vector per normalized text.
+
+    Texts that differ only in case, spacing or punctuation get the same vector (cosine 1.0,
+    a near-duplicate); any other two texts are close to orthogonal.
+    """
+
+    def encode(self, sentences, normalize_embeddings=True, batch_size=32):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else sentences
+        out = np.stack([_vector(t) for t in texts])
+        return out[0] if single else out
+
+
+def _vector(text: str) -> np.ndarray:
+    normalized = " ".join(re.sub(r"[^\w\s]", "", text.lower()).split())
+    seed = int(hashlib.sha256(normalized.encode()).hexdigest()[:8], 16)
+    v = np.random.default_rng(seed).standard_normal(EMBED_DIM).astype(np.float32)
+    return v / np.linalg.norm(v)
+
+
+@pytest.fixture(autouse=True)
+def encoder(monkeypatch):
+    monkeypatch.setattr(tactic_vectors, "_encoder", FakeEncoder())
+
+
+@pytest.fixture
+def redis_clients(monkeypatch):
+    """(sync client, get_async_redis) on one fresh fakeredis server, patched into every module."""
+    server = fakeredis.FakeServer()
+    sync = fakeredis.FakeRedis(server=server)
+    async_clients = weakref.WeakKeyDictionary()
+
+    def get_async_redis():
+        loop = asyncio.get_running_loop()
+        if loop not in async_clients:
+            async_clients[loop] = fakeredis.aioredis.FakeRedis(server=server)
+        return async_clients[loop]
+
+    # Modules bound these names at import, so patch each binding
+    originals = {"get_redis": redis_store.get_redis, "get_async_redis": redis_store.get_async_redis}
+    replacements = {"get_redis": lambda: sync, "get_async_redis": get_async_redis}
+    for module in list(sys.modules.values()):
+        for name, original in originals.items():
+            if getattr(module, name, None) is original:
+                monkeypatch.setattr(module, name, replacements[name])
+    _drop_indexes()
+    yield sync, get_async_redis
+    _drop_indexes()
+
+
+def _drop_indexes() -> None:
+    for key in list(tactic_index._indexes):
+        tactic_index.drop_index(key)
+
+
+@pytest.fixture
+def r(redis_clients):
+    return redis_clients[0]
@@ -0,0 +1,68 @@
+"""Compaction planning (compaction.plan_list) and guarded removal (apply_removals)."""
+
+import time
+
+from compaction import ListPolicy, apply_removals, compact, plan_list
+from redis_store import decode_list
+from tactic_stats import STATS_FIRST_SEEN_KEY, STATS_LAST_USED_KEY, STATS_USES_KEY, STATS_WINS_KEY
+from tactic_vectors import dedupe_watermark_key
+
+FAILED = "agent:failed_tactics"
+DAY = 86400
+
+
+def test_plan_flags_blanks_duplicates_and_idle_tactics(r):
+    now = time.time()
+    r.rpush(FAILED, "Stay calm.", " ", "Cite the policy.", "stay calm", "Old tactic.")
+    r.hset(STATS_LAST_USED_KEY, mapping={"Stay calm.": now, "Old tactic.": now - 40 * DAY})
+    tactics, removals = plan_list(r, ListPolicy(FAILED, max_idle_days=30), now=now)
+    assert tactics == decode_list(r.lrange(FAILED, 0, -1))
+    assert removals == {" ": "blank", "stay calm": "duplicate", "Old tactic.": "idle"}
+
+
+def test_never_used_tactics_age_from_first_seen(r):
+    now = time.time()
+    r.rpush(FAILED, "Never used.", "Seen long ago.")
+    r.hset(STATS_FIRST_SEEN_KEY, "Seen long ago.", now - 40 * DAY)
+    policy = ListPolicy(FAILED, max_idle_days=30)
+    _, removals = plan_list(r, policy, now=now, dry_run=True)
+    assert removals == {"Seen long ago.": "idle"}
+    # dry_run stamps nothing; a real pass stamps the unseen tactic with now
+    assert r.hget(STATS_FIRST_SEEN_KEY, "Never used.") is None
+    plan_list(r, policy, now=now)
+    assert int(r.hget(STATS_FIRST_SEEN_KEY, "Never used.")) == int(now)
+    _, removals = plan_list(r, policy, now=now + 31 * DAY)
+    assert removals == {"Never used.": "idle", "Seen long ago.": "idle"}
+
+
+def test_cap_evicts_the_lowest_scores(r):
+    now = time.time()
+    r.rpush(FAILED, "a", "b", "c")
+    r.hset(STATS_USES_KEY, mapping={"a": 10, "b": 10, "c": 10})
+    r.hset(STATS_WINS_KEY, mapping={"a": 1, "b": 9, "c": 5})
+    _, removals = plan_list(r, ListPolicy(FAILED, cap=1, dedupe=False), now=now)
+    assert removals == {"a": "evicted", "c": "evicted"}
+
+
+def test_apply_drops_repeats_and_keeps_first_occurrences(r):
+    r.rpush(FAILED, "a", "b", "a", "c", "a", "b")
+    tactics = decode_list(r.lrange(FAILED, 0, -1))
+    assert apply_removals(r, FAILED, tactics, ["c"], watermark=True)
+    assert decode_list(r.lrange(FAILED, 0, -1)) == ["a", "b"]
+    assert int(r.get(dedupe_watermark_key(FAILED))) == 2
+
+
+def test_apply_aborts_when_the_list_changed(r):
+    r.rpush(FAILED, "a", "b", "c")
+    tactics = decode_list(r.lrange(FAILED, 0, -1))
+    # Same length, different content
+    r.lset(FAILED, 0, "z")
+    assert not apply_removals(r, FAILED, tactics, ["b"])
+    assert decode_list(r.lrange(FAILED, 0, -1)) == ["z", "b", "c"]
+
+
+def test_compact_reports_removals_and_sets_the_watermark(r):
+    r.rpush(FAILED, "Stay calm.", "Stay calm.", "", "Cite the policy.")
+    assert compact(r)["lists"][FAILED]["removed"] == {"blank": 1, "repeat": 1}
+    assert decode_list(r.lrange(FAILED, 0, -1)) == ["Stay calm.", "Cite the policy."]
+    assert int(r.get(dedupe_watermark_key(FAILED))) == 2
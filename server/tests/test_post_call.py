@@ -0,0 +1,74 @@
+"""Post-call retries: failed jobs park in the delayed set, return to the stream when due and
+go to the dead-letter stream after the last attempt (Redis mode)."""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("weave", reason="post_call needs weave (project dependency)")
+
+import post_call  # noqa: E402
+from post_call import (  # noqa: E402
+    POSTCALL_DEAD_STREAM,
+    POSTCALL_DELAYED_KEY,
+    POSTCALL_GROUP,
+    POSTCALL_STREAM,
+    PostCallJob,
+    PostCallQueue,
+)
+
+
+@pytest.fixture
+def failing_jobs(monkeypatch, redis_clients):
+    """Every job raises; returns the session ids processed, in order."""
+    runs = []
+
+    async def process_job(job):
+        runs.append(job.session_id)
+        raise RuntimeError("judge unavailable")
+
+    monkeypatch.setattr(post_call, "process_job", process_job)
+    monkeypatch.setenv("HAGGLER_POSTCALL_MAX_ATTEMPTS", "2")
+    return runs
+
+
+async def _take_one(queue: PostCallQueue, r):
+    # One non-blocking read, as a worker's XREADGROUP would return it
+    reply = await r.xreadgroup(POSTCALL_GROUP, queue.consumer, {POSTCALL_STREAM: ">"}, count=1)
+    [(entry_id, fields)] = reply[0][1]
+    return entry_id, PostCallJob.from_json(fields[b"job"])
+
+
+def test_failed_job_is_retried_then_dead_lettered(failing_jobs):
+    async def scenario():
+        r = post_call.get_async_redis()
+        queue = PostCallQueue()
+        await queue.enqueue(PostCallJob("s1", {"mode": "refund"}, "user: hi", 12.0))
+
+        entry_id, job = await _take_one(queue, r)
+        assert not await queue._run(job)
+        await queue._retry_or_drop(job, r, entry_id)
+        # Parked until its not-before time; the stream entry is acknowledged and gone
+        assert await r.xlen(POSTCALL_STREAM) == 0
+        assert await r.zcard(POSTCALL_DELAYED_KEY) == 1
+        assert (await r.xpending(POSTCALL_STREAM, POSTCALL_GROUP))["pending"] == 0
+        assert await queue._promote_due(r) == 0
+
+        [member] = await r.zrange(POSTCALL_DELAYED_KEY, 0, -1)
+        await r.zadd(POSTCALL_DELAYED_KEY, {member: 0})
+        assert await queue._promote_due(r) == 1
+        assert await r.zcard(POSTCALL_DELAYED_KEY) == 0
+
+        entry_id, job = await _take_one(queue, r)
+        assert job.attempts == 1
+        assert not await queue._run(job)
+        await queue._retry_or_drop(job, r, entry_id)
+        assert await r.xlen(POSTCALL_STREAM) == 0
+        assert await r.zcard(POSTCALL_DELAYED_KEY) == 0
+        [(_, fields)] = await r.xrange(POSTCALL_DEAD_STREAM)
+        dead = PostCallJob.from_json(fields[b"job"])
+        assert dead.session_id == "s1" and dead.attempts == 2
+
+    asyncio.run(scenario())
+    assert failing_jobs == ["s1", "s1"]
+
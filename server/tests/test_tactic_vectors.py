@@ -0,0 +1,115 @@
+"""Similarity dedupe on merge and the incremental index sync (tactic_vectors.load_index)."""
+
+import pytest
+
+import tactic_vectors
+from redis_store import decode_list
+from tactic_vectors import (
+    add_tactics_with_dedupe,
+    dedupe_list_by_similarity,
+    dedupe_watermark_key,
+    load_index,
+    rewrites_key,
+)
+
+WINNING = "agent:winning_tactics"
+BASE = "agent:tactics"
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    """Tactics load_index asked vectors for, one list per call."""
+    calls = []
+    vectors_for = tactic_vectors._vectors_for
+
+    def spy(r, list_key, tactics):
+        calls.append(list(tactics))
+        return vectors_for(r, list_key, tactics)
+
+    monkeypatch.setattr(tactic_vectors, "_vectors_for", spy)
+    return calls
+
+
+def test_merge_skips_exact_and_near_duplicates(r):
+    refund = ["Ask for a refund.", "ask for a REFUND", "Ask for a refund."]
+    results = add_tactics_with_dedupe(r, WINNING, [*refund, "Cite the policy.", " "])
+    assert results == ["added", "duplicate", "duplicate", "added", "skip"]
+    assert add_tactics_with_dedupe(r, WINNING, ["Cite the policy!"]) == ["duplicate"]
+    assert decode_list(r.lrange(WINNING, 0, -1)) == ["Ask for a refund.", "Cite the policy."]
+    assert set(decode_list(r.hkeys(WINNING + tactic_vectors.VECS_SUFFIX))) == {
+        "Ask for a refund.",
+        "Cite the policy.",
+    }
+
+
+def test_merge_excludes_tactics_in_hand_seeded_lists(r):
+    # Seeded with redis-cli: no vectors cached for these yet
+    r.rpush(BASE, "Be polite.", "Ask for a supervisor.")
+    results = add_tactics_with_dedupe(
+        r, WINNING, ["Ask for a supervisor.", "Mention the delay."], exclude_keys=(BASE,)
+    )
+    assert results == ["duplicate", "added"]
+    assert decode_list(r.lrange(WINNING, 0, -1)) == ["Mention the delay."]
+
+
+def test_merge_reloads_after_a_concurrent_append(r):
+    load_index(r, WINNING)
+    # Another process appends a tactic this one hasn't synced
+    r.rpush(WINNING, "Stay calm.")
+    assert add_tactics_with_dedupe(r, WINNING, ["stay calm"]) == ["duplicate"]
+    assert r.llen(WINNING) == 1
+
+
+def test_load_index_adds_appends_incrementally(r, fetched):
+    r.rpush(WINNING, "t0", "t1", "t2")
+    index = load_index(r, WINNING)
+    assert fetched == [["t0", "t1", "t2"]]
+    r.rpush(WINNING, "t3", "t4")
+    index = load_index(r, WINNING)
+    assert fetched[-1] == ["t3", "t4"]
+    assert len(index) == 5 and index.list_len == 5 and index.tail == "t4"
+    load_index(r, WINNING)
+    assert len(fetched) == 2
+
+
+def test_load_index_reloads_after_a_rewrite(r, fetched):
+    r.rpush(WINNING, "t0", "t1", "t2")
+    load_index(r, WINNING)
+    # Same length, different content: only the rewrite counter tells
+    r.lset(WINNING, 0, "replaced")
+    r.incr(rewrites_key(WINNING))
+    index = load_index(r, WINNING)
+    assert fetched[-1] == ["replaced", "t1", "t2"]
+    assert "replaced" in index and "t0" not in index
+
+
+def test_load_index_reloads_when_the_tail_moves(r, fetched):
+    r.rpush(WINNING, "t0", "t1")
+    load_index(r, WINNING)
+    r.lpush(WINNING, "front")
+    index = load_index(r, WINNING)
+    assert fetched[-1] == ["front", "t0", "t1"]
+    assert "front" in index and index.list_len == 3
+
+
+def test_incremental_dedupe_removes_near_duplicates_past_the_watermark(r):
+    r.rpush(WINNING, "Ask for a refund.", "Cite the policy.")
+    assert dedupe_list_by_similarity(r, WINNING) == 0
+    assert int(r.get(dedupe_watermark_key(WINNING))) == 2
+    r.rpush(WINNING, "ask for a refund", "Mention the delay.")
+    assert dedupe_list_by_similarity(r, WINNING, incremental=True) == 1
+    assert decode_list(r.lrange(WINNING, 0, -1)) == [
+        "Ask for a refund.",
+        "Cite the policy.",
+        "Mention the delay.",
+    ]
+    index = load_index(r, WINNING)
+    assert "ask for a refund" not in index and index.list_len == 3
+
+
+def test_full_dedupe_keeps_the_first_of_each_cluster(r):
+    r.rpush(
+        WINNING, "Cite the policy.", "Ask for a refund.", "CITE THE POLICY", "Ask for a refund."
+    )
+    assert dedupe_list_by_similarity(r, WINNING) == 2
+    assert decode_list(r.lrange(WINNING, 0, -1)) == ["Cite the policy.", "Ask for a refund."]
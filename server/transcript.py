@@ -0,0 +1,295 @@
+"""Incremental call transcript built from the context aggregators' turn events.
+
+TranscriptRecorder appends one "role: text" line per finished turn as the user/assistant
+aggregators emit on_*_turn_stopped, so the transcript is never re-formatted from the whole
+context. At disconnect, finalize() returns immediately unless a turn is still in flight, in
+which case it waits for that turn's flush up to a short timeout
+(HAGGLER_TRANSCRIPT_FLUSH_TIMEOUT, default 1.5 s).
+
+Given a session id (and HAGGLER_TRANSCRIPT_STREAM not 0), turns are also streamed as they
+finish to an append-only per-session store: the Redis stream session:<id>:transcript, or a
+local segment file (HAGGLER_TRANSCRIPT_DIR/<id>.jsonl, default server/.spool/transcripts)
+without Redis or if a Redis write fails. Only a short tail stays in memory, and a post-call
+job can carry a reference instead of the text (read_transcript). The turns of a call whose
+process crashes stay in the store, but no post-call job is enqueued for them (the session's
+config died with the process, and a cut-off call is not a verdict): the Redis stream expires
+after SESSION_TRANSCRIPT_TTL, and prune_segments() deletes segment files as old as that.
+With HAGGLER_CONTEXT_MAX_MESSAGES set, the call's live LLMContext is trimmed to that many
+messages.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+from loguru import logger
+
+from redis_store import (
+    SESSION_TRANSCRIPT_TTL,
+    append_session_transcript,
+    delete_session_transcript,
+    read_session_transcript,
+)
+
+# Lines kept in memory while streaming (the rest is in the store)
+TAIL_LINES = 20
+PREVIEW_CHARS = 120
+# Upper bound on waiting for queued store writes at disconnect
+WRITE_DRAIN_TIMEOUT = 5.0
+DEFAULT_TRANSCRIPT_DIR = Path(__file__).resolve().parent / ".spool" / "transcripts"
+
+
+def format_messages(messages: list) -> str:
+    """Format LLMContext messages as "role: text" lines (system messages skipped)."""
+    lines = []
+    for m in messages:
+        role = m.get("role", "unknown")
+        if role == "system":
+            continue
+        content = m.get("content")
+        if content is None:
+            continue
+        if isinstance(content, list):
+            parts = []
+            for p in content:
+                if isinstance(p, dict) and "text" in p:
+                    parts.append(str(p["text"]).strip())
+                elif isinstance(p, dict) and "type" in p and p.get("type") == "text":
+                    parts.append(str(p.get("text", "")).strip())
+                elif isinstance(p, str):
+                    parts.append(p.strip())
+            content = " ".join(p for p in parts if p) or None
+        elif isinstance(content, str):
+            content = content.strip() or None
+        else:
+            content = str(content).strip() or None
+        if content:
+            lines.append(f"{role}: {content}")
+    return "\n".join(lines)
+
+
+def flush_timeout() -> float:
+    return float(os.getenv("HAGGLER_TRANSCRIPT_FLUSH_TIMEOUT", "1.5"))
+
+
+def stream_enabled() -> bool:
+    return os.getenv("HAGGLER_TRANSCRIPT_STREAM", "1") != "0"
+
+
+def max_context_messages() -> int:
+    return int(os.getenv("HAGGLER_CONTEXT_MAX_MESSAGES", "0"))
+
+
+def transcript_dir() -> Path:
+    return Path(os.getenv("HAGGLER_TRANSCRIPT_DIR") or DEFAULT_TRANSCRIPT_DIR)
+
+
+def _segment_path(session_id: str) -> Path:
+    return transcript_dir() / f"{session_id}.jsonl"
+
+
+def _append_segment(session_id: str, role: str, text: str) -> None:
+    path = _segment_path(session_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps({"role": role, "text": text}) + "\n")
+
+
+def _read_segment(session_id: str) -> list[tuple[str, str]]:
+    path = _segment_path(session_id)
+    if not path.exists():
+        return []
+    turns = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            row = json.loads(line)
+        except ValueError:
+            # A torn last line from a crash mid-write
+            continue
+        turns.append((row["role"], row["text"]))
+    return turns
+
+
+async def read_transcript(session_id: str) -> str:
+    """Streamed transcript for session_id: Redis stream turns, then any local segment turns."""
+    turns = await read_session_transcript(session_id)
+    turns += await asyncio.to_thread(_read_segment, session_id)
+    return "\n".join(f"{role}: {text}" for role, text in turns)
+
+
+async def delete_transcript(session_id: str) -> None:
+    """Drop the streamed transcript once the post-call job no longer needs it."""
+    await delete_session_transcript(session_id)
+    await asyncio.to_thread(_segment_path(session_id).unlink, missing_ok=True)
+
+
+def prune_segments(max_age: float = SESSION_TRANSCRIPT_TTL) -> int:
+    """Delete segment files untouched for max_age seconds (left by crashed calls); return count."""
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in transcript_dir().glob("*.jsonl"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+class TranscriptRecorder:
+    """Collects finished turns from an LLMContextAggregatorPair's turn events."""
+
+    def __init__(self, session_id: str | None = None):
+        # Streaming to the per-session store needs an id to key it by
+        self.session_id = session_id if session_id and stream_enabled() else None
+        self.lines: list[str] | deque[str] = deque(maxlen=TAIL_LINES) if self.session_id else []
+        self.turns = 0
+        self.chars = 0
+        self.head = ""
+        # True while every streamed turn has landed in the shared Redis stream
+        self.in_redis = True
+        self._unsaved: list[str] = []
+        self._writes: asyncio.Queue | None = None
+        self._writer: asyncio.Task | None = None
+        self._context = None
+        self._open: set[str] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def attach(self, user_aggregator, assistant_aggregator, context=None) -> None:
+        """Record turns from the aggregators.
+
+        context (the call's live LLMContext) is trimmed if HAGGLER_CONTEXT_MAX_MESSAGES is set.
+        """
+        self._context = context
+
+        @user_aggregator.event_handler("on_user_turn_started")
+        async def on_user_turn_started(aggregator, strategy):
+            self._turn_started("user")
+
+        @user_aggregator.event_handler("on_user_turn_stopped")
+        async def on_user_turn_stopped(aggregator, strategy, message):
+            self._turn_stopped("user", message.content)
+
+        @assistant_aggregator.event_handler("on_assistant_turn_started")
+        async def on_assistant_turn_started(aggregator):
+            self._turn_started("assistant")
+
+        @assistant_aggregator.event_handler("on_assistant_turn_stopped")
+        async def on_assistant_turn_stopped(aggregator, message):
+            self._turn_stopped("assistant", message.content)
+
+    def _turn_started(self, role: str) -> None:
+        self._open.add(role)
+        self._idle.clear()
+
+    def _turn_stopped(self, role: str, content: str) -> None:
+        self._open.discard(role)
+        text = (content or "").strip()
+        if text:
+            self.append(role, text)
+            self._trim_context()
+        if not self._open:
+            self._idle.set()
+
+    def append(self, role: str, text: str) -> None:
+        line = f"{role}: {text}"
+        self.lines.append(line)
+        self.chars += len(line) + (1 if self.turns else 0)
+        self.turns += 1
+        if len(self.head) < PREVIEW_CHARS:
+            self.head = (self.head + "\n" + line if self.head else line)[:PREVIEW_CHARS]
+        if self.session_id:
+            if self._writes is None:
+                self._writes = asyncio.Queue()
+                self._writer = asyncio.create_task(self._write_loop())
+            self._writes.put_nowait((role, text))
+
+    def _trim_context(self) -> None:
+        """Cut the live LLMContext (the one the pipeline sends) to the last N messages.
+
+        This changes what the LLM sees, not just what is recorded: older turns (except
+        system messages) are gone from the call's context, while the transcript keeps them.
+        """
+        limit = max_context_messages()
+        if self._context is None or limit <= 0:
+            return
+        messages = self._context.get_messages()
+        if len(messages) <= limit:
+            return
+        older, recent = messages[:-limit], messages[-limit:]
+        system = [m for m in older if isinstance(m, dict) and m.get("role") == "system"]
+        self._context.set_messages(system + recent)
+
+    async def _write_loop(self) -> None:
+        # One writer per call so turns reach the store in order without blocking the pipeline
+        while True:
+            role, text = await self._writes.get()
+            try:
+                await self._persist(role, text)
+            finally:
+                self._writes.task_done()
+
+    async def _persist(self, role: str, text: str) -> None:
+        if self.in_redis:
+            try:
+                if await append_session_transcript(self.session_id, role, text):
+                    return
+            except Exception as e:
+                logger.warning(
+                    f"Transcript stream write failed session_id={self.session_id} ({e}); "
+                    "continuing in a local segment file"
+                )
+            self.in_redis = False
+        try:
+            await asyncio.to_thread(_append_segment, self.session_id, role, text)
+        except Exception as e:
+            logger.warning(f"Transcript segment write failed session_id={self.session_id} ({e})")
+            self._unsaved.append(f"{role}: {text}")
+
+    def text(self) -> str:
+        """In-memory transcript (only the last TAIL_LINES lines when streaming)."""
+        return "\n".join(self.lines)
+
+    async def finalize(self, timeout: float | None = None) -> str:
+        """Wait (bounded) for any in-flight turn and queued store writes, then return text()."""
+        if not self._idle.is_set():
+            try:
+                wait = flush_timeout() if timeout is None else timeout
+                await asyncio.wait_for(self._idle.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        if self._writes is not None:
+            try:
+                await asyncio.wait_for(self._writes.join(), WRITE_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"Transcript writes still pending at disconnect session_id={self.session_id}"
+                )
+            self._writer.cancel()
+            # Turns that never reached the store go to the job inline (see handoff)
+            while not self._writes.empty():
+                role, text = self._writes.get_nowait()
+                self._unsaved.append(f"{role}: {text}")
+        return self.text()
+
+    async def handoff(self) -> tuple[str, bool]:
+        """(transcript, stored) for the post-call job after finalize().
+
+        stored=True means every turn is in the Redis stream and the job should read it from
+        there (read_transcript); otherwise the full text is returned inline.
+        """
+        if not self.session_id or not self.turns:
+            return self.text(), False
+        if self.in_redis and not self._unsaved:
+            return "", True
+        try:
+            stored = await read_transcript(self.session_id)
+        except Exception as e:
+            logger.warning(f"Reading streamed transcript failed session_id={self.session_id} ({e})")
+            stored = self.text()
+        return "\n".join(x for x in [stored, *self._unsaved] if x), False